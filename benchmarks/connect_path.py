@@ -0,0 +1,285 @@
+"""
+Connect path benchmark: handshakes per second, connect latency percentiles and relay throughput
+through chains of 1 to 5 stand-in proxies (see standins.py).
+
+Modes:
+    blocking     ProxiedSocket.perform_connection() and connect() on a blocking socket
+    nonblocking  the same driven by WantReadError/WantWriteError and a selector
+    asyncio      aio.open_proxied_connection()
+
+Results are printed (or written to --output) as JSON. Pass the file of an earlier run as
+--baseline to get the change of every measurement on stderr:
+
+    python benchmarks/connect_path.py --output before.json
+    git checkout feature
+    python benchmarks/connect_path.py --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import selectors
+import socket
+import struct
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from proxy_wrapper.aio import open_proxied_connection
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.exceptions import WantReadError, WantWriteError
+from proxy_wrapper.proxied_socket import ProxiedSocket
+
+from standins import PROXY_KINDS, StandIns
+
+MODES = ("blocking", "nonblocking", "asyncio")
+RECV_SIZE = 65536
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest rank percentile of an ordered list."""
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "handshakes_per_sec": round(len(ordered) / elapsed, 1),
+        "latency_ms": {name: round(percentile(ordered, fraction) * 1000, 3)
+                       for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+    }
+
+
+def _request(size: int) -> bytes:
+    return struct.pack("!Q", size)
+
+
+# Blocking and non-blocking ProxiedSocket
+
+def _wait(selector: selectors.BaseSelector, sock: socket.socket, events: int):
+    selector.modify(sock, events)
+    selector.select()
+
+
+def _drive(selector: selectors.BaseSelector, sock: ProxiedSocket, step: Callable[[], object]):
+    while True:
+        try:
+            return step()
+        except WantReadError:
+            _wait(selector, sock, selectors.EVENT_READ)
+        except WantWriteError:
+            _wait(selector, sock, selectors.EVENT_WRITE)
+
+
+def connect_socket(chain: ProxyChain, target: Tuple[str, int], blocking: bool) -> ProxiedSocket:
+    sock = ProxiedSocket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.add_chain(chain)
+    if blocking:
+        sock.perform_connection()
+        sock.connect(target)
+        return sock
+
+    sock.setblocking(False)
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        _drive(selector, sock, sock.perform_connection)
+        _drive(selector, sock, lambda: sock.connect(target))
+    return sock
+
+
+def download(sock: ProxiedSocket, size: int) -> int:
+    buffer = bytearray(RECV_SIZE)
+    received = 0
+    sock.sendall(_request(size))  # 8 bytes fit into the empty send buffer of a non-blocking socket too
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_READ)
+        while received < size:
+            try:
+                count = sock.recv_into(buffer)
+            except BlockingIOError:
+                selector.select()
+                continue
+            if not count:
+                raise ConnectionError("Source closed the connection")
+            received += count
+    return received
+
+
+def run_sockets(chain: ProxyChain, target: Tuple[str, int], blocking: bool, connections: int,
+                transfer: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        connect_socket(chain, target, blocking).close()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(connections):
+        begin = time.perf_counter()
+        sock = connect_socket(chain, target, blocking)
+        latencies.append(time.perf_counter() - begin)
+        sock.close()
+    result = summarize(latencies, time.perf_counter() - started)
+
+    if transfer:
+        sock = connect_socket(chain, target, blocking)
+        try:
+            begin = time.perf_counter()
+            download(sock, transfer)
+            result["throughput_mib_per_sec"] = round(transfer / 2 ** 20 / (time.perf_counter() - begin), 1)
+        finally:
+            sock.close()
+    return result
+
+
+# asyncio
+
+async def _close(writer: asyncio.StreamWriter):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+async def run_asyncio(chain: ProxyChain, target: Tuple[str, int], connections: int, transfer: int,
+                      warmup: int) -> dict:
+    for _ in range(warmup):
+        _, writer = await open_proxied_connection(target, chain)
+        await _close(writer)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(connections):
+        begin = time.perf_counter()
+        _, writer = await open_proxied_connection(target, chain)
+        latencies.append(time.perf_counter() - begin)
+        await _close(writer)
+    result = summarize(latencies, time.perf_counter() - started)
+
+    if transfer:
+        reader, writer = await open_proxied_connection(target, chain, limit=RECV_SIZE)
+        try:
+            begin = time.perf_counter()
+            writer.write(_request(transfer))
+            received = 0
+            while received < transfer:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    raise ConnectionError("Source closed the connection")
+                received += len(data)
+            result["throughput_mib_per_sec"] = round(transfer / 2 ** 20 / (time.perf_counter() - begin), 1)
+        finally:
+            await _close(writer)
+    return result
+
+
+def run(mode: str, chain: ProxyChain, target: Tuple[str, int], connections: int, transfer: int,
+        warmup: int) -> dict:
+    if mode == "asyncio":
+        return asyncio.run(run_asyncio(chain, target, connections, transfer, warmup))
+    return run_sockets(chain, target, mode == "blocking", connections, transfer, warmup)
+
+
+# Comparison
+
+def _key(result: dict) -> Tuple[str, str, int]:
+    return result["mode"], result["proxy"], result["depth"]
+
+
+def compare(baseline: dict, current: dict) -> List[dict]:
+    """Relative change of every measurement present in both runs, positive is better."""
+    before = {_key(result): result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        change = {"mode": result["mode"], "proxy": result["proxy"], "depth": result["depth"]}
+        for name, higher_is_better, get in (
+                ("handshakes_per_sec", True, lambda r: r.get("handshakes_per_sec")),
+                ("latency_p50", False, lambda r: r.get("latency_ms", {}).get("p50")),
+                ("latency_p99", False, lambda r: r.get("latency_ms", {}).get("p99")),
+                ("throughput_mib_per_sec", True, lambda r: r.get("throughput_mib_per_sec"))):
+            new_value, old_value = get(result), get(old)
+            if new_value and old_value:
+                ratio = new_value / old_value if higher_is_better else old_value / new_value
+                change[name] = round((ratio - 1) * 100, 1)
+        changes.append(change)
+    return changes
+
+
+def print_changes(changes: List[dict], file=sys.stderr):
+    columns = ("handshakes_per_sec", "latency_p50", "latency_p99", "throughput_mib_per_sec")
+    print(f"{'mode':<12}{'proxy':<13}{'depth':>5}" + "".join(f"{name:>24}" for name in columns), file=file)
+    for change in changes:
+        cells = "".join(f"{change[name]:>+23.1f}%" if name in change else f"{'-':>24}" for name in columns)
+        print(f"{change['mode']:<12}{change['proxy']:<13}{change['depth']:>5}{cells}", file=file)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _csv(choices):
+    def parse(value: str):
+        items = [item.strip() for item in value.split(",") if item.strip()]
+        unknown = set(items) - set(choices)
+        if unknown:
+            raise argparse.ArgumentTypeError(f"Unknown values {sorted(unknown)}, expected some of {choices}")
+        return items
+
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", type=_csv(MODES), default=list(MODES))
+    parser.add_argument("--proxies", type=_csv(PROXY_KINDS), default=list(PROXY_KINDS))
+    parser.add_argument("--depths", type=lambda value: [int(depth) for depth in value.split(",")],
+                        default=[1, 2, 3, 4, 5])
+    parser.add_argument("--connections", type=int, default=300, help="Handshakes per measurement")
+    parser.add_argument("--warmup", type=int, default=30, help="Handshakes before every measurement, not counted")
+    parser.add_argument("--transfer", type=int, default=32 * 2 ** 20,
+                        help="Bytes downloaded through the chain for throughput (0 - skip)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with StandIns() as standins:
+        for mode in args.modes:
+            for kind in args.proxies:
+                for depth in args.depths:
+                    chain = standins.chain(kind, depth)
+                    result = run(mode, chain, standins.source, args.connections, args.transfer, args.warmup)
+                    results.append({"mode": mode, "proxy": kind, "depth": depth, **result})
+                    print(f"{mode} {kind} depth={depth}: {result}", file=sys.stderr)
+
+    report: Dict[str, object] = {
+        "benchmark": "connect_path",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": round(time.time()),
+        "connections": args.connections,
+        "warmup": args.warmup,
+        "transfer": args.transfer,
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["changes"] = compare(json.load(f), report)
+        print_changes(report["changes"])
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
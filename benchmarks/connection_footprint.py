@@ -0,0 +1,91 @@
+"""
+Bytes of Python heap per ProxiedSocket.
+
+idle: socket with a shared two hop ProxyChain added, nothing sent yet.
+pending: socket which connected to the first hop and waits for its SOCKS5 greeting reply.
+The first hop is an in-process listener which never answers.
+
+    python benchmarks/connection_footprint.py --connections 10000
+"""
+import argparse
+import gc
+import json
+import select
+import socket
+import tracemalloc
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.exceptions import WantReadError, WantWriteError
+from proxy_wrapper.proxied_socket import ProxiedSocket
+
+
+def make_idle(chain: ProxyChain) -> ProxiedSocket:
+    sock = ProxiedSocket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    sock.add_chain(chain)
+    return sock
+
+
+def make_pending(chain: ProxyChain) -> ProxiedSocket:
+    sock = make_idle(chain)
+    while True:
+        try:
+            sock.perform_connection()
+        except WantWriteError:
+            poller = select.poll()  # select() is limited by FD_SETSIZE
+            poller.register(sock, select.POLLOUT)
+            poller.poll(1000)
+        except WantReadError:
+            return sock
+
+
+def measure(factory, chain: ProxyChain, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sockets = [factory(chain) for _ in range(count)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    for sock in sockets:
+        sock.close()
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=10_000)
+    args = parser.parse_args()
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(socket.SOMAXCONN)
+    host, port = listener.getsockname()
+    chain = ProxyChain([f"socks5://{host}:{port}", "http://127.0.0.1:3128"])
+
+    accepted = []
+    pending_count = min(args.connections, socket.SOMAXCONN)
+    idle = measure(make_idle, chain, args.connections)
+    listener.setblocking(False)
+    pending = measure(make_pending, chain, pending_count)
+    try:
+        while True:
+            accepted.append(listener.accept()[0])
+    except BlockingIOError:
+        pass
+
+    print(json.dumps({
+        "benchmark": "connection_footprint",
+        "idle_connections": args.connections,
+        "idle_bytes_per_connection": round(idle, 1),
+        "pending_connections": pending_count,
+        "pending_bytes_per_connection": round(pending, 1),
+    }, indent=2))
+
+    for sock in accepted:
+        sock.close()
+    listener.close()
+
+
+if __name__ == '__main__':
+    main()
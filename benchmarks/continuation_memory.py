@@ -0,0 +1,66 @@
+"""
+Memory of pending continuations under connection churn.
+
+Every cycle wraps one end of a socket pair into a non-blocking ProxiedSocket, starts reading an
+HTTP response before it arrives (a continuation is stored), sends the response, resumes the
+read and closes the socket. RSS is sampled along the way and should stay flat.
+
+    python benchmarks/continuation_memory.py --cycles 1000000
+"""
+import argparse
+import json
+import os
+import socket
+import time
+
+from proxy_wrapper.exceptions import WantReadError
+from proxy_wrapper.protocols.http.reader import read_http_response_continuable
+from proxy_wrapper.proxied_socket import ProxiedSocket
+
+RESPONSE = b"HTTP/1.1 200 Connection established\r\nContent-Length: 2\r\n\r\nok"
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def cycle():
+    left, right = socket.socketpair()
+    sock = ProxiedSocket.from_socket(left)
+    sock.setblocking(False)
+    try:
+        read_http_response_continuable(sock)
+    except WantReadError:
+        pass
+    right.sendall(RESPONSE)
+    response = read_http_response_continuable(sock)
+    assert response.body == b"ok"
+    sock.close()
+    right.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=10)
+    args = parser.parse_args()
+
+    step = max(1, args.cycles // args.samples)
+    samples = []
+    started = time.perf_counter()
+    for i in range(1, args.cycles + 1):
+        cycle()
+        if i % step == 0:
+            samples.append({"cycles": i, "rss": rss_bytes(), "seconds": round(time.perf_counter() - started, 3)})
+
+    print(json.dumps({
+        "benchmark": "continuation_memory",
+        "cycles": args.cycles,
+        "rss_growth": samples[-1]["rss"] - samples[0]["rss"] if samples else 0,
+        "samples": samples,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+In-process stand-ins for proxies and targets, used by the benchmarks.
+
+Every server runs on one asyncio loop in a daemon thread and listens on loopback:
+    socks5       SOCKS5 without authentication
+    socks5-auth  SOCKS5 with username/password (USERNAME:PASSWORD)
+    socks4       SOCKS4 and SOCKS4a, any userid
+    http         HTTP CONNECT
+    source       target which reads an 8 byte big endian size and sends that many bytes back
+
+Proxies may connect to each other, so a chain of any depth can be built from the same
+listeners. They share the process (and the GIL) with the client being measured, numbers are
+meant for comparison between commits on the same machine.
+
+Usage:
+    with StandIns() as standins:
+        chain = standins.chain("socks5", depth=3)
+        ...connect to standins.source through chain...
+"""
+import asyncio
+import contextvars
+import socket
+import struct
+import threading
+from typing import Dict, List, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+
+USERNAME = "bench"
+PASSWORD = "secret"
+PROXY_KINDS = ("socks5", "socks5-auth", "socks4", "http")
+
+_PIPE_SIZE = 65536
+_SOURCE_CHUNK = bytes(2 ** 20)
+
+# Writers of the connection being handled, aborted when the stand-ins stop
+_writers: contextvars.ContextVar[List[asyncio.StreamWriter]] = contextvars.ContextVar("writers")
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while data := await reader.read(_PIPE_SIZE):
+            writer.write(data)
+            await writer.drain()
+        if writer.can_write_eof():
+            writer.write_eof()
+    except (ConnectionError, OSError):
+        writer.transport.abort()
+
+
+async def _tunnel(host: str, port: int, reply: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    up_reader, up_writer = await asyncio.open_connection(host, port)
+    _writers.get().append(up_writer)
+    writer.write(reply)
+    try:
+        await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+    finally:
+        up_writer.close()
+
+
+async def _socks5(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, auth: bool):
+    _, nmethods = await reader.readexactly(2)
+    methods = await reader.readexactly(nmethods)
+    method = 0x02 if auth else 0x00
+    if method not in methods:
+        writer.write(b"\x05\xff")
+        return
+    writer.write(bytes((0x05, method)))
+    if auth:
+        _, size = await reader.readexactly(2)
+        username = await reader.readexactly(size)
+        password = await reader.readexactly((await reader.readexactly(1))[0])
+        ok = username == USERNAME.encode() and password == PASSWORD.encode()
+        writer.write(b"\x01\x00" if ok else b"\x01\x01")
+        if not ok:
+            return
+
+    _, command, _, atyp = await reader.readexactly(4)
+    if atyp == 0x01:
+        host = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+    elif atyp == 0x04:
+        host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+    else:
+        host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+    port, = struct.unpack("!H", await reader.readexactly(2))
+    await _tunnel(host, port, b"\x05\x00\x00\x01" + bytes(6), reader, writer)
+
+
+async def _socks4(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    _, command, port, ip = struct.unpack("!BBH4s", await reader.readexactly(8))
+    await reader.readuntil(b"\x00")  # userid
+    if ip[:3] == bytes(3) and ip[3]:
+        host = (await reader.readuntil(b"\x00"))[:-1].decode()
+    else:
+        host = socket.inet_ntop(socket.AF_INET, ip)
+    await _tunnel(host, port, b"\x00\x5a" + bytes(6), reader, writer)
+
+
+async def _http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    head = await reader.readuntil(b"\r\n\r\n")
+    method, target, _ = head.split(b"\r\n", 1)[0].decode("latin-1").split(" ", 2)
+    if method != "CONNECT":
+        writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n")
+        return
+    host, _, port = target.rpartition(":")
+    await _tunnel(host.strip("[]"), int(port), b"HTTP/1.1 200 Connection established\r\n\r\n", reader, writer)
+
+
+async def _source(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    while request := await reader.read(8):
+        request += await reader.readexactly(8 - len(request))
+        remaining, = struct.unpack("!Q", request)
+        while remaining:
+            size = min(remaining, len(_SOURCE_CHUNK))
+            writer.write(memoryview(_SOURCE_CHUNK)[:size])
+            await writer.drain()
+            remaining -= size
+
+
+_HANDLERS = {
+    "socks5": lambda r, w: _socks5(r, w, auth=False),
+    "socks5-auth": lambda r, w: _socks5(r, w, auth=True),
+    "socks4": _socks4,
+    "http": _http,
+    "source": _source,
+}
+
+
+class StandIns:
+    """Starts every stand-in server on entering, stops them on exit."""
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.host = host
+        self.addresses: Dict[str, Tuple[str, int]] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="standins", daemon=True)
+        self._servers = []
+        self._connections: Dict[asyncio.Task, List[asyncio.StreamWriter]] = {}  # Handler task: its writers
+
+    @property
+    def source(self) -> Tuple[str, int]:
+        return self.addresses["source"]
+
+    def chain(self, kind: str, depth: int) -> ProxyChain:
+        """Chain of depth hops, all of them the stand-in proxy of kind."""
+        host, port = self.addresses[kind]
+        credentials = f"{USERNAME}:{PASSWORD}@" if kind == "socks5-auth" else ""
+        scheme = kind if kind in ("http", "socks4") else "socks5"
+        return ProxyChain([f"{scheme}://{credentials}{host}:{port}"] * depth)
+
+    def __enter__(self) -> "StandIns":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _start(self):
+        for name, handler in _HANDLERS.items():
+            server = await asyncio.start_server(self._guarded(handler), self.host, 0, backlog=1024)
+            self._servers.append(server)
+            self.addresses[name] = server.sockets[0].getsockname()[:2]
+
+    async def _stop(self):
+        for server in self._servers:
+            server.close()
+        # Aborted connections make every handler finish, cancelled handlers would be reported by asyncio
+        for writers in self._connections.values():
+            for writer in writers:
+                writer.transport.abort()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+
+    def _guarded(self, handler):
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            task = asyncio.current_task()
+            self._connections[task] = [writer]
+            _writers.set(self._connections[task])
+            try:
+                await handler(reader, writer)
+            except (asyncio.IncompleteReadError, ConnectionError, OSError):
+                pass
+            finally:
+                writer.close()
+                del self._connections[task]
+
+        return handle
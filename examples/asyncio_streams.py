@@ -0,0 +1,18 @@
+import asyncio
+
+from proxy_wrapper.aio import open_proxied_connection
+
+
+async def main():
+    reader, writer = await open_proxied_connection(("httpbin.org", 80),
+                                                   "socks5://127.0.0.1:9050",
+                                                   "http://49.0.91.7:8080")
+    writer.write(b"GET /ip HTTP/1.1\r\nHost: httpbin.org\r\nConnection: close\r\n\r\n")
+    await writer.drain()
+    print(await reader.read())
+    writer.close()
+    await writer.wait_closed()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -61,17 +61,21 @@ async def main():
 
     ctx = ssl.create_default_context()
 
-    # proxied.connect(("54.209.95.91", 443))
-    #
-    ctx.check_hostname = False
-    ctx.verify_mode = ssl.CERT_NONE
-    as_sock = proxied.to_socket()
-    as_sock.setblocking(True)
-    print(as_sock)
-    as_sock = ctx.wrap_socket(as_sock, do_handshake_on_connect=False)
-    # proxied.connect(("54.209.95.91", 80))
-    as_sock.send(b"GET /ip HTTP/1.1\r\nHost: httpbin.org\r\n\r\n")
-    res = read_http_response(as_sock)
+    # TLS with the target runs through the tunnel without leaving non-blocking mode
+    connected = False
+    while not connected:
+        try:
+            proxied.start_tls(ctx, "httpbin.org")
+            print("TLS", proxied.tls_layers[-1].version())
+            connected = True
+        except WantReadError as e:
+            select.select([proxied], [], [])
+        except WantWriteError as e:
+            select.select([], [proxied], [])
+
+    proxied.setblocking(True)
+    proxied.sendall(b"GET /ip HTTP/1.1\r\nHost: httpbin.org\r\n\r\n")
+    res = read_http_response(proxied)
     print(res)
 
 
@@ -0,0 +1,68 @@
+"""
+python -m proxy_wrapper serve --listen 127.0.0.1:1080 --chain socks5://10.0.0.1:1080 --chain http://10.0.0.2:3128
+
+Add --workers N to use N processes, send SIGHUP to the parent for a graceful restart.
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.enums import DNSPolicy
+from proxy_wrapper.server import ProxyServer, parse_host_port
+from proxy_wrapper.workers import WorkerPool
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m proxy_wrapper")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run a local SOCKS5/HTTP CONNECT proxy which forwards through a chain")
+    serve.add_argument("--listen", type=parse_host_port, default=("127.0.0.1", 1080), metavar="HOST:PORT",
+                       help="Address to listen on (default 127.0.0.1:1080)")
+    serve.add_argument("--chain", action="append", required=True, metavar="URL",
+                       help="Proxy URL, repeat for every hop in order")
+    serve.add_argument("--dns-policy", choices=[policy.value for policy in DNSPolicy], default=DNSPolicy.REMOTE.value,
+                       help="Resolve target host names on the last proxy (remote) or here (local)")
+    serve.add_argument("--buffer-size", type=int, default=2 ** 16, help="Per direction buffer limit in bytes")
+    serve.add_argument("--connect-timeout", type=float, default=30.0, help="Seconds to build an upstream tunnel")
+    serve.add_argument("--workers", type=int, default=0,
+                       help="Fork this many worker processes sharing the port with SO_REUSEPORT (0 - single process)")
+    serve.add_argument("--grace", type=float, default=30.0,
+                       help="Seconds a stopping worker waits for its clients to finish")
+    serve.add_argument("--stats-interval", type=float, default=0,
+                       help="Print aggregated worker stats as JSON lines every this many seconds")
+    serve.add_argument("--log-level", default="WARNING")
+    return parser
+
+
+def serve(args: argparse.Namespace):
+    chain = ProxyChain(args.chain, dns_policy=DNSPolicy(args.dns_policy))
+    host, port = args.listen
+
+    def create_server() -> ProxyServer:
+        return ProxyServer(chain, limit=args.buffer_size, connect_timeout=args.connect_timeout)
+
+    if args.workers:
+        on_stats = (lambda stats: print(json.dumps(stats), flush=True)) if args.stats_interval else None
+        WorkerPool(create_server, host, port, workers=args.workers, grace=args.grace,
+                   stats_interval=args.stats_interval or 1.0, on_stats=on_stats).run()
+        return
+
+    server = create_server()
+    try:
+        asyncio.run(server.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    if args.command == "serve":
+        serve(args)
+
+
+if __name__ == '__main__':
+    main()
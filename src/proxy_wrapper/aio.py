@@ -0,0 +1,208 @@
+import asyncio
+import socket
+import ssl
+from abc import ABC
+from typing import Callable, List, Sequence, Tuple, TypeVar
+
+from proxy_wrapper.base import BaseProxiedSocket
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.enums import DNSPolicy, ProxyProtocol
+from proxy_wrapper.exceptions import WantReadError, WantWriteError, AllChainsFailed
+from proxy_wrapper.resolver import default_resolver, resolve_address_async
+from proxy_wrapper.tls import _ChannelProtocol
+from proxy_wrapper.utils import parse_proxy_string
+
+_T = TypeVar("_T")
+
+
+class AsyncMethods(BaseProxiedSocket, ABC):
+    """
+    Awaitable versions of perform_connection(), connect(), start_tls() and udp_associate().
+
+    They drive the non-blocking WantRead/WantWrite machinery on the running event loop,
+    so no thread is blocked while handshakes are in progress.
+    """
+
+    __slots__ = ()
+
+    async def perform_connection_async(self):
+        if not self.connecting_to_proxy and not self._hops and self._proxies:
+            host, port = self._proxies[0].address
+            await self.resolver.resolve_async(host, port, self.family)
+            # Leaves the next hops for SOCKS4 proxies in the resolver cache too
+            for proxy, next_proxy in zip(self._proxies, self._proxies[1:]):
+                if proxy.protocol is ProxyProtocol.SOCKS4:
+                    await resolve_address_async(next_proxy.address, socket.AF_INET, self.resolver)
+        return await self._run_on_loop(self.perform_connection)
+
+    async def connect_async(self, address: Tuple[str, int]):
+        if self._proxies and self._proxies[-1].protocol is ProxyProtocol.SOCKS4:
+            address = await resolve_address_async(address, socket.AF_INET, self.resolver)
+        elif self.dns_policy is DNSPolicy.LOCAL:
+            address = await resolve_address_async(address, resolver=self.resolver)
+        return await self._run_on_loop(lambda: self.connect(address))
+
+    async def start_tls_async(self, context: ssl.SSLContext | None = None, server_hostname: str | None = None):
+        return await self._run_on_loop(lambda: self.start_tls(context, server_hostname))
+
+    async def udp_associate_async(self, address: Tuple[str, int] = ("0.0.0.0", 0)) -> Tuple[str, int]:
+        return await self._run_on_loop(lambda: self.udp_associate(address))
+
+    async def _run_on_loop(self, step: Callable[[], _T]) -> _T:
+        loop = asyncio.get_running_loop()
+        if self.getblocking():
+            self.setblocking(False)
+
+        while True:
+            try:
+                return step()
+            except WantReadError as e:
+                await _wait_io(self.fileno(), loop.add_reader, loop.remove_reader, e.timeout)
+            except WantWriteError as e:
+                await _wait_io(self.fileno(), loop.add_writer, loop.remove_writer, e.timeout)
+
+
+async def _wait_io(fd: int, add: Callable, remove: Callable, timeout: float | None = None):
+    """Waits until fd is ready or timeout seconds pass."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+
+    def on_ready():
+        if not fut.done():
+            fut.set_result(None)
+
+    add(fd, on_ready)
+    timer = loop.call_later(timeout, on_ready) if timeout is not None else None
+    try:
+        await fut
+    finally:
+        remove(fd)
+        if timer is not None:
+            timer.cancel()
+
+
+async def _create_socket(proxy_url: str | ProxyChain) -> socket.socket:
+    proxy = proxy_url[0] if isinstance(proxy_url, ProxyChain) else parse_proxy_string(proxy_url)
+    host, port = proxy.address
+    # Leaves the address in the resolver cache, so connecting to the first hop does not block the loop
+    family, _ = (await default_resolver.resolve_async(host, port))[0]
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    return sock
+
+
+async def open_proxied_connection(target: Tuple[str, int], *proxy_urls: str | ProxyChain, limit: int = 2 ** 16,
+                                  sock: socket.socket | None = None, tls_context: ssl.SSLContext | None = None,
+                                  server_hostname: str | None = None
+                                  ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Connects to target through the chain of proxy_urls (or a ProxyChain) on the running loop
+    and returns a (StreamReader, StreamWriter) pair for the established tunnel.
+
+    With tls_context the streams carry TLS with the target (see ProxiedSocket.start_tls()),
+    server_hostname defaults to the target host.
+    A not connected socket to use for the first hop can be passed as sock.
+    """
+    if not proxy_urls:
+        raise ValueError("At least one proxy is required")
+
+    proxied = await _open_proxied_socket(target, proxy_urls, sock)
+
+    if tls_context is not None:
+        try:
+            await proxied.start_tls_async(tls_context, server_hostname)
+        except BaseException:
+            proxied.close()
+            raise
+    return await open_streams(proxied, limit=limit)
+
+
+async def _open_proxied_socket(target: Tuple[str, int], proxy_urls: Tuple[str | ProxyChain, ...],
+                               sock: socket.socket | None) -> BaseProxiedSocket:
+    from proxy_wrapper.wrapper import wrap_socket
+
+    if sock is None:
+        sock = await _create_socket(proxy_urls[0])
+    sock.setblocking(False)
+    proxied = wrap_socket(sock, *proxy_urls)
+
+    try:
+        await proxied.perform_connection_async()
+        await proxied.connect_async(target)
+    except BaseException:
+        proxied.close()
+        raise
+    return proxied
+
+
+async def connect_fastest_async(target: Tuple[str, int], chains: Sequence[ProxyChain], *, stagger: float = 0.25,
+                                limit: int = 2 ** 16) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    asyncio version of proxy_wrapper.race.connect_fastest(). Returns streams of the chain which
+    connected first, the other attempts are cancelled and their sockets closed.
+    """
+    if not chains:
+        raise ValueError("At least one chain is required")
+
+    errors: List[Tuple[ProxyChain, BaseException]] = []
+    failed = [asyncio.Event() for _ in chains]
+
+    async def attempt(index: int, chain: ProxyChain) -> BaseProxiedSocket:
+        if index:
+            try:
+                await asyncio.wait_for(failed[index - 1].wait(), stagger * index)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            return await _open_proxied_socket(target, (chain,), None)
+        except Exception as e:
+            errors.append((chain, e))
+            failed[index].set()
+            raise
+
+    tasks = {asyncio.ensure_future(attempt(i, chain)) for i, chain in enumerate(chains)}
+    try:
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            connected = [task.result() for task in done if not task.cancelled() and task.exception() is None]
+            if connected:
+                for loser in connected[1:]:
+                    loser.close()
+                return await open_streams(connected[0], limit=limit)
+        raise AllChainsFailed("All proxy chains failed to connect", errors)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def open_streams(proxied: BaseProxiedSocket, *, limit: int = 2 ** 16
+                       ) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    Hands a connected proxied socket over to asyncio streams.
+    Bytes already buffered by the socket are delivered by the reader first.
+    TLS sessions with HTTPS proxies and the target go on in the transport, see get_extra_info("tls_layers").
+    StreamWriter.start_tls() can add TLS with the target later.
+    The proxied socket is detached and must not be used afterwards.
+    """
+    loop = asyncio.get_running_loop()
+    channel = proxied._tls
+    leftover = bytes(proxied._pushback)
+    if channel is not None:
+        leftover += channel.read(channel.pending())
+    plain = socket.socket(proxied.family, proxied.type, proxied.proto, fileno=proxied.detach())
+    plain.setblocking(False)
+
+    reader = asyncio.StreamReader(limit=limit, loop=loop)
+    if leftover:
+        reader.feed_data(leftover)
+    protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+    if channel is None:
+        transport, _ = await loop.create_connection(lambda: protocol, sock=plain)
+    else:
+        _, wrapper = await loop.create_connection(lambda: _ChannelProtocol(channel, protocol), sock=plain)
+        transport = wrapper.transport
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return reader, writer
+
+
+__all__ = ("AsyncMethods", "open_proxied_connection", "open_streams", "connect_fastest_async")
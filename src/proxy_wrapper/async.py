@@ -1,7 +1,5 @@
-from abc import ABC
+# "async" is a reserved word, so this module can not be imported with a plain import statement.
+# Use proxy_wrapper.aio instead.
+from proxy_wrapper.aio import AsyncMethods, open_proxied_connection, open_streams, connect_fastest_async
 
-from proxy_wrapper.base import BaseProxiedSocket
-
-
-class AsyncMethods(BaseProxiedSocket, ABC):
-    pass
+__all__ = ("AsyncMethods", "open_proxied_connection", "open_streams", "connect_fastest_async")
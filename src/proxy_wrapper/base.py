@@ -1,12 +1,23 @@
+import errno
 import socket
+import ssl
+import time
 from abc import abstractmethod, ABC
-from collections import deque
-from queue import Queue
+from typing import Callable, Tuple
 
+from proxy_wrapper.chain import ProxyChain, CompiledHop
+from proxy_wrapper.enums import ConnectPhase, DNSPolicy
+from proxy_wrapper.exceptions import ProxyTimeoutError
+from proxy_wrapper.observers import ConnectEvent, Observer, default_observers, proxy_label
+from proxy_wrapper.protocols.base import AbstractProxyMachine
 from proxy_wrapper.proxy import Proxy
+from proxy_wrapper.resolver import Resolver, default_resolver
+from proxy_wrapper.timeouts import ConnectTimeouts
+from proxy_wrapper.tls import TLS_READ_SIZE, TLS_RECORD_SIZE, TLSChannel, default_session_cache
 
 
 class AbstractProxiedSocket(socket.socket):
+    __slots__ = ()
 
     @classmethod
     @abstractmethod
@@ -26,15 +37,67 @@ class AbstractProxiedSocket(socket.socket):
 
 
 class BaseProxiedSocket(AbstractProxiedSocket, ABC):
+    """
+    Per-connection state is kept small, there may be 100k+ of these sockets alive.
+    Proxies live in a tuple (shared with the ProxyChain when one is used) and the
+    progress is the number of connected hops.
+    """
+
+    __slots__ = ("_proxies", "_hops", "in_command_mode", "connecting_to_proxy", "connected_to_target",
+                 "_pushback", "_machine", "_next_machine", "_tcp_connecting_to", "chain", "resolver",
+                 "dns_policy", "_continuation", "_observers", "_timing", "_timeouts", "_deadline", "_tls",
+                 "tls_context", "target_address", "tls_to_target", "reconnects")
+
     def __init__(self, family=-1, type=-1, proto=-1, fileno=None):
         super().__init__(family, type, proto, fileno)
 
-        self.proxy_chain: deque[Proxy] = deque()
-        self.proxy_queue: Queue[Proxy] = Queue()
+        self._proxies: Tuple[Proxy, ...] = ()  # Every proxy of the socket, connected ones go first
+        self._hops: int = 0  # Number of connected proxies
         self.in_command_mode: bool = False  # call socket's connect() or send connect message
         self.connecting_to_proxy: bool = False
-        self.proxy_to_connect: Proxy | None = None
         self.connected_to_target: bool = False  # When user called .connect() then adding proxy will be disallowed
+        self._pushback: bytearray | bytes = b''  # Bytes read past a proxy reply, returned by the next recv()
+        self._machine: AbstractProxyMachine | None = None  # State machine of the last proxy in chain
+        self._next_machine: AbstractProxyMachine | None = None  # State machine of proxy_to_connect
+        self._tcp_connecting_to: tuple | None = None  # Resolved first hop address while connect() is in progress
+        self.chain: ProxyChain | None = None  # Precompiled chain, its hops go first
+        self.resolver: Resolver = default_resolver  # Resolves the first hop and targets with DNSPolicy.LOCAL
+        self.dns_policy: DNSPolicy = DNSPolicy.REMOTE
+        self._continuation: Callable | None = None  # Pending step of a @continuable call, see callbacks_handler
+        self._observers: Tuple[Observer, ...] | None = default_observers()  # None keeps phases untimed
+        self._timing: tuple | None = None  # (phase, hop, address, started) of the phase in progress
+        self._timeouts: ConnectTimeouts | None = None
+        self._deadline: float | None = None  # time.monotonic() when ConnectTimeouts.total expires
+        self._tls: TLSChannel | None = None  # TLS sessions with HTTPS proxies, all I/O goes through them
+        self.tls_context: ssl.SSLContext | None = None  # For HTTPS proxies, None is default_tls_context()
+        self.target_address: tuple | None = None  # As passed to connect()
+        self.tls_to_target: bool = False  # start_tls() was called, the last TLS layer is the target's
+        self.reconnects: int = 0  # Times the chain was connected again, see ProxiedSocket.perform_connection()
+
+    @property
+    def proxy_chain(self) -> Tuple[Proxy, ...]:
+        """Connected proxies"""
+        return self._proxies[:self._hops]
+
+    @property
+    def proxy_to_connect(self) -> Proxy | None:
+        return self._proxies[self._hops] if self.connecting_to_proxy else None
+
+    @property
+    def pending_proxies(self) -> Tuple[Proxy, ...]:
+        """Proxies which are not connected yet, including proxy_to_connect"""
+        return self._proxies[self._hops:]
+
+    def has_pending_proxies(self) -> bool:
+        return self._hops < len(self._proxies)
+
+    @property
+    def tls_layers(self) -> Tuple[ssl.SSLObject, ...]:
+        """
+        TLS sessions with HTTPS proxies, the outermost first, and the target's one after start_tls().
+        E.g. .session_reused tells if it was resumed.
+        """
+        return self._tls.layers if self._tls is not None else ()
 
     @classmethod
     def from_socket(cls, sock: socket.socket):
@@ -44,8 +107,12 @@ class BaseProxiedSocket(AbstractProxiedSocket, ABC):
         return instance
 
     def to_socket(self, *, force: bool = False) -> socket.socket:
-        if self.in_command_mode:
+        if self._tls is not None:
+            raise RuntimeError("Socket tunnels through TLS with a proxy, it can not be used as a plain socket.")
+        if not force and self.in_command_mode:
             raise RuntimeError("Socket is in command mode. Use force=True you know what you are doing.")
+        if not force and self._pushback:
+            raise RuntimeError("Socket has buffered data that would be lost. Read it first or use force=True.")
         s = socket.fromfd(self.fileno(), self.family, self.type, self.proto)
         s.setblocking(self.getblocking())
         return s
@@ -53,7 +120,200 @@ class BaseProxiedSocket(AbstractProxiedSocket, ABC):
     def add_proxy(self, proxy: Proxy):
         if self.connected_to_target:
             raise RuntimeError("Adding proxy to connected socket is not allowed.")
-        self.proxy_queue.put(proxy)
+        self._proxies += (proxy,)
+
+    def add_chain(self, chain: ProxyChain):
+        """
+        Adds all proxies of chain. Their static handshake bytes are taken from the chain.
+        If there are proxies already, the chain proxies are added as regular ones.
+        """
+        if self.chain is not None or self._proxies:
+            for proxy in chain:
+                self.add_proxy(proxy)
+            return
+        if self.connected_to_target:
+            raise RuntimeError("Adding proxy to connected socket is not allowed.")
+        self.chain = chain
+        self.dns_policy = chain.dns_policy
+        self._proxies = chain.proxies
+        if chain.timeouts is not None:
+            self._timeouts = chain.timeouts
+        if chain.tls_context is not None:
+            self.tls_context = chain.tls_context
+
+    def _compiled_hop(self, index: int) -> CompiledHop | None:
+        """Returns precompiled hop for index-th proxy of the socket if it comes from self.chain"""
+        if self.chain is not None and index < len(self.chain):
+            return self.chain.hops[index]
+        return None
+
+    def add_observer(self, observer: Observer):
+        """observer is called with a ConnectEvent for every finished phase of the connection."""
+        self._observers = (self._observers or ()) + (observer,)
+
+    def remove_observer(self, observer: Observer):
+        self._observers = tuple(o for o in self._observers or () if o is not observer) or None
+
+    def set_timeouts(self, timeouts: ConnectTimeouts | None):
+        """Limits for the connection steps not started yet, see ConnectTimeouts. None removes them."""
+        self._timeouts = timeouts
+
+    def _phase_started(self, phase: ConnectPhase, hop: int, address: Tuple[str, int] | None = None):
+        # A phase interrupted by WantReadError/WantWriteError goes on, it is not started again
+        if self._timing is not None or (self._observers is None and self._timeouts is None):
+            return
+        now = time.monotonic()
+        self._timing = (phase, hop, address, now)
+        if self._deadline is None and self._timeouts is not None and self._timeouts.total is not None:
+            self._deadline = now + self._timeouts.total
+
+    def _phase_finished(self, error: BaseException | None = None):
+        if self._timing is None:
+            return
+        phase, hop, address, started = self._timing
+        self._timing = None
+        if self._observers:
+            event = ConnectEvent(phase, self._proxies[hop], hop, address, time.monotonic() - started, error)
+            for observer in self._observers:
+                observer(event)
+
+    def _phase_deadline(self) -> float | None:
+        """time.monotonic() when the phase in progress times out, None if it has no limit."""
+        if self._timing is None or self._timeouts is None:
+            return None
+        limit = self._timeouts.for_phase(self._timing[0])
+        deadline = None if limit is None else self._timing[3] + limit
+        if self._deadline is not None and (deadline is None or self._deadline < deadline):
+            return self._deadline
+        return deadline
+
+    def _check_deadline(self) -> float | None:
+        """Raises ProxyTimeoutError if the phase in progress is late, else returns its deadline."""
+        deadline = self._phase_deadline()
+        if deadline is not None and time.monotonic() >= deadline:
+            raise self._timeout_error()
+        return deadline
+
+    def _timeout_error(self) -> ProxyTimeoutError:
+        phase, hop, _, started = self._timing
+        proxy = self._proxies[hop]
+        limit = self._timeouts.for_phase(phase)
+        if self._deadline is not None and (limit is None or self._deadline < started + limit):
+            return ProxyTimeoutError(f"Chain deadline of {self._timeouts.total}s expired during {phase.value} "
+                                     f"with {proxy_label(proxy)} (hop {hop})", proxy, hop, phase,
+                                     self._timeouts.total, total=True)
+        return ProxyTimeoutError(f"{proxy_label(proxy)} (hop {hop}) did not complete {phase.value} in {limit}s",
+                                 proxy, hop, phase, limit)
+
+    def close(self):
+        self._continuation = None  # Continuations refer to the socket, do not keep the cycle
+        if self._tls is not None and not self._closed:
+            self._remember_tls_sessions()  # TLS 1.3 tickets may arrive after the handshake
+        super().close()
 
     def does_user_called_connect(self):
         return not self.connecting_to_proxy
+
+    def unread(self, data: bytes):
+        """Pushes data back to the socket. It will be returned by the next .recv() calls before anything else."""
+        if self._pushback:
+            self._pushback[:0] = data
+        else:
+            self._pushback = bytearray(data)
+
+    def recv(self, bufsize: int, flags: int = 0) -> bytes:
+        if not self._pushback:
+            if self._tls is None:
+                return super().recv(bufsize, flags)
+            data = self._tls_recv(bufsize)
+            if flags & socket.MSG_PEEK:
+                self.unread(data)
+            return data
+
+        data = bytes(self._pushback[:bufsize])
+        if not flags & socket.MSG_PEEK:
+            del self._pushback[:bufsize]
+        return data
+
+    def recv_into(self, buffer, nbytes: int = 0, flags: int = 0) -> int:
+        if not self._pushback:
+            if self._tls is None:
+                return super().recv_into(buffer, nbytes, flags)
+            view = memoryview(buffer).cast("B")
+            data = self._tls_recv(nbytes or len(view))
+            view[:len(data)] = data
+            if flags & socket.MSG_PEEK:
+                self.unread(data)
+            return len(data)
+
+        view = memoryview(buffer).cast("B")
+        size = min(nbytes or len(view), len(self._pushback))
+        view[:size] = self._pushback[:size]
+        if not flags & socket.MSG_PEEK:
+            del self._pushback[:size]
+        return size
+
+    def send(self, data, flags: int = 0) -> int:
+        """
+        With TLS at most a record of data is encrypted per call, the count is returned even if the socket
+        took only a part of its records. The rest goes out first with the next send(), sendall() or recv(),
+        until then send() raises BlockingIOError. send(b'') only sends it.
+        """
+        if self._tls is None:
+            return super().send(data, flags)
+        if not self._tls_flush():
+            raise BlockingIOError(errno.EAGAIN, "TLS records to the proxy wait for the socket to be writeable")
+        view = memoryview(data).cast("B")[:TLS_RECORD_SIZE]
+        self._tls.encrypt(view)
+        self._tls_flush()
+        return len(view)
+
+    def sendall(self, data, flags: int = 0):
+        if self._tls is None:
+            return super().sendall(data, flags)
+        view = memoryview(data).cast("B")
+        while view:
+            view = view[self.send(view):]
+        if not self._tls_flush():
+            raise BlockingIOError(errno.EAGAIN, "TLS records to the proxy wait for the socket to be writeable")
+
+    def sendfile(self, file, offset: int = 0, count: int | None = None) -> int:
+        if self._tls is None:
+            return super().sendfile(file, offset, count)
+        return self._sendfile_use_send(file, offset, count)
+
+    def _tls_recv(self, size: int) -> bytes:
+        channel = self._tls
+        while size:
+            data = channel.read(size)
+            if data or channel.eof:
+                return data
+            self._tls_flush()  # Answers of the TLS layers themselves go out before waiting for more
+            wire = socket.socket.recv(self, TLS_READ_SIZE)
+            if not wire:
+                return b''
+            channel.feed(wire)
+        return b''
+
+    def _tls_flush(self) -> bool:
+        """Sends what the TLS layers have for the socket. Returns False if the socket can not take it all now."""
+        channel = self._tls
+        wire = channel.data_to_send()
+        if wire:
+            channel.outgoing += wire
+        if not channel.outgoing:
+            return True
+        if self.getblocking():
+            socket.socket.sendall(self, channel.outgoing)
+            channel.outgoing.clear()
+            return True
+        try:
+            sent = socket.socket.send(self, channel.outgoing)
+        except BlockingIOError:
+            return False
+        del channel.outgoing[:sent]
+        return not channel.outgoing
+
+    def _remember_tls_sessions(self):
+        for context, address, session in self._tls.sessions():
+            default_session_cache.put(context, address, session)
@@ -1,39 +1,44 @@
-import weakref
-from collections import deque
 from functools import wraps
-from typing import Dict, Callable
+from typing import Callable
 
 from proxy_wrapper.exceptions import WantReadError, WantWriteError, _UncompletedRecv, _UncompletedSend
 
 
-class CallbacksHandler:
-    def __init__(self):
-        self.callbacks: Dict[weakref.ref, deque] = {}
-
-    def __call__(self, func: Callable):
-        @wraps(func)
-        def inner(sock, *args, **kwargs):
-            sock_ref = weakref.ref(sock)
-
-            try:
-                if sock_ref in self.callbacks and self.callbacks[sock_ref]:
-                    callback = self.callbacks[sock_ref].popleft()
-                    return callback()
-
-                return func(sock, *args, **kwargs)
-            except (WantReadError, WantWriteError) as e:
-                self.callbacks.setdefault(sock_ref, deque()).append(e.callback)
-                raise
-            except _UncompletedRecv as e:
-                self.callbacks.setdefault(sock_ref, deque()).append(e.callback)
-                raise WantReadError(message=f"{func.__name__} called .recv() but io was not ready yet. Call callback ",
-                                    callback=e.callback)
-            except _UncompletedSend as e:
-                self.callbacks.setdefault(sock_ref, deque()).append(e.callback)
-                raise WantWriteError(message=f"{func.__name__} called .send() but io was not ready yet. Call callback ",
-                                     callback=e.callback)
-
-        return inner
-
-
-cb_handler = CallbacksHandler()
+def _store(sock, callback: Callable | None):
+    if hasattr(sock, "_continuation"):
+        sock._continuation = callback
+
+
+def continuable(func: Callable):
+    """
+    Makes a non-blocking function resumable through its socket.
+
+    When func cannot finish because I/O is not ready, its continuation is stored on the socket
+    and the next call resumes it instead of starting over. The continuation is dropped once it
+    completes, fails or the socket is closed.
+
+    Only sockets which have a _continuation slot (see BaseProxiedSocket) keep continuations.
+    For other sockets call .callback of the raised WantReadError or WantWriteError to resume.
+    """
+
+    @wraps(func)
+    def inner(sock, *args, **kwargs):
+        pending = getattr(sock, "_continuation", None)
+        try:
+            if pending is not None:
+                sock._continuation = None
+                return pending()
+            return func(sock, *args, **kwargs)
+        except (WantReadError, WantWriteError) as e:
+            _store(sock, e.callback)
+            raise
+        except _UncompletedRecv as e:
+            _store(sock, e.callback)
+            raise WantReadError(message=f"{func.__name__} called .recv() but io was not ready yet. Call callback ",
+                                callback=e.callback)
+        except _UncompletedSend as e:
+            _store(sock, e.callback)
+            raise WantWriteError(message=f"{func.__name__} called .send() but io was not ready yet. Call callback ",
+                                 callback=e.callback)
+
+    return inner
@@ -0,0 +1,133 @@
+import ssl
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Tuple
+
+from proxy_wrapper.enums import ProxyProtocol, DNSPolicy
+from proxy_wrapper.protocols.http.helper import proxy_auth_header, craft_connect_request
+from proxy_wrapper.protocols.socks4 import helper as socks4
+from proxy_wrapper.protocols.socks5.helper import craft_hello_message, craft_username_password_message, \
+    request_to_connect_to_remote_address
+from proxy_wrapper.proxy import Proxy
+from proxy_wrapper.resolver import is_ip_address
+from proxy_wrapper.timeouts import ConnectTimeouts
+from proxy_wrapper.utils import parse_proxy_string
+
+_SUPPORTED_PROTOCOLS = (ProxyProtocol.SOCKS5, ProxyProtocol.SOCKS4, ProxyProtocol.SOCKS4A, ProxyProtocol.HTTP,
+                        ProxyProtocol.HTTPS)
+
+
+@dataclass(frozen=True)
+class CompiledHop:
+    """Proxy of a chain with wire bytes which do not depend on the target."""
+    proxy: Proxy
+    hello: bytes | None = None  # SOCKS5 method selection
+    auth: bytes | None = None  # SOCKS5 username/password frame
+    auth_header: str | None = None  # HTTP Proxy-Authorization header line
+    connect_request: bytes | None = None  # Request to connect to the next hop, None for the last hop
+
+
+def compile_hop(proxy: Proxy, next_proxy: Proxy | None = None) -> CompiledHop:
+    if proxy.protocol not in _SUPPORTED_PROTOCOLS:
+        raise NotImplementedError(f"{proxy.protocol.value} proxies are not supported yet")
+    host, port = proxy.address
+    if not host or port is None:
+        raise ValueError(f"Proxy address must contain host and port, got {proxy.address}")
+
+    if proxy.protocol == ProxyProtocol.SOCKS5:
+        return CompiledHop(
+            proxy,
+            hello=craft_hello_message(proxy.credentials).to_bytes(),
+            auth=craft_username_password_message(*proxy.credentials).to_bytes() if proxy.credentials else None,
+            connect_request=request_to_connect_to_remote_address(next_proxy.address).to_bytes()
+            if next_proxy else None,
+        )
+
+    if proxy.protocol in (ProxyProtocol.SOCKS4, ProxyProtocol.SOCKS4A):
+        # A SOCKS4 request to a host name is compiled at connect time, when the name is resolved
+        compiled = next_proxy is not None and (proxy.protocol is ProxyProtocol.SOCKS4A
+                                               or is_ip_address(next_proxy.address[0]))
+        userid = proxy.credentials[0] if proxy.credentials else None
+        return CompiledHop(
+            proxy,
+            connect_request=socks4.request_to_connect_to_remote_address(next_proxy.address, userid).to_bytes()
+            if compiled else None,
+        )
+
+    auth_header = proxy_auth_header(*proxy.credentials) if proxy.credentials else ''
+    return CompiledHop(
+        proxy,
+        auth_header=auth_header,
+        connect_request=craft_connect_request(next_proxy.address, auth_header=auth_header) if next_proxy else None,
+    )
+
+
+class ProxyChain:
+    """
+    Immutable chain of proxies which is parsed and validated once.
+
+    Wire bytes which do not depend on the target (SOCKS5 hello and auth frames, HTTP auth headers,
+    requests to connect to the next hop) are encoded at creation. A chain can be shared by any number
+    of sockets and threads, pass it to wrap_socket() or ProxiedSocket.add_chain().
+
+    dns_policy tells how sockets using the chain pass target host names to the last proxy.
+    timeouts and tls_context (for HTTPS proxies) are applied to sockets using the chain, they are
+    not part of the chain identity.
+    """
+
+    __slots__ = ("_hops", "_proxies", "_hash", "dns_policy", "timeouts", "tls_context")
+
+    def __init__(self, proxies: Iterable[Proxy | str], dns_policy: DNSPolicy = DNSPolicy.REMOTE,
+                 timeouts: ConnectTimeouts | None = None, tls_context: ssl.SSLContext | None = None):
+        proxies = tuple(parse_proxy_string(p) if isinstance(p, str) else p for p in proxies)
+        if not proxies:
+            raise ValueError("Proxy chain must contain at least one proxy")
+
+        hops = tuple(compile_hop(proxy, proxies[i + 1] if i + 1 < len(proxies) else None)
+                     for i, proxy in enumerate(proxies))
+        object.__setattr__(self, "_hops", hops)
+        object.__setattr__(self, "_proxies", proxies)  # Shared by sockets using the chain
+        object.__setattr__(self, "dns_policy", DNSPolicy(dns_policy))
+        object.__setattr__(self, "timeouts", timeouts)
+        object.__setattr__(self, "tls_context", tls_context)
+        object.__setattr__(self, "_hash", hash((tuple(p.key for p in proxies), self.dns_policy)))
+
+    @classmethod
+    def from_urls(cls, *proxy_urls: str, dns_policy: DNSPolicy = DNSPolicy.REMOTE,
+                  timeouts: ConnectTimeouts | None = None,
+                  tls_context: ssl.SSLContext | None = None) -> "ProxyChain":
+        return cls(proxy_urls, dns_policy, timeouts, tls_context)
+
+    @property
+    def hops(self) -> Tuple[CompiledHop, ...]:
+        return self._hops
+
+    @property
+    def proxies(self) -> Tuple[Proxy, ...]:
+        return self._proxies
+
+    def __setattr__(self, key, value):
+        raise AttributeError("ProxyChain is immutable")
+
+    def __len__(self) -> int:
+        return len(self._hops)
+
+    def __iter__(self) -> Iterator[Proxy]:
+        return iter(self._proxies)
+
+    def __getitem__(self, index: int) -> Proxy:
+        return self._proxies[index]
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ProxyChain):
+            return NotImplemented
+        return self._hash == other._hash and self.dns_policy == other.dns_policy and \
+            [p.key for p in self] == [p.key for p in other]
+
+    def __repr__(self) -> str:
+        return f"ProxyChain({' -> '.join(f'{p.protocol.value}://{p.address[0]}:{p.address[1]}' for p in self)})"
+
+
+__all__ = ("ProxyChain", "CompiledHop", "compile_hop")
@@ -0,0 +1,368 @@
+import heapq
+import itertools
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Iterable, Iterator, List, Set, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.exceptions import WantReadError, WantWriteError
+from proxy_wrapper.proxied_socket import ProxiedSocket
+from proxy_wrapper.proxy_pool import ProxyPool
+from proxy_wrapper.resolver import BackgroundLookups, Resolver, default_resolver, ip_family
+from proxy_wrapper.tunnel_pool import TunnelPool, create_tunnel
+
+
+class _Connection:
+    __slots__ = ("source", "sock", "target", "timeout", "deadline", "step_deadline", "events", "done",
+                 "reconnects")
+
+    def __init__(self, source: ProxiedSocket | ProxyChain, target: Tuple[str, int] | None, timeout: float | None):
+        self.source = source
+        self.sock: ProxiedSocket | None = None
+        self.target = target
+        self.timeout = timeout
+        self.deadline: float | None = None
+        self.step_deadline: float | None = None  # Of the connection step waiting for I/O, see ConnectTimeouts
+        self.events = 0
+        self.done = False
+        self.reconnects = 0  # sock.reconnects when it was registered
+
+    def start(self):
+        """Sockets of chains are created by open() once the family of the first hop is known."""
+        if isinstance(self.source, ProxiedSocket):
+            self.sock = self.source
+            self.sock.setblocking(False)
+            self.reconnects = self.sock.reconnects
+        if self.timeout is not None:
+            self.deadline = time.monotonic() + self.timeout
+
+    def open(self, family: int, resolver: Resolver):
+        self.sock = ProxiedSocket(family, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.resolver = resolver
+        self.sock.add_chain(self.source)
+
+    def step(self):
+        """Moves the connection forward. Raises WantReadError or WantWriteError if I/O is not ready."""
+        self.sock.perform_connection()
+        if self.target is not None:
+            self.sock.connect(self.target)
+
+
+class ProxyConnector:
+    """
+    Drives many non-blocking proxied connections from one thread with selectors (epoll, kqueue...).
+
+    Add ProxiedSockets (with proxies added) or ProxyChains, then iterate the connector to get
+    sockets as they become connected to their targets, or to the last hop if target is None.
+    Sockets for chains are created only when their connection starts, so no more than
+    max_concurrency file descriptors are open at once for queued work.
+
+    A connection which fails or does not finish within its timeout is closed and appended
+    to failures as (source, target, exception). ConnectTimeouts of the chains and sockets apply
+    too, a connection which exceeds them fails with ProxyTimeoutError.
+
+    Host names of the first hops of chains are looked up with resolver (default_resolver)
+    on threads, the other connections go on meanwhile.
+
+    Usage:
+        connector = ProxyConnector(max_concurrency=2048, timeout=10)
+        for chain in chains:
+            connector.add(chain, ("example.com", 443))
+        for sock in connector:
+            ...
+    """
+
+    def __init__(self, *, max_concurrency: int = 1024, timeout: float | None = None, blocking: bool = False,
+                 resolver: Resolver | None = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be positive")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.blocking = blocking  # Blocking mode of returned sockets
+        self.resolver = resolver or default_resolver
+        self.failures: List[Tuple[ProxiedSocket | ProxyChain, Tuple[str, int] | None, BaseException]] = []
+
+        self._queued: Deque[_Connection] = deque()
+        self._active = 0
+        # (deadline, counter, connection, True for step deadlines of ConnectTimeouts)
+        self._deadlines: List[Tuple[float, int, _Connection, bool]] = []
+        self._counter = itertools.count()
+        self._selector = selectors.DefaultSelector()
+        self._lookups: BackgroundLookups | None = None  # Started by the first chain with a host name
+
+    def add(self, source: ProxiedSocket | ProxyChain, target: Tuple[str, int] | None = None,
+            timeout: float | None = None):
+        """Queues a connection. timeout overrides the connector timeout, it is counted from the connection start."""
+        self._queued.append(_Connection(source, target, self.timeout if timeout is None else timeout))
+
+    def pending(self) -> int:
+        return len(self._queued) + self._active
+
+    def close(self):
+        """Closes connections which are not finished yet."""
+        for key in list(self._selector.get_map().values()):
+            if key.data is not self._lookups:
+                key.data.sock.close()
+        self._stop_lookups()
+        for connection in self._queued:
+            if isinstance(connection.source, ProxiedSocket):
+                connection.source.close()
+        self._queued.clear()
+        self._active = 0
+        self._deadlines.clear()
+        self._selector.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self) -> Iterator[ProxiedSocket]:
+        connected: List[ProxiedSocket] = []
+        while self._queued or self._active:
+            while self._queued and self._active < self.max_concurrency:
+                self._start(self._queued.popleft(), connected)
+            yield from self._flush(connected)
+
+            if not self._active:
+                continue
+            for key, _ in self._selector.select(self._wait_time()):
+                if key.data is self._lookups:
+                    self._looked_up(connected)
+                else:
+                    self._advance(key.data, connected)
+            self._expire(connected)
+            yield from self._flush(connected)
+        self._stop_lookups()
+
+    def _flush(self, connected: List[ProxiedSocket]) -> Iterator[ProxiedSocket]:
+        while connected:
+            sock = connected.pop()
+            sock.setblocking(self.blocking)
+            yield sock
+
+    def _start(self, connection: _Connection, connected: List[ProxiedSocket]):
+        try:
+            connection.start()
+        except Exception as e:
+            if connection.sock is not None:
+                connection.sock.close()
+            self.failures.append((connection.source, connection.target, e))
+            return
+        self._active += 1
+        if connection.deadline is not None:
+            heapq.heappush(self._deadlines, (connection.deadline, next(self._counter), connection, False))
+        if connection.sock is not None:
+            self._advance(connection, connected)
+            return
+
+        host, port = connection.source[0].address
+        family = ip_family(host)
+        if family is not None:
+            self._open(connection, family, connected)
+            return
+        if self._lookups is None:
+            self._lookups = BackgroundLookups(self.resolver)
+            self._selector.register(self._lookups, selectors.EVENT_READ, self._lookups)
+        self._lookups.submit(connection, host, port)
+
+    def _stop_lookups(self):
+        if self._lookups is not None:
+            self._selector.unregister(self._lookups)
+            self._lookups.close()
+            self._lookups = None
+
+    def _looked_up(self, connected: List[ProxiedSocket]):
+        for connection, family in self._lookups.finished():
+            if connection.done:
+                continue  # Expired while its lookup was running
+            if family.exception() is not None:
+                self._fail(connection, family.exception())
+            else:
+                self._open(connection, family.result(), connected)
+
+    def _open(self, connection: _Connection, family: int, connected: List[ProxiedSocket]):
+        try:
+            connection.open(family, self.resolver)
+        except Exception as e:
+            self._fail(connection, e)
+            return
+        self._advance(connection, connected)
+
+    def _advance(self, connection: _Connection, connected: List[ProxiedSocket]):
+        try:
+            connection.step()
+        except WantReadError as e:
+            self._listen(connection, selectors.EVENT_READ, e.deadline)
+            return
+        except WantWriteError as e:
+            self._listen(connection, selectors.EVENT_WRITE, e.deadline)
+            return
+        except Exception as e:
+            self._fail(connection, e)
+            return
+        self._finish(connection)
+        connected.append(connection.sock)
+
+    def _fail(self, connection: _Connection, error: BaseException):
+        self._finish(connection)
+        if connection.sock is not None:
+            connection.sock.close()
+        self.failures.append((connection.source, connection.target, error))
+
+    def _listen(self, connection: _Connection, events: int, deadline: float | None):
+        if deadline is not None and deadline != connection.step_deadline:
+            heapq.heappush(self._deadlines, (deadline, next(self._counter), connection, True))
+        connection.step_deadline = deadline
+        if connection.reconnects != connection.sock.reconnects:  # A new connection behind the same descriptor
+            connection.reconnects = connection.sock.reconnects
+            if connection.events:
+                self._selector.unregister(connection.sock)
+                connection.events = 0
+        if connection.events == events:
+            return
+        if connection.events:
+            self._selector.modify(connection.sock, events, connection)
+        else:
+            self._selector.register(connection.sock, events, connection)
+        connection.events = events
+
+    def _finish(self, connection: _Connection):
+        if connection.events:
+            self._selector.unregister(connection.sock)
+            connection.events = 0
+        connection.done = True
+        self._active -= 1
+
+    def _wait_time(self) -> float | None:
+        while self._deadlines and self._deadlines[0][2].done:
+            heapq.heappop(self._deadlines)
+        if not self._deadlines:
+            return None
+        return max(0.0, self._deadlines[0][0] - time.monotonic())
+
+    def _expire(self, connected: List[ProxiedSocket]):
+        now = time.monotonic()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, connection, step = heapq.heappop(self._deadlines)
+            if connection.done or (step and deadline != connection.step_deadline):
+                continue
+            if step:
+                # The step is run again, the socket raises ProxyTimeoutError for it
+                self._advance(connection, connected)
+                continue
+            self._fail(connection, TimeoutError(
+                f"Connection to {connection.target} was not established within {connection.timeout} seconds"))
+
+
+class ConnectResult:
+    """Outcome of one target of connect_many(): sock is connected, or error tells why not."""
+
+    __slots__ = ("index", "target", "sock", "error", "elapsed")
+
+    def __init__(self, index: int, target: Tuple[str, int], sock: ProxiedSocket | None, error: Exception | None,
+                 elapsed: float):
+        self.index = index  # Position of target in the targets passed to connect_many()
+        self.target = target
+        self.sock = sock  # Blocking socket connected to target
+        self.error = error
+        self.elapsed = elapsed  # Seconds from the start of the connection until it was connected or failed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self) -> str:
+        return (f"ConnectResult(index={self.index}, target={self.target}, ok={self.ok}, "
+                f"elapsed={self.elapsed:.4f}, error={self.error!r})")
+
+
+def connect_many(targets: Iterable[Tuple[str, int]], source: ProxyChain | str | ProxyPool, *,
+                 max_workers: int = 64, timeout: float | None = None,
+                 tunnel_pool: TunnelPool | None = None) -> Iterator[ConnectResult]:
+    """
+    Connects blocking ProxiedSockets to every target on a thread pool and yields a ConnectResult
+    per target as the connections finish, not in the order of targets. Failed targets are
+    reported in their results, they do not stop the others.
+
+    source is a chain (or its URL) used for every target, or a ProxyPool which picks a proxy per
+    target. Chain tunnels are taken from tunnel_pool if one is passed. timeout limits every
+    blocking step of a connection, as in create_tunnel(). None means no limit, or the timeout
+    of tunnel_pool.
+
+    Tunnels wait for proxy round trips, not for CPU, so max_workers connections run at once.
+    Targets are taken lazily, a generator of them is fine. When the caller stops iterating,
+    sockets it did not get are closed.
+
+    Usage:
+        for result in connect_many(targets, chain, max_workers=128, timeout=10):
+            if result.ok:
+                ...use result.sock...
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be positive")
+    connect = _connect_function(source, timeout, tunnel_pool)
+    queued = enumerate(targets)
+    pending: Set[Future] = set()
+    finished: Deque[Future] = deque()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="connect-many")
+    try:
+        while True:
+            # Some connections are queued ahead, so workers do not wait for the caller between results
+            for index, target in itertools.islice(queued, 2 * max_workers - len(pending)):
+                pending.add(executor.submit(_connect_one, connect, index, target))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            finished.extend(done)
+            while finished:
+                yield finished.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in itertools.chain(finished, pending):
+            future.add_done_callback(_close_unclaimed)
+
+
+def _connect_function(source: ProxyChain | str | ProxyPool, timeout: float | None,
+                      tunnel_pool: TunnelPool | None) -> Callable[[Tuple[str, int]], ProxiedSocket]:
+    if isinstance(source, ProxyPool):
+        return lambda target: source.connect(target, timeout)
+    chain = ProxyChain.from_urls(source) if isinstance(source, str) else source
+    if tunnel_pool is not None:
+        return lambda target: tunnel_pool.connect(chain, target, timeout)
+
+    def connect(target: Tuple[str, int]) -> ProxiedSocket:
+        sock = create_tunnel(chain, timeout)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(target)
+            sock.settimeout(None)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    return connect
+
+
+def _connect_one(connect: Callable[[Tuple[str, int]], ProxiedSocket], index: int,
+                 target: Tuple[str, int]) -> ConnectResult:
+    started = time.perf_counter()
+    try:
+        sock = connect(target)
+    except Exception as e:
+        return ConnectResult(index, target, None, e, time.perf_counter() - started)
+    return ConnectResult(index, target, sock, None, time.perf_counter() - started)
+
+
+def _close_unclaimed(future: Future):
+    if not future.cancelled() and future.result().sock is not None:
+        future.result().sock.close()
+
+
+__all__ = ("ProxyConnector", "ConnectResult", "connect_many")
@@ -0,0 +1,226 @@
+import socket
+from typing import Dict, Iterable, List, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.proxied_socket import ProxiedSocket
+from proxy_wrapper.protocols.socks5.enums import ATYP
+from proxy_wrapper.protocols.socks5.helper import craft_udp_header, loads_udp_header
+from proxy_wrapper.resolver import resolve_address, resolve_address_async
+
+_MAX_HEADER = 4 + 1 + 255 + 2  # RSV, FRAG, ATYP, the longest domain name and the port
+_CACHE_SIZE = 1024  # Encoded headers and decoded addresses kept per socket
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+
+class ProxiedDatagramSocket(socket.socket):
+    """
+    UDP socket whose datagrams are relayed by a SOCKS5 proxy (UDP ASSOCIATE, RFC 1928).
+
+    sendto() and recvfrom() take and return the real peers, the SOCKS5 header is added and
+    stripped on the way. Headers are encoded once per destination and the addresses of received
+    headers are cached, so a datagram costs one sendmsg() or recv_into() and a dict lookup.
+    sendmany() and recvmany() move a batch of datagrams per call. send() and recv() are left
+    as they are and see the datagrams with headers.
+
+    Usage:
+        with ProxiedDatagramSocket.open(chain) as udp:
+            udp.sendto(query, ("1.1.1.1", 53))
+            answer, peer = udp.recvfrom(4096)
+
+    The association lives as long as the control connection (self.control), it is closed together
+    with this socket. Relayed datagrams come from the relay straight to this socket, so the relay
+    must be reachable from here, which is usually true only for single proxy chains.
+    Fragmented datagrams (FRAG != 0) are dropped, as RFC 1928 allows.
+    """
+
+    __slots__ = ("control", "relay", "_headers", "_addresses", "_buffer", "_view")
+
+    def __init__(self, family=socket.AF_INET, proto=0, fileno=None):
+        super().__init__(family, socket.SOCK_DGRAM, proto, fileno)
+        self.control: ProxiedSocket | None = None  # SOCKS5 connection which holds the association
+        self.relay: Tuple[str, int] | None = None  # Resolved address of the proxy's UDP relay
+        self._headers: Dict[tuple, bytes] = {}  # Destination to its encoded header
+        self._addresses: Dict[bytes, Tuple[str, int]] = {}  # Received header to its source address
+        self._buffer: bytearray | None = None  # Datagrams are received here, headers included
+        self._view: memoryview | None = None
+
+    @classmethod
+    def associate(cls, control: ProxiedSocket, address: Tuple[str, int] = ("0.0.0.0", 0)
+                  ) -> "ProxiedDatagramSocket":
+        """
+        Negotiates UDP ASSOCIATE over control, a ProxiedSocket with every proxy connected, and
+        returns the socket bound to its relay. In non-blocking mode WantReadError and WantWriteError
+        of control.udp_associate() are raised, call associate() again when control is ready.
+        """
+        relay = resolve_address(control.udp_associate(address), resolver=control.resolver)
+        return cls._relayed_by(control, relay)
+
+    @classmethod
+    async def associate_async(cls, control: ProxiedSocket, address: Tuple[str, int] = ("0.0.0.0", 0)
+                              ) -> "ProxiedDatagramSocket":
+        relay = await resolve_address_async(await control.udp_associate_async(address), resolver=control.resolver)
+        return cls._relayed_by(control, relay)
+
+    @classmethod
+    def open(cls, chain: ProxyChain | str, timeout: float | None = None) -> "ProxiedDatagramSocket":
+        """Connects the control connection through chain and associates, timeout limits every blocking step."""
+        from proxy_wrapper.tunnel_pool import create_tunnel
+
+        if isinstance(chain, str):
+            chain = ProxyChain.from_urls(chain)
+        control = create_tunnel(chain, timeout)
+        try:
+            control.settimeout(timeout)
+            udp = cls.associate(control)
+            control.settimeout(None)
+        except BaseException:
+            control.close()
+            raise
+        return udp
+
+    @classmethod
+    async def open_async(cls, chain: ProxyChain | str) -> "ProxiedDatagramSocket":
+        from proxy_wrapper.aio import _create_socket
+        from proxy_wrapper.wrapper import wrap_socket
+
+        control = wrap_socket(await _create_socket(chain), chain)
+        try:
+            await control.perform_connection_async()
+            udp = await cls.associate_async(control)
+        except BaseException:
+            control.close()
+            raise
+        udp.setblocking(False)
+        return udp
+
+    @classmethod
+    def _relayed_by(cls, control: ProxiedSocket, relay: Tuple[str, int]) -> "ProxiedDatagramSocket":
+        udp = cls(socket.AF_INET6 if ":" in relay[0] else socket.AF_INET)
+        try:
+            # Only the relay's datagrams are received and sending needs no address lookup
+            udp.connect(relay)
+        except BaseException:
+            udp.close()
+            raise
+        udp.control = control
+        udp.relay = relay
+        return udp
+
+    def close(self):
+        if self.control is not None:
+            self.control.close()
+        super().close()
+
+    def sendto(self, data, flags_or_address, address=None, /) -> int:
+        if address is None:
+            flags, address = 0, flags_or_address
+        else:
+            flags = flags_or_address
+        header = self._headers.get(address) or self._header(address)
+        return self.sendmsg((header, data), (), flags) - len(header)
+
+    def sendmany(self, datagrams: Iterable[Tuple[bytes, tuple]], flags: int = 0) -> int:
+        """
+        Sends (data, address) pairs and returns how many were sent. In non-blocking mode it stops
+        at the first datagram the kernel does not take, BlockingIOError is raised only if none was sent.
+        """
+        headers, sendmsg = self._headers, self.sendmsg
+        sent = 0
+        try:
+            for data, address in datagrams:
+                sendmsg((headers.get(address) or self._header(address), data), (), flags)
+                sent += 1
+        except BlockingIOError:
+            if not sent:
+                raise
+        return sent
+
+    def recvfrom(self, bufsize: int, flags: int = 0) -> Tuple[bytes, Tuple[str, int]]:
+        view = self._receive_view(bufsize)
+        while True:
+            size = self.recv_into(view, bufsize + _MAX_HEADER, flags)
+            datagram = self._unwrap(view, size)
+            if datagram is not None:
+                offset, address = datagram
+                return bytes(view[offset:min(size, offset + bufsize)]), address
+
+    def recvfrom_into(self, buffer, nbytes: int = 0, flags: int = 0) -> Tuple[int, Tuple[str, int]]:
+        target = memoryview(buffer).cast("B")
+        nbytes = nbytes or len(target)
+        view = self._receive_view(nbytes)
+        while True:
+            size = self.recv_into(view, nbytes + _MAX_HEADER, flags)
+            datagram = self._unwrap(view, size)
+            if datagram is not None:
+                offset, address = datagram
+                size = min(size - offset, nbytes)
+                target[:size] = view[offset:offset + size]
+                return size, address
+
+    def recvmany(self, max_datagrams: int = 64, bufsize: int = 65535, flags: int = 0
+                 ) -> List[Tuple[bytes, Tuple[str, int]]]:
+        """
+        Waits for a datagram like recvfrom(), then takes the ones already queued without waiting,
+        up to max_datagrams (data, address) pairs.
+        """
+        result = [self.recvfrom(bufsize, flags)]
+        if not _MSG_DONTWAIT:
+            return result
+
+        view, recv_into, unwrap = self._view, self.recv_into, self._unwrap
+        timeout = self.gettimeout()
+        if timeout:
+            self.setblocking(False)  # A socket with timeout waits for readiness even with MSG_DONTWAIT
+        try:
+            while len(result) < max_datagrams:
+                size = recv_into(view, bufsize + _MAX_HEADER, flags | _MSG_DONTWAIT)
+                datagram = unwrap(view, size)
+                if datagram is not None:
+                    offset, address = datagram
+                    result.append((bytes(view[offset:min(size, offset + bufsize)]), address))
+        except BlockingIOError:
+            pass
+        finally:
+            if timeout:
+                self.settimeout(timeout)
+        return result
+
+    def _header(self, address: tuple) -> bytes:
+        if len(self._headers) >= _CACHE_SIZE:
+            self._headers.clear()
+        header = self._headers[address] = craft_udp_header(address)
+        return header
+
+    def _receive_view(self, bufsize: int) -> memoryview:
+        if self._view is None or len(self._view) < bufsize + _MAX_HEADER:
+            self._buffer = bytearray(bufsize + _MAX_HEADER)
+            self._view = memoryview(self._buffer)
+        return self._view
+
+    def _unwrap(self, view: memoryview, size: int) -> Tuple[int, Tuple[str, int]] | None:
+        """Returns where the data starts and the source address, None for datagrams to drop."""
+        if size < 5 or view[2]:
+            return None
+        atyp = view[3]
+        if atyp == ATYP.IPV4:
+            offset = 10
+        elif atyp == ATYP.IPV6:
+            offset = 22
+        elif atyp == ATYP.DOMAIN_NAME:
+            offset = 7 + view[4]
+        else:
+            return None
+        if size < offset:
+            return None
+
+        header = bytes(view[:offset])
+        address = self._addresses.get(header)
+        if address is None:
+            if len(self._addresses) >= _CACHE_SIZE:
+                self._addresses.clear()
+            decoded = loads_udp_header(header)
+            address = self._addresses[header] = (decoded.dst_addr, decoded.dst_port)
+        return offset, address
+
+
+__all__ = ("ProxiedDatagramSocket",)
@@ -4,5 +4,25 @@ from enum import Enum
 class ProxyProtocol(str, Enum):
     HTTP = "http"
     HTTPS = "https"
-    SOCKS4 = "socks4"
+    SOCKS4 = "socks4"  # Target host names are resolved locally, the protocol carries IPv4 addresses only
+    SOCKS4A = "socks4a"  # SOCKS4 which sends host names to the proxy
     SOCKS5 = "socks5"
+
+
+class DNSPolicy(str, Enum):
+    REMOTE = "remote"  # Target host names are sent to the proxy as is
+    LOCAL = "local"  # Target host names are resolved locally, the proxy gets an IP address
+
+
+class ConnectPhase(str, Enum):
+    """Timed steps of building a tunnel, see proxy_wrapper.observers"""
+    TCP_CONNECT = "tcp_connect"  # TCP connection to the first proxy
+    SOCKS5_HELLO = "socks5_hello"  # Method selection
+    SOCKS5_AUTH = "socks5_auth"  # Username/password authentication
+    SOCKS5_CONNECT = "socks5_connect"  # SOCKS5 request to connect to the next proxy and its reply
+    TLS_HANDSHAKE = "tls_handshake"  # TLS handshake with an HTTPS proxy
+    SOCKS4_CONNECT = "socks4_connect"  # SOCKS4 request to connect to the next proxy and its reply
+    HTTP_CONNECT = "http_connect"  # CONNECT request to the next proxy and its status
+    TARGET_CONNECT = "target_connect"  # Request of the last proxy to connect to the target
+    TARGET_TLS = "target_tls"  # TLS handshake with the target, see ProxiedSocket.start_tls()
+    SOCKS5_UDP_ASSOCIATE = "socks5_udp_associate"  # Request of the last proxy to relay datagrams
@@ -1,3 +1,4 @@
+import time
 from typing import Callable
 
 
@@ -9,16 +10,34 @@ class CannotWrapSocket(ProxyWrapperException):
     pass
 
 
-class WantWriteError(ProxyWrapperException):
-    def __init__(self, message: str = "", callback: Callable = None):
+class ProxyConnectionClosed(ProxyWrapperException, ConnectionError):
+    pass
+
+
+class AllChainsFailed(ProxyWrapperException, ConnectionError):
+    def __init__(self, message: str, errors: list):
         super().__init__(message)
-        self.callback = callback
+        self.errors = errors  # (chain, exception) pairs in order of failure
 
 
-class WantReadError(ProxyWrapperException):
+class _WantIOError(ProxyWrapperException):
     def __init__(self, message: str = "", callback: Callable = None):
         super().__init__(message)
         self.callback = callback
+        self.deadline: float | None = None  # time.monotonic() when the connection step times out
+
+    @property
+    def timeout(self) -> float | None:
+        """Seconds to wait for I/O at most. Call callback once they pass, it raises ProxyTimeoutError."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+
+class WantWriteError(_WantIOError):
+    pass
+
+
+class WantReadError(_WantIOError):
+    pass
 
 
 class _UncompletedRecv(ProxyWrapperException):
@@ -33,3 +52,19 @@ class _UncompletedSend(ProxyWrapperException):
         self.callback = callback
         self.message = message
         super().__init__(message)
+
+
+class ProxyTimeoutError(ProxyWrapperException, TimeoutError):
+    """
+    A phase of building a tunnel (see ConnectTimeouts) did not finish in time.
+    proxy and hop tell the stalled proxy, timeout is the limit which expired.
+    """
+
+    def __init__(self, message: str, proxy=None, hop: int | None = None, phase=None, timeout: float | None = None,
+                 total: bool = False):
+        super().__init__(message)
+        self.proxy = proxy
+        self.hop = hop
+        self.phase = phase  # ConnectPhase
+        self.timeout = timeout
+        self.total = total  # The whole chain deadline expired, not the phase limit
@@ -0,0 +1,139 @@
+import bisect
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from proxy_wrapper.enums import ConnectPhase
+from proxy_wrapper.proxy import Proxy
+
+# Upper bounds of latency histogram buckets in seconds, +Inf is implied
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectEvent:
+    """
+    A finished phase of building a tunnel.
+
+    proxy is the proxy the phase talked to, hop is its index in the socket's proxies.
+    address is what was connected to: the resolved first hop for TCP_CONNECT, the next proxy
+    or the target for requests, None for handshakes.
+    """
+    phase: ConnectPhase
+    proxy: Proxy
+    hop: int
+    address: Tuple[str, int] | None
+    duration: float  # Seconds, including time spent waiting for I/O in non-blocking mode
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+Observer = Callable[[ConnectEvent], None]
+
+_default_observers: Tuple[Observer, ...] = ()
+
+
+def add_default_observer(observer: Observer):
+    """observer gets the events of every proxied socket created afterwards."""
+    global _default_observers
+    _default_observers += (observer,)
+
+
+def remove_default_observer(observer: Observer):
+    global _default_observers
+    _default_observers = tuple(o for o in _default_observers if o is not observer)
+
+
+def default_observers() -> Tuple[Observer, ...] | None:
+    return _default_observers or None
+
+
+def proxy_label(proxy: Proxy) -> str:
+    """protocol://host:port of proxy, credentials are never included."""
+    host, port = proxy.address
+    if ":" in host:
+        host = f"[{host}]"
+    return f"{proxy.protocol.value}://{host}:{port}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * (buckets + 1)  # The last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class ConnectMetrics:
+    """
+    Observer which keeps latency histograms per proxy, phase and outcome (ok or error).
+    Thread safe, one instance can observe any number of sockets.
+
+    Usage:
+        metrics = ConnectMetrics()
+        add_default_observer(metrics)  # or sock.add_observer(metrics)
+        ...
+        print(metrics.to_prometheus())
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, *, namespace: str = "proxy_wrapper"):
+        self.buckets = tuple(sorted(buckets))
+        self.namespace = namespace
+        self._histograms: Dict[Tuple[str, ConnectPhase, bool], _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ConnectEvent):
+        key = (proxy_label(event.proxy), event.phase, event.ok)
+        index = bisect.bisect_left(self.buckets, event.duration)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets))
+            histogram.counts[index] += 1
+            histogram.total += event.duration
+            histogram.count += 1
+
+    def snapshot(self) -> List[dict]:
+        """Histograms as dicts with cumulative bucket counts, like Prometheus exposes them."""
+        with self._lock:
+            items = [(key, list(h.counts), h.total, h.count) for key, h in self._histograms.items()]
+
+        result = []
+        for (proxy, phase, ok), counts, total, count in sorted(items, key=lambda item: item[0]):
+            cumulative, running = [], 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                running += bucket_count
+                cumulative.append((bound, running))
+            result.append({"proxy": proxy, "phase": phase.value, "outcome": "ok" if ok else "error",
+                           "buckets": cumulative, "sum": total, "count": count})
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        name = f"{self.namespace}_connect_phase_seconds"
+        lines = [f"# HELP {name} Duration of proxy connection phases.", f"# TYPE {name} histogram"]
+        for histogram in self.snapshot():
+            labels = (f'proxy="{_escape(histogram["proxy"])}",phase="{histogram["phase"]}",'
+                      f'outcome="{histogram["outcome"]}"')
+            for bound, count in histogram["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram['sum']!r}")
+            lines.append(f"{name}_count{{{labels}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+__all__ = ("ConnectEvent", "ConnectMetrics", "Observer", "DEFAULT_BUCKETS", "add_default_observer",
+           "remove_default_observer", "default_observers", "proxy_label")
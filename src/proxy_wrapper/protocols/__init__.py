@@ -1,17 +1,40 @@
 from abc import ABC
+from typing import TYPE_CHECKING
 
+from proxy_wrapper.enums import ProxyProtocol
+from proxy_wrapper.protocols.base import AbstractProxyMachine, ProxyState
 from proxy_wrapper.protocols.http import HTTPProxyProtocol
+from proxy_wrapper.protocols.socks4 import Socks4ProxyProtocol
 from proxy_wrapper.protocols.socks5 import Socks5ProxyProtocol
+from proxy_wrapper.proxy import Proxy
+
+if TYPE_CHECKING:
+    from proxy_wrapper.chain import CompiledHop
 
 
 class ImplementsProxyProtocolsMixin(
-    Socks5ProxyProtocol, HTTPProxyProtocol, ABC
+    Socks5ProxyProtocol, Socks4ProxyProtocol, HTTPProxyProtocol, ABC
 ):
-    pass
+    __slots__ = ()
+
+    def machine_for(self, proxy: Proxy, hop: "CompiledHop | None" = None) -> AbstractProxyMachine:
+        if proxy.protocol == ProxyProtocol.SOCKS5:
+            pipelining = proxy.pipelining and proxy.address not in self.pipelining_rejected
+            if hop is not None:
+                return self.socks5_machine(proxy.credentials, pipelining, hop.hello, hop.auth)
+            return self.socks5_machine(proxy.credentials, pipelining)
+        if proxy.protocol in (ProxyProtocol.SOCKS4, ProxyProtocol.SOCKS4A):
+            return self.socks4_machine(proxy.credentials[0] if proxy.credentials else None)
+        if proxy.protocol in (ProxyProtocol.HTTP, ProxyProtocol.HTTPS):
+            return self.http_machine(proxy.credentials, hop.auth_header if hop is not None else None)
+        raise NotImplementedError(f"{proxy.protocol.value} proxies are not supported yet")
 
 
 __all__ = [
     'ImplementsProxyProtocolsMixin',
     'HTTPProxyProtocol',
-    'Socks5ProxyProtocol'
+    'Socks5ProxyProtocol',
+    'Socks4ProxyProtocol',
+    'AbstractProxyMachine',
+    'ProxyState',
 ]
@@ -1,14 +1,174 @@
+import socket
+import threading
 from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Tuple
+
+from proxy_wrapper.exceptions import WantReadError, WantWriteError, ProxyConnectionClosed
+
+RECV_SIZE = 4096
+_MSG_WAITALL = getattr(socket, "MSG_WAITALL", 0)
+
+_buffers = threading.local()  # Replies are received into a buffer per thread, not per socket
+
+
+class ProxyState(int, Enum):
+    FAILED = -1
+    GREETING = 0
+    AUTHENTICATING = 1
+    READY = 2  # Handshake is done, waiting for an address to connect to
+    REQUESTING = 3
+    CONNECTED = 4
+
+
+class AbstractProxyMachine(ABC):
+    """
+    Sans-IO state machine of a single proxy hop.
+
+    It never touches a socket. Bytes from the proxy are passed to .feed(), bytes for the proxy
+    are taken from .data_to_send(). The machine starts with the handshake and stops in READY state.
+    After .connect() it asks the proxy to connect to an address and stops in CONNECTED state.
+    Protocol errors are raised from .feed().
+    """
+
+    __slots__ = ("_state", "_incoming", "_outgoing", "address")
+
+    def __init__(self, state: ProxyState = ProxyState.READY):
+        self._state = state
+        self._incoming = bytearray()
+        self._outgoing = bytearray()
+        self.address: Tuple[str, int] | None = None
+
+    @property
+    def state(self) -> ProxyState:
+        return self._state
+
+    def data_to_send(self) -> bytes:
+        data = bytes(self._outgoing)
+        self._outgoing.clear()
+        return data
+
+    def requeue(self, data: bytes):
+        """Puts back bytes which could not be sent. They will be returned first by the next .data_to_send()."""
+        self._outgoing[:0] = data
+
+    def feed(self, data: bytes):
+        self._incoming += data
+        self._process()
+
+    def bytes_needed(self) -> int:
+        """
+        Exact number of bytes which the reply in progress still needs to move forward, 0 if it is
+        not known. Reading just that many never consumes bytes which follow the reply.
+        """
+        return 0
+
+    def unused_data(self) -> bytes:
+        """Returns bytes received past the last reply, e.g. the first bytes from the target."""
+        data = bytes(self._incoming)
+        self._incoming.clear()
+        return data
+
+    def connect(self, address: Tuple[str, int], request: bytes | None = None):
+        """request is the already encoded request to connect to address, e.g. from ProxyChain."""
+        if self._state is not ProxyState.READY:
+            raise RuntimeError(f"Can not connect in {self._state.name} state")
+        self.address = address
+        self._outgoing += request or self._craft_connect_request(address)
+        self._state = ProxyState.REQUESTING
+
+    def _fail(self, error: Exception):
+        self._state = ProxyState.FAILED
+        raise error
+
+    @abstractmethod
+    def _craft_connect_request(self, address: Tuple[str, int]) -> bytes: ...
+
+    @abstractmethod
+    def _process(self): ...
 
 
 class AbstractProxyProtocol(ABC):
     """Anything that can .recv() and .send() can be using for proxying."""
 
+    __slots__ = ()
+
     @abstractmethod
     def recv(self, n: int) -> bytes: ...
 
+    @abstractmethod
+    def recv_into(self, buffer, nbytes: int = 0, flags: int = 0) -> int: ...
+
     @abstractmethod
     def send(self, data: bytes) -> int: ...
 
+    @abstractmethod
+    def sendall(self, data: bytes) -> None: ...
+
     @abstractmethod
     def getblocking(self) -> bool: ...
+
+    def drive_machine(self, machine: AbstractProxyMachine, until: ProxyState, exact: bool = False):
+        """
+        Exchanges data between self and machine until machine reaches until state.
+
+        In non-blocking mode raises WantReadError or WantWriteError when I/O is not ready.
+        All progress is kept in the machine, so it is safe to call it again when I/O is ready.
+
+        With exact=True a blocking socket reads replies of known length (machine.bytes_needed())
+        with MSG_WAITALL, so bytes sent right after the reply, e.g. by the target, stay in the kernel.
+        Otherwise up to RECV_SIZE bytes are read at once.
+        """
+        if machine.state is ProxyState.FAILED:
+            raise RuntimeError("Proxy state machine has failed")
+
+        while machine.state < until:
+            data = machine.data_to_send()
+            if data:
+                self._before_io(reading=False)
+                self._send_machine_data(machine, data)
+                continue
+
+            self._before_io(reading=True)
+            try:
+                chunk = self._recv_machine_data(machine, exact)
+            except BlockingIOError:
+                raise WantReadError("Waiting for proxy reply")
+            if not chunk:
+                raise ProxyConnectionClosed("Proxy connection closed while waiting for reply")
+            state = machine.state
+            machine.feed(chunk)
+            if machine.state is not state:
+                self._on_machine_state(machine, state)
+
+    def _before_io(self, reading: bool):
+        """Called before every send and receive of drive_machine(), e.g. to enforce deadlines."""
+
+    def _on_machine_state(self, machine: AbstractProxyMachine, previous: ProxyState):
+        """Called when a reply moved machine out of previous state."""
+
+    def _recv_machine_data(self, machine: AbstractProxyMachine, exact: bool) -> memoryview:
+        """Receives into the thread's buffer, the returned view is valid until the next call."""
+        view = getattr(_buffers, "view", None)
+        if view is None:
+            view = _buffers.view = memoryview(bytearray(RECV_SIZE))
+        needed = machine.bytes_needed() if exact and self.getblocking() else 0
+        if 0 < needed <= RECV_SIZE:
+            return view[:self.recv_into(view, needed, _MSG_WAITALL)]
+        return view[:self.recv_into(view, RECV_SIZE)]
+
+    def _send_machine_data(self, machine: AbstractProxyMachine, data: bytes):
+        if self.getblocking():
+            self.sendall(data)
+            return
+
+        try:
+            sent = self.send(data)
+        except BlockingIOError:
+            sent = 0
+        if sent < len(data):
+            machine.requeue(data[sent:])
+            raise WantWriteError("Waiting to send data to proxy")
+
+
+__all__ = ("RECV_SIZE", "ProxyState", "AbstractProxyMachine", "AbstractProxyProtocol")
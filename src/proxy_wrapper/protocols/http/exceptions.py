@@ -0,0 +1,18 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from proxy_wrapper.protocols.http.reader import HTTPResponse
+
+
+class HTTPProxyError(Exception):
+    pass
+
+
+class HTTPProxyConnectionError(HTTPProxyError, ConnectionError):
+    def __init__(self, message: str, response: "HTTPResponse | None" = None):
+        super().__init__(message)
+        self.response = response
+
+
+class HTTPBodyTooLarge(HTTPProxyError, ValueError):
+    pass
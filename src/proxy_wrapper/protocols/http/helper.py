@@ -7,10 +7,13 @@ def proxy_auth_header(username: str, password: str) -> str:
 
 
 def craft_connect_request(address: Tuple[str, int], credentials: Tuple[str, str] | None = None,
-                          http_version: str = "HTTP/1.1"):
+                          http_version: str = "HTTP/1.1", auth_header: str | None = None):
+    """auth_header is a prebuilt proxy_auth_header() line, credentials are ignored if it is passed."""
+    if auth_header is None:
+        auth_header = proxy_auth_header(*credentials) if credentials else ''
     return (
             f'CONNECT {address[0]}:{address[1]} {http_version}\r\n'
             + f"Host: {address[0]}:{address[1]}\r\n"
-            + (f'{proxy_auth_header(*credentials)}' if credentials else '')
+            + auth_header
             + '\r\n'
     ).encode()
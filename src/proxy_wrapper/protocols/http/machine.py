@@ -0,0 +1,37 @@
+from typing import Tuple
+
+from proxy_wrapper.protocols.base import AbstractProxyMachine, ProxyState
+from proxy_wrapper.protocols.http.exceptions import HTTPProxyConnectionError
+from proxy_wrapper.protocols.http.helper import craft_connect_request
+from proxy_wrapper.protocols.http.reader import HTTPResponseParser, HTTPResponse
+
+
+class HTTPConnectMachine(AbstractProxyMachine):
+    __slots__ = ("credentials", "auth_header", "response", "_parser")
+
+    def __init__(self, credentials: Tuple[str, str] | None = None, auth_header: str | None = None):
+        super().__init__(ProxyState.READY)
+        self.credentials = credentials
+        self.auth_header = auth_header
+        self.response: HTTPResponse | None = None
+        self._parser = HTTPResponseParser()
+
+    def _craft_connect_request(self, address: Tuple[str, int]) -> bytes:
+        return craft_connect_request(address, self.credentials, auth_header=self.auth_header)
+
+    def _process(self):
+        if self._state is not ProxyState.REQUESTING:
+            return
+
+        complete = self._parser.feed(self._incoming)
+        self._incoming.clear()
+        if not complete:
+            return
+
+        self.response = self._parser.parse()
+        self._incoming += self._parser.take_leftover()
+        if not 200 <= self.response.status_code < 300:
+            self._fail(HTTPProxyConnectionError(
+                f"HTTP proxy connection to {self.address} failed. "
+                f"Reason: {self.response.status_code} {self.response.status_phrase}", self.response))
+        self._state = ProxyState.CONNECTED
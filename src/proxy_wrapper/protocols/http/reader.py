@@ -3,10 +3,17 @@ import json
 import socket
 from dataclasses import dataclass
 from functools import partial
-from typing import Callable, Dict, Any
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Tuple, TypeVar
 
-from proxy_wrapper.callbacks_handler import cb_handler
-from proxy_wrapper.exceptions import _UncompletedRecv
+from proxy_wrapper.callbacks_handler import continuable
+from proxy_wrapper.exceptions import WantReadError, _UncompletedRecv
+from proxy_wrapper.protocols.http.exceptions import HTTPBodyTooLarge
+
+HEAD_TERMINATOR = b'\r\n\r\n'
+RECV_CHUNK_SIZE = 65536
+MAX_HEAD_SIZE = 65536
+
+_T = TypeVar("_T")
 
 
 @dataclass
@@ -22,139 +29,421 @@ class HTTPResponse:
 
 
 async def read_http_response_async(sock: socket.socket):
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     fut = loop.create_future()
-
-    def handle_done(response: HTTPResponse):
-        if not fut.done():
-            fut.set_result(response)
+    step = partial(read_http_response, sock)
 
     def continue_reading():
-        nonlocal loop
         loop.remove_reader(sock.fileno())
         _continue_reading()
 
     def _continue_reading():
+        nonlocal step
         try:
-            read_http_response_continuable(sock, handle_done)
-        except _UncompletedRecv:
+            response = step()
+        except _UncompletedRecv as e:
+            step = e.callback
             loop.add_reader(sock.fileno(), continue_reading)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(response)
 
     _continue_reading()
     return await fut
 
 
-@cb_handler
+@continuable
 def read_http_response_continuable(sock: socket.socket,
                                    non_blocking_callback: Callable[[
                                        HTTPResponse], Any] | None = None) -> HTTPResponse | None:
     return read_http_response(sock, non_blocking_callback)
 
 
-def read_http_response(sock: socket.socket,
-                       non_blocking_callback: Callable[[HTTPResponse], Any] | None = None) -> HTTPResponse | None:
+class HTTPResponseParser:
     """
-    Returns HTTPResponse in blocking mode else calls non_blocking_callback and passes HTTPResponse as first
-    argument
+    Incrementally collects an HTTP response head in a reusable buffer.
+
+    The buffer is scanned for the blank line only from where the previous scan stopped,
+    so feeding a reply in many small pieces stays linear.
     """
-    status_line = b''
-    headers = b''
-    headers_dict: Dict[str, str] = {}
-    http_version = ''
-    status_code = -1
-    status_phrase = ''
-    body = b''
-    bytes_read = 0
-
-    def read_status_line():
-        nonlocal status_line
-
-        while not status_line.endswith(b'\r\n'):
-            try:
-                byte_ = sock.recv(1)
-                if not byte_:
-                    raise ConnectionError("Server closed connection")
-                status_line += byte_
-            except BlockingIOError:
-                raise _UncompletedRecv(message="Reading status line does not completed.", callback=read_status_line)
-        return read_headers()
 
-    def read_headers():
-        nonlocal headers
+    __slots__ = ("max_head_size", "_buffer", "_scan_from", "_head_end")
 
-        while not headers.endswith(b'\r\n\r\n'):
-            try:
-                byte_ = sock.recv(1)
-                if not byte_:
-                    raise ConnectionError("Server closed connection")
-                headers += byte_
-                if headers == b'\r\n':
-                    break
-            except BlockingIOError:
-                raise _UncompletedRecv(message="Reading headers does not completed.", callback=read_headers)
+    def __init__(self, max_head_size: int = MAX_HEAD_SIZE):
+        self.max_head_size = max_head_size
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._head_end = -1
 
-        return parse()
+    @property
+    def head_complete(self) -> bool:
+        return self._head_end != -1
 
-    def parse():
-        nonlocal status_line, headers, headers_dict, status_code, status_phrase, http_version
+    def bytes_to_head_end(self, data: bytes) -> int:
+        """
+        Returns how many bytes of data are needed to complete the head or -1 if data does not complete it.
+        """
+        tail = bytes(self._buffer[max(0, len(self._buffer) - 3):])
+        index = (tail + data).find(HEAD_TERMINATOR)
+        if index == -1:
+            return -1
+        return index + len(HEAD_TERMINATOR) - len(tail)
+
+    def feed(self, data: bytes) -> bool:
+        """
+        Appends data to the buffer. Returns True when the whole head has been received.
+        """
+        self._buffer += data
+        if self._head_end != -1:
+            return True
 
-        status_line = status_line.removesuffix(b'\r\n').decode('utf-8')
-        headers = headers.decode('utf-8')
+        index = self._buffer.find(HEAD_TERMINATOR, self._scan_from)
+        if index == -1:
+            if len(self._buffer) > self.max_head_size:
+                raise ValueError(f"HTTP response head exceeds {self.max_head_size} bytes")
+            self._scan_from = max(0, len(self._buffer) - len(HEAD_TERMINATOR) + 1)
+            return False
 
-        http_version, status_code, *status_phrase = status_line.split(" ")
-        status_code = int(status_code)
-        status_phrase = " ".join(status_phrase)
+        self._head_end = index + len(HEAD_TERMINATOR)
+        return True
 
-        for line in headers.split('\r\n'):
+    def parse(self) -> HTTPResponse:
+        """Parses the received head. Body is left empty."""
+        if self._head_end == -1:
+            raise RuntimeError("HTTP response head is not complete")
+
+        status_line, *header_lines = bytes(self._buffer[:self._head_end - len(HEAD_TERMINATOR)]) \
+            .decode('utf-8').split('\r\n')
+
+        http_version, status_code, *status_phrase = status_line.split(" ")
+        headers: Dict[str, str] = {}
+        for line in header_lines:
             if not line or ": " not in line:
                 continue
             key, value = line.split(": ", 1)
-            headers_dict[key.lower()] = value
+            headers[key.lower()] = value
 
-        is_chunked = headers_dict.get("transfer-encoding", "").lower() == "chunked"
-        content_length = int(headers_dict.get("content-length", 0))
+        return HTTPResponse(http_version, int(status_code), " ".join(status_phrase), headers, b'')
 
-        if is_chunked or content_length:
-            return read_body(content_length, is_chunked)
-        else:
-            return call_callback_or_return()
+    def take_leftover(self) -> bytes:
+        """Returns bytes received past the end of the head and resets the parser for reuse."""
+        leftover = bytes(self._buffer[self._head_end:]) if self._head_end != -1 else b''
+        self.reset()
+        return leftover
 
-    def call_callback_or_return():
-        nonlocal http_version, status_code, status_phrase, headers_dict, body
-        nonlocal non_blocking_callback
-        res = HTTPResponse(http_version, status_code, status_phrase, headers_dict, body)
-        if not sock.getblocking() and non_blocking_callback:
-            return non_blocking_callback(res)
-        return res
+    def reset(self):
+        del self._buffer[:]
+        self._scan_from = 0
+        self._head_end = -1
 
-    def read_body(length: int | None, is_chunked: bool = False):
-        if length and is_chunked:
+
+def _can_unread(sock: socket.socket) -> bool:
+    return callable(getattr(sock, "unread", None))
+
+
+def _recv_head_chunk(sock: socket.socket, parser: HTTPResponseParser) -> bytes:
+    """
+    Receives the next chunk of a response head.
+
+    Sockets that can take bytes back are read in large chunks. Others are peeked first so that
+    nothing past the head is consumed, or read byte by byte when peeking is not supported (SSL).
+    """
+    if _can_unread(sock):
+        return sock.recv(RECV_CHUNK_SIZE)
+
+    try:
+        peeked = sock.recv(RECV_CHUNK_SIZE, socket.MSG_PEEK)
+    except ValueError:
+        return sock.recv(1)
+    if not peeked:
+        return peeked
+    needed = parser.bytes_to_head_end(peeked)
+    return sock.recv(len(peeked) if needed == -1 else needed)
+
+
+_NO_BODY_STATUSES = (204, 304)
+MAX_LINE_SIZE = 4096
+
+# HTTPBodyDecoder states
+_LENGTH, _CHUNK_SIZE, _CHUNK_DATA, _CHUNK_END, _TRAILERS, _DONE = range(6)
+
+
+class HTTPBodyDecoder:
+    """
+    Incrementally decodes a response body framed by Content-Length or chunked transfer encoding.
+
+    next_piece() takes raw bytes and returns body bytes as a slice of them, nothing is copied.
+    Bytes past the end of the body are never consumed. Raises HTTPBodyTooLarge as soon as the
+    announced or received size exceeds max_size.
+    """
+
+    __slots__ = ("max_size", "received", "_state", "_remaining", "_line")
+
+    def __init__(self, response: HTTPResponse, max_size: int | None = None):
+        self.max_size = max_size
+        self.received = 0
+        self._remaining = 0
+        self._line = bytearray()
+
+        is_chunked = response.headers.get("transfer-encoding", "").lower().endswith("chunked")
+        content_length = response.headers.get("content-length")
+        if content_length and is_chunked:
             raise ValueError("Cannot read body with both content-length and transfer-encoding")
-        if length:
-            return read_content_length(length)
-        if is_chunked:
-            return read_chunked()
 
-    def read_chunked():
+        if 100 <= response.status_code < 200 or response.status_code in _NO_BODY_STATUSES:
+            self._state = _DONE
+        elif is_chunked:
+            self._state = _CHUNK_SIZE
+        else:
+            self._remaining = int(content_length or 0)
+            self._check_size(self._remaining)
+            self._state = _LENGTH if self._remaining else _DONE
+
+    @property
+    def done(self) -> bool:
+        return self._state == _DONE
+
+    def bytes_wanted(self) -> int:
+        """How many bytes can be received without reading past the body."""
+        if self._state == _LENGTH:
+            return self._remaining
+        if self._state == _CHUNK_DATA:
+            return self._remaining + 2  # Chunk data is always followed by CRLF
+        return 0 if self._state == _DONE else 1
+
+    def next_piece(self, data: memoryview, limit: int) -> Tuple[memoryview, int]:
         """
-        Will implement later
+        Returns (body, consumed): at most limit body bytes found in data and how many bytes of data
+        were used. body is empty when data holds framing only or is exhausted.
         """
-        raise NotImplementedError("Chunked transfer encoding is not implemented yet")
+        consumed = 0
+        while consumed < len(data) and self._state != _DONE:
+            if self._state in (_LENGTH, _CHUNK_DATA):
+                size = min(self._remaining, limit, len(data) - consumed)
+                if not size:
+                    break
+                piece = data[consumed:consumed + size]
+                consumed += size
+                self._remaining -= size
+                self.received += size
+                if not self._remaining:
+                    self._state = _DONE if self._state == _LENGTH else _CHUNK_END
+                return piece, consumed
+
+            window = data[consumed:consumed + MAX_LINE_SIZE - len(self._line)].tobytes()
+            end = window.find(b"\n")
+            if end == -1:
+                if len(self._line) + len(window) >= MAX_LINE_SIZE:
+                    raise ValueError(f"Chunked body framing line exceeds {MAX_LINE_SIZE} bytes")
+                self._line += window
+                consumed += len(window)
+                continue
+            line = bytes(self._line) + window[:end]
+            self._line.clear()
+            consumed += end + 1
+            self._on_line(line.rstrip(b"\r"))
+        return data[consumed:consumed], consumed
+
+    def _on_line(self, line: bytes):
+        if self._state == _CHUNK_SIZE:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+            if size:
+                self._check_size(self.received + size)
+                self._remaining = size
+                self._state = _CHUNK_DATA
+            else:
+                self._state = _TRAILERS
+        elif self._state == _CHUNK_END:
+            if line:
+                raise ValueError("Chunk data is not followed by CRLF")
+            self._state = _CHUNK_SIZE
+        elif not line:  # Trailers are skipped till the blank line
+            self._state = _DONE
+
+    def _check_size(self, size: int):
+        if self.max_size is not None and size > self.max_size:
+            raise HTTPBodyTooLarge(f"HTTP response body exceeds {self.max_size} bytes")
+
+
+class HTTPResponseReader:
+    """
+    Reads a response head, then streams its body through a reusable buffer.
+
+    Works with blocking sockets, with non-blocking ones (read_head() and readinto() raise
+    WantReadError when no data is ready, call them again once the socket is readable) and on
+    asyncio (read_head_async(), readinto_async(), async for).
+    Bytes received past the end of the response are pushed back to sockets which support
+    .unread(). Other sockets are never read past the end.
+
+    Usage:
+        reader = HTTPResponseReader(sock, max_body_size=2 ** 20)
+        response = reader.read_head()
+        for chunk in reader:
+            ...
+    """
 
-    def read_content_length(length):
-        nonlocal bytes_read, body
-        while bytes_read < length:
-            chunk_size = min(4096, length - bytes_read)
+    __slots__ = ("sock", "max_body_size", "response", "_parser", "_decoder", "_buffer", "_view", "_input",
+                 "_body", "_finished")
+
+    def __init__(self, sock: socket.socket, *, max_body_size: int | None = None, buffer_size: int = RECV_CHUNK_SIZE):
+        if buffer_size < 2:
+            raise ValueError("buffer_size must be at least 2")
+        self.sock = sock
+        self.max_body_size = max_body_size
+        self.response: HTTPResponse | None = None
+        self._parser = HTTPResponseParser()
+        self._decoder: HTTPBodyDecoder | None = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._input = memoryview(b'')  # Received bytes not decoded yet
+        self._body: bytearray | None = None  # Body collected by read() so far
+        self._finished = False
+
+    @property
+    def done(self) -> bool:
+        return self._finished
+
+    def read_head(self) -> HTTPResponse:
+        if self.response is not None:
+            return self.response
+
+        while not self._parser.head_complete:
             try:
-                chunk = sock.recv(chunk_size)
-                if not chunk:
-                    raise ConnectionError("Server closed connection")
-                body += chunk
-                bytes_read += len(chunk)
+                chunk = _recv_head_chunk(self.sock, self._parser)
             except BlockingIOError:
-                raise _UncompletedRecv(message="Reding body does not completed.",
-                                       callback=partial(read_content_length, length))
+                raise WantReadError("Reading response head. Socket must be readable", callback=self.read_head)
+            if not chunk:
+                raise ConnectionError("Server closed connection")
+            self._parser.feed(chunk)
+
+        response = self._parser.parse()
+        self._input = memoryview(self._parser.take_leftover())
+        self._decoder = HTTPBodyDecoder(response, self.max_body_size)
+        self.response = response
+        self._finish_if_done()
+        return response
+
+    def readinto(self, buffer) -> int:
+        """
+        Decodes body bytes into buffer and returns their number, 0 at the end of the body.
+        Blocks (or raises WantReadError) only when nothing could be decoded yet.
+        """
+        self.read_head()
+        out = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(out) and not self._decoder.done:
+            if not self._input:
+                if written:
+                    break
+                try:
+                    self._receive()
+                except BlockingIOError:
+                    raise WantReadError("Reading response body. Socket must be readable",
+                                        callback=partial(self.readinto, buffer))
+            piece, consumed = self._decoder.next_piece(self._input, len(out) - written)
+            out[written:written + len(piece)] = piece
+            written += len(piece)
+            self._input = self._input[consumed:]
+        self._finish_if_done()
+        return written
+
+    def read(self) -> bytes:
+        """Reads the rest of the body. In non-blocking mode bytes read before WantReadError are kept."""
+        if self._body is None:
+            self._body = bytearray()
+        while True:
+            size = self.readinto(self._chunk_view())
+            if not size:
+                body, self._body = bytes(self._body), None
+                return body
+            self._body += self._chunk_view()[:size]
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            size = self.readinto(self._chunk_view())
+            if not size:
+                return
+            yield bytes(self._chunk_view()[:size])
 
-        return call_callback_or_return()
+    async def read_head_async(self) -> HTTPResponse:
+        return await self._on_loop(self.read_head)
+
+    async def readinto_async(self, buffer) -> int:
+        return await self._on_loop(partial(self.readinto, buffer))
+
+    async def read_async(self) -> bytes:
+        return await self._on_loop(self.read)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            size = await self.readinto_async(self._chunk_view())
+            if not size:
+                return
+            yield bytes(self._chunk_view()[:size])
+
+    def _chunk_view(self) -> memoryview:
+        # Decoded bytes for read() and iteration go to the second half of the buffer,
+        # the first half receives raw bytes
+        return self._view[len(self._buffer) // 2:]
+
+    def _receive(self):
+        raw = self._view[:len(self._buffer) // 2]
+        if not _can_unread(self.sock):
+            raw = raw[:self._decoder.bytes_wanted()]
+        received = self.sock.recv_into(raw)
+        if not received:
+            raise ConnectionError("Server closed connection before the end of response body")
+        self._input = raw[:received]
+
+    def _finish_if_done(self):
+        if self._finished or not self._decoder.done:
+            return
+        self._finished = True
+        if self._input and _can_unread(self.sock):
+            self.sock.unread(self._input.tobytes())
+        self._input = memoryview(b'')
+
+    async def _on_loop(self, step: Callable[[], _T]) -> _T:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                return step()
+            except WantReadError:
+                await _wait_readable(loop, self.sock)
+
+
+async def _wait_readable(loop: asyncio.AbstractEventLoop, sock: socket.socket):
+    fut = loop.create_future()
+    loop.add_reader(sock.fileno(), lambda: fut.done() or fut.set_result(None))
+    try:
+        await fut
+    finally:
+        loop.remove_reader(sock.fileno())
+
+
+def read_http_response(sock: socket.socket,
+                       non_blocking_callback: Callable[[HTTPResponse], Any] | None = None, *,
+                       max_body_size: int | None = None) -> HTTPResponse | None:
+    """
+    Returns HTTPResponse in blocking mode else calls non_blocking_callback and passes HTTPResponse as first
+    argument. The whole body is read into HTTPResponse.body, use HTTPResponseReader to stream it.
+
+    Bytes received past the end of the response are pushed back to the socket if it supports
+    .unread() (see BaseProxiedSocket), so they are returned by the next .recv().
+    """
+    reader = HTTPResponseReader(sock, max_body_size=max_body_size)
+
+    def read():
+        try:
+            response = reader.read_head()
+            response.body = reader.read()
+        except WantReadError:
+            raise _UncompletedRecv(message="Reading response does not completed.", callback=read)
+        if not sock.getblocking() and non_blocking_callback:
+            return non_blocking_callback(response)
+        return response
 
-    return read_status_line()
+    return read()
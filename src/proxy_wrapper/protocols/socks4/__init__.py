@@ -0,0 +1 @@
+from .protocol import Socks4ProxyProtocol
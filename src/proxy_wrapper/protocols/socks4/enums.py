@@ -0,0 +1,17 @@
+from enum import Enum
+
+
+class SocksVersion(int, Enum):
+    SOCKS4 = 0x04
+
+
+class Command(int, Enum):
+    CONNECT = 0x01
+    BIND = 0x02
+
+
+class ReplyStatus(int, Enum):
+    REQUEST_GRANTED = 0x5A
+    REQUEST_REJECTED_OR_FAILED = 0x5B
+    IDENTD_UNREACHABLE = 0x5C
+    IDENTD_USERID_MISMATCH = 0x5D
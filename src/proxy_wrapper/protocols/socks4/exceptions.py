@@ -0,0 +1,14 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .messages import Reply
+
+
+class Socks4Error(Exception):
+    pass
+
+
+class ProxyConnectionError(Socks4Error, ConnectionError):
+    def __init__(self, message: str, reply: "Reply | None" = None):
+        super().__init__(message)
+        self.reply = reply
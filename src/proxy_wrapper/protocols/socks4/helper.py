@@ -0,0 +1,20 @@
+from typing import Optional, Tuple
+
+from .enums import SocksVersion, Command
+from .messages import Request, Reply
+
+REPLY_LENGTH = 8
+
+
+def request_to_connect_to_remote_address(addr: Tuple[str, int], userid: Optional[str] = None) -> Request:
+    return Request(
+        ver=SocksVersion.SOCKS4,
+        cmd=Command.CONNECT,
+        dst_addr=addr[0],
+        dst_port=addr[1],
+        userid=userid or "",
+    )
+
+
+def loads_reply(data: bytes) -> Reply:
+    return Reply.from_bytes(data)
@@ -0,0 +1,36 @@
+from typing import Tuple
+
+from proxy_wrapper.protocols.base import AbstractProxyMachine, ProxyState
+from .exceptions import ProxyConnectionError
+from .helper import REPLY_LENGTH, request_to_connect_to_remote_address, loads_reply
+from .messages import Reply
+
+
+class Socks4Machine(AbstractProxyMachine):
+    """
+    SOCKS4 has no handshake, the machine starts in READY state and a hop costs one request
+    and its 8 byte reply. Host names are sent as SOCKS4a, IPv6 addresses are not supported.
+    """
+
+    __slots__ = ("userid", "reply")
+
+    def __init__(self, userid: str | None = None):
+        super().__init__(ProxyState.READY)
+        self.userid = userid
+        self.reply: Reply | None = None
+
+    def _craft_connect_request(self, address: Tuple[str, int]) -> bytes:
+        return request_to_connect_to_remote_address(address, self.userid).to_bytes()
+
+    def bytes_needed(self) -> int:
+        return max(0, REPLY_LENGTH - len(self._incoming)) if self._state is ProxyState.REQUESTING else 0
+
+    def _process(self):
+        if self._state is not ProxyState.REQUESTING or len(self._incoming) < REPLY_LENGTH:
+            return
+        self.reply = loads_reply(bytes(self._incoming[:REPLY_LENGTH]))
+        del self._incoming[:REPLY_LENGTH]
+        if not self.reply.is_ok():
+            self._fail(ProxyConnectionError(
+                f"SOCKS4 proxy connection to {self.address} failed. Reason: {self.reply.rep.name}", self.reply))
+        self._state = ProxyState.CONNECTED
@@ -0,0 +1,50 @@
+import socket
+from dataclasses import dataclass
+
+from .enums import SocksVersion, Command, ReplyStatus
+
+# SOCKS4a marks a request carrying a host name with the invalid IP 0.0.0.x, x != 0
+_SOCKS4A_IP = bytes([0, 0, 0, 1])
+
+
+@dataclass(slots=True)
+class Request:
+    ver: SocksVersion
+    cmd: Command
+    dst_addr: str
+    dst_port: int
+    userid: str = ""
+
+    def to_bytes(self) -> bytes:
+        """IPv4 addresses are sent as SOCKS4, host names as SOCKS4a."""
+        head = bytes([self.ver, self.cmd]) + self.dst_port.to_bytes(2, "big")
+        userid = self.userid.encode() + b"\x00"
+        try:
+            return head + socket.inet_pton(socket.AF_INET, self.dst_addr) + userid
+        except OSError:
+            pass
+        if ":" in self.dst_addr:
+            raise ValueError(f"SOCKS4 does not support IPv6 addresses, got {self.dst_addr}")
+        return head + _SOCKS4A_IP + userid + self.dst_addr.encode("idna") + b"\x00"
+
+
+@dataclass(slots=True)
+class Reply:
+    rep: ReplyStatus
+    bind_addr: str
+    bind_port: int
+
+    def is_ok(self):
+        return self.rep == ReplyStatus.REQUEST_GRANTED
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Reply":
+        if len(data) < 8:
+            raise ValueError("Data must be at least 8 bytes long.")
+
+        # The first byte is the reply version, 0 by the spec but some proxies send 4, so it is not checked
+        rep = ReplyStatus(data[1])
+        bind_port = int.from_bytes(data[2:4], "big")
+        bind_addr = socket.inet_ntoa(data[4:8])
+
+        return cls(rep=rep, bind_addr=bind_addr, bind_port=bind_port)
@@ -0,0 +1,11 @@
+from abc import ABC
+
+from proxy_wrapper.protocols.base import AbstractProxyProtocol
+from proxy_wrapper.protocols.socks4.machine import Socks4Machine
+
+
+class Socks4ProxyProtocol(AbstractProxyProtocol, ABC):
+    __slots__ = ()
+
+    def socks4_machine(self, userid: str | None = None) -> Socks4Machine:
+        return Socks4Machine(userid)
@@ -1 +1 @@
-from .protocol import Socks5ProxyProtocol
+from .protocol import PipeliningRejections, Socks5ProxyProtocol
@@ -2,10 +2,11 @@ from abc import ABC, abstractmethod
 
 
 class BaseMessage:
-    pass
+    __slots__ = ()
 
 
 class ClientMessage(BaseMessage, ABC):
+    __slots__ = ()
 
     @abstractmethod
     def to_bytes(self) -> bytes:
@@ -13,6 +14,7 @@ class ClientMessage(BaseMessage, ABC):
 
 
 class ServerMessage(BaseMessage, ABC):
+    __slots__ = ()
 
     @classmethod
     @abstractmethod
@@ -5,6 +5,10 @@ class SocksVersion(int, Enum):
     SOCKS5 = 0x05
 
 
+class UsernamePasswordVersion(int, Enum):
+    V1 = 0x01
+
+
 class Method(int, Enum):
     NO_AUTHENTICATION_REQUIRED = 0x00
     GSSAPI = 0x01
@@ -1,3 +1,13 @@
+import errno
+from typing import TYPE_CHECKING
+
+from proxy_wrapper.exceptions import ProxyConnectionClosed  # noqa: F401  Kept here for backward compatibility
+from .enums import ReplyStatus
+
+if TYPE_CHECKING:
+    from .messages import Reply
+
+
 class Socks5Error(Exception):
     pass
 
@@ -14,13 +24,66 @@ class ProxyAuthenticationError(Socks5Error):
     pass
 
 
-class ProxyConnectionError(Socks5Error):
+class ProxyConnectionError(Socks5Error, ConnectionError):
+    """
+    Proxy refused to connect to the requested address. reply is the proxy's reply, errno tells
+    the reason like for a direct connection (e.g. ECONNREFUSED), it is None for GENERAL_FAILURE.
+    """
+
+    def __init__(self, message: str, reply: "Reply | None" = None):
+        code = _REPLY_ERRNOS.get(reply.rep) if reply is not None else None
+        if code is None:
+            super().__init__(message)
+        else:
+            super().__init__(code, message)
+        self.reply = reply
+
+    @property
+    def status(self) -> ReplyStatus | None:
+        return self.reply.rep if self.reply is not None else None
+
+    @classmethod
+    def from_reply(cls, reply: "Reply", address) -> "ProxyConnectionError":
+        """Error of the class which matches reply's status."""
+        error_class = _REPLY_ERRORS.get(reply.rep, cls)
+        return error_class(f"SOCKS5 proxy connection to {address} failed. Reason: {reply.rep.name}", reply)
+
+
+class ProxyConnectionRefused(ProxyConnectionError, ConnectionRefusedError):
     pass
 
 
+class ProxyConnectionNotAllowed(ProxyConnectionError, PermissionError):
+    """The proxy's ruleset does not allow the connection."""
+
+
+class ProxyTTLExpired(ProxyConnectionError, TimeoutError):
+    """The proxy's connection attempt timed out."""
+
+
 class ProxyError(Socks5Error):
     pass
 
 
-class ProxyConnectionClosed(ProxyError, ConnectionError):
-    pass
+_REPLY_ERRNOS = {
+    ReplyStatus.CONNECTION_NOT_ALLOWED: errno.EACCES,
+    ReplyStatus.NETWORK_UNREACHABLE: errno.ENETUNREACH,
+    ReplyStatus.HOST_UNREACHABLE: errno.EHOSTUNREACH,
+    ReplyStatus.CONNECTION_REFUSED: errno.ECONNREFUSED,
+    ReplyStatus.TTL_EXPIRED: errno.ETIMEDOUT,
+    ReplyStatus.COMMAND_NOT_SUPPORTED: errno.EOPNOTSUPP,
+    ReplyStatus.ADDRESS_TYPE_NOT_SUPPORTED: errno.EAFNOSUPPORT,
+}
+
+_REPLY_ERRORS = {
+    ReplyStatus.CONNECTION_REFUSED: ProxyConnectionRefused,
+    ReplyStatus.CONNECTION_NOT_ALLOWED: ProxyConnectionNotAllowed,
+    ReplyStatus.TTL_EXPIRED: ProxyTTLExpired,
+}
+
+
+class PipeliningRejected(ProxyConnectionClosed, Socks5Error):
+    """
+    Proxy closed connection after pipelined handshake. Next connections to it will not be pipelined,
+    ProxiedSocket.perform_connection() retries at once.
+    """
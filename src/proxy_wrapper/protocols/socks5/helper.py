@@ -1,7 +1,8 @@
 import ipaddress
+from functools import lru_cache
 from typing import Optional, Tuple
 
-from .enums import Method, SocksVersion, ATYP, Command
+from .enums import Method, SocksVersion, ATYP, Command, UsernamePasswordVersion
 from .messages import (
     Hello,
     HelloResponse,
@@ -9,9 +10,11 @@ from .messages import (
     AuthenticationResponse,
     Request,
     Reply,
+    UDPHeader,
 )
 
 
+@lru_cache(maxsize=4096)
 def guess_atyp(destination: str) -> ATYP:
     try:
         ipaddress.IPv4Address(destination)
@@ -43,7 +46,7 @@ def loads_hello_response(data: bytes) -> HelloResponse:
 
 def craft_username_password_message(username: str, password: str) -> UsernamePassword:
     return UsernamePassword(
-        ver=SocksVersion.SOCKS5, username=username, password=password
+        ver=UsernamePasswordVersion.V1, username=username, password=password
     )
 
 
@@ -65,5 +68,27 @@ def request_to_connect_to_remote_address(
     return request
 
 
+def request_udp_associate(
+        addr: Tuple[str, int] = ("0.0.0.0", 0), atyp: Optional[ATYP] = None
+) -> Request:
+    """addr is where the client sends datagrams from, all zeros when it is not known yet."""
+    atyp = atyp or guess_atyp(addr[0])
+    return Request(
+        ver=SocksVersion.SOCKS5,
+        cmd=Command.UDP_ASSOCIATE,
+        atyp=atyp,
+        dst_addr=addr[0],
+        dst_port=addr[1],
+    )
+
+
 def loads_reply(data: bytes) -> Reply:
     return Reply.from_bytes(data)
+
+
+def craft_udp_header(addr: Tuple[str, int]) -> bytes:
+    return UDPHeader(atyp=guess_atyp(addr[0]), dst_addr=addr[0], dst_port=addr[1]).to_bytes()
+
+
+def loads_udp_header(data: bytes) -> UDPHeader:
+    return UDPHeader.from_bytes(data)
@@ -0,0 +1,136 @@
+from typing import Tuple
+
+from proxy_wrapper.protocols.base import AbstractProxyMachine, ProxyState
+from .enums import ATYP
+from .exceptions import NoAcceptableMethods, ProxyAuthenticationError, ProxyConnectionError, ProxyError
+from .helper import craft_hello_message, craft_username_password_message, loads_hello_response, \
+    loads_authentication_response, request_to_connect_to_remote_address, loads_reply
+from .messages import Reply
+
+_ADDRESS_LENGTHS = {ATYP.IPV4: 4, ATYP.IPV6: 16}
+
+
+def reply_length(data: bytes) -> int:
+    """
+    Returns full length of a reply which starts with data or -1 if data is too short to tell.
+    """
+    if len(data) < 5:
+        return -1
+    atyp = data[3]
+    if atyp == ATYP.DOMAIN_NAME:
+        return 4 + 1 + data[4] + 2
+    if atyp in _ADDRESS_LENGTHS:
+        return 4 + _ADDRESS_LENGTHS[atyp] + 2
+    raise ValueError(f"Unknown ATYP: {atyp}")
+
+
+class Socks5Machine(AbstractProxyMachine):
+    """
+    With pipelining=True the username/password frame is sent together with the hello and
+    .connect() is allowed before the handshake is done, so all frames go out in one write
+    and the replies are parsed in order. Use it only for proxies known to accept this.
+    """
+
+    __slots__ = ("credentials", "pipelining", "reply", "_auth", "_auth_sent")
+
+    def __init__(self, credentials: Tuple[str, str] | None = None, pipelining: bool = False,
+                 hello: bytes | None = None, auth: bytes | None = None):
+        """hello and auth are already encoded frames, e.g. from ProxyChain."""
+        super().__init__(ProxyState.GREETING)
+        self.credentials = credentials
+        self.pipelining = pipelining
+        self.reply: Reply | None = None
+        self._auth = auth
+        self._outgoing += hello or craft_hello_message(credentials).to_bytes()
+        self._auth_sent = False
+        if pipelining and credentials:
+            self._outgoing += self._auth_frame()
+            self._auth_sent = True
+
+    def connect(self, address: Tuple[str, int], request: bytes | None = None):
+        if self.pipelining and self._state in (ProxyState.GREETING, ProxyState.AUTHENTICATING) \
+                and self.address is None:
+            self.address = address
+            self._outgoing += request or self._craft_connect_request(address)
+            return
+        super().connect(address, request)
+
+    def bytes_needed(self) -> int:
+        if self._state is ProxyState.REQUESTING:
+            length = reply_length(self._incoming)
+            # The first 5 bytes tell the address type and so the reply length
+            return (5 if length == -1 else length) - len(self._incoming)
+        if self.pipelining or self._state not in (ProxyState.GREETING, ProxyState.AUTHENTICATING):
+            return 0  # Replies to pipelined frames follow each other
+        return max(0, 2 - len(self._incoming))
+
+    def _auth_frame(self) -> bytes:
+        return self._auth or craft_username_password_message(*self.credentials).to_bytes()
+
+    def _handshake_done(self):
+        # A pipelined request has been sent already
+        self._state = ProxyState.READY if self.address is None else ProxyState.REQUESTING
+
+    def _craft_connect_request(self, address: Tuple[str, int]) -> bytes:
+        return request_to_connect_to_remote_address(address).to_bytes()
+
+    def _process(self):
+        while True:
+            if self._state is ProxyState.GREETING:
+                if not self._process_hello_response():
+                    return
+            elif self._state is ProxyState.AUTHENTICATING:
+                if not self._process_authentication_response():
+                    return
+            elif self._state is ProxyState.REQUESTING:
+                if not self._process_reply():
+                    return
+            else:
+                return
+
+    def _process_hello_response(self) -> bool:
+        if len(self._incoming) < 2:
+            return False
+        hello_response = loads_hello_response(self._take(2))
+        try:
+            hello_response.raise_exception_if_occurred()
+        except NoAcceptableMethods as e:
+            self._fail(e)
+
+        if not hello_response.requires_credentials():
+            if self._auth_sent:
+                self._fail(ProxyError("Proxy skipped authentication while pipelined credentials were sent"))
+            self._handshake_done()
+            return True
+        if self.credentials is None:
+            self._fail(NoAcceptableMethods("Proxy requires credentials but none were provided"))
+
+        if not self._auth_sent:
+            self._outgoing += self._auth_frame()
+            self._auth_sent = True
+        self._state = ProxyState.AUTHENTICATING
+        return True
+
+    def _process_authentication_response(self) -> bool:
+        if len(self._incoming) < 2:
+            return False
+        if not loads_authentication_response(self._take(2)).is_ok():
+            self._fail(ProxyAuthenticationError("Proxy rejected provided credentials"))
+        self._handshake_done()
+        return True
+
+    def _process_reply(self) -> bool:
+        length = reply_length(self._incoming)
+        if length == -1 or len(self._incoming) < length:
+            return False
+
+        self.reply = loads_reply(self._take(length))
+        if not self.reply.is_ok():
+            self._fail(ProxyConnectionError.from_reply(self.reply, self.address))
+        self._state = ProxyState.CONNECTED
+        return True
+
+    def _take(self, n: int) -> bytes:
+        data = bytes(self._incoming[:n])
+        del self._incoming[:n]
+        return data
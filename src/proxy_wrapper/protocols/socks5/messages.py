@@ -3,11 +3,11 @@ import typing
 from dataclasses import dataclass, field
 
 from .base import ClientMessage, ServerMessage
-from .enums import SocksVersion, Method, Command, ATYP, ReplyStatus
+from .enums import SocksVersion, Method, Command, ATYP, ReplyStatus, UsernamePasswordVersion
 from .exceptions import NoAcceptableMethods
 
 
-@dataclass
+@dataclass(slots=True)
 class Hello(ClientMessage):
     ver: SocksVersion
     methods: typing.List[int] = field(default_factory=list)
@@ -23,7 +23,7 @@ class Hello(ClientMessage):
         return bytes([self.ver, method_count]) + bytes(self.methods)
 
 
-@dataclass
+@dataclass(slots=True)
 class HelloResponse(ServerMessage):
     ver: SocksVersion
     method: Method
@@ -48,9 +48,9 @@ class HelloResponse(ServerMessage):
         return self.method == Method.USERNAME_PASSWORD
 
 
-@dataclass
+@dataclass(slots=True)
 class UsernamePassword(ClientMessage):
-    ver: SocksVersion
+    ver: UsernamePasswordVersion
     username: str
     password: str
 
@@ -75,9 +75,9 @@ class UsernamePassword(ClientMessage):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class AuthenticationResponse(ServerMessage):
-    ver: SocksVersion
+    ver: UsernamePasswordVersion
     status: int
 
     @classmethod
@@ -85,7 +85,7 @@ class AuthenticationResponse(ServerMessage):
         if len(data) < 2:
             raise ValueError("Data must be at least 2 bytes long.")
 
-        ver = SocksVersion(data[0])
+        ver = UsernamePasswordVersion(data[0])
         status = data[1]
 
         return cls(ver=ver, status=status)
@@ -94,7 +94,7 @@ class AuthenticationResponse(ServerMessage):
         return self.status == 0
 
 
-@dataclass
+@dataclass(slots=True)
 class Request(ClientMessage):
     ver: SocksVersion
     cmd: Command
@@ -119,7 +119,7 @@ class Request(ClientMessage):
         return bytes([self.ver, self.cmd, 0x00, self.atyp]) + addr_bytes + port_bytes
 
 
-@dataclass
+@dataclass(slots=True)
 class Reply:
     ver: SocksVersion
     rep: ReplyStatus
@@ -161,3 +161,44 @@ class Reply:
         return cls(
             ver=ver, rep=rep, atyp=atyp, bind_addr=bind_addr, bind_port=bind_port
         )
+
+
+@dataclass(slots=True)
+class UDPHeader(ClientMessage):
+    """Header of every datagram relayed by UDP ASSOCIATE (RFC 1928, section 7), the data follows it."""
+    atyp: ATYP
+    dst_addr: str
+    dst_port: int
+    frag: int = 0
+
+    def to_bytes(self) -> bytes:
+        request = Request(SocksVersion.SOCKS5, Command.UDP_ASSOCIATE, self.atyp, self.dst_addr, self.dst_port)
+        return bytes([0x00, 0x00, self.frag, self.atyp]) + request._get_address_bytes() + \
+            self.dst_port.to_bytes(2, "big")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "UDPHeader":
+        if len(data) < 7:
+            raise ValueError("Data must be at least 7 bytes long.")
+
+        frag = data[2]
+        atyp = ATYP(data[3])
+
+        if atyp == ATYP.IPV4:
+            if len(data) < 10:
+                raise ValueError("Data is too short for IPv4 address.")
+            dst_addr = socket.inet_ntoa(data[4:8])
+            dst_port = int.from_bytes(data[8:10], "big")
+        elif atyp == ATYP.DOMAIN_NAME:
+            addr_length = data[4]
+            if len(data) < 5 + addr_length + 2:
+                raise ValueError("Data is too short for the domain name and port.")
+            dst_addr = bytes(data[5: 5 + addr_length]).decode()
+            dst_port = int.from_bytes(data[5 + addr_length: 7 + addr_length], "big")
+        else:
+            if len(data) < 22:
+                raise ValueError("Data is too short for IPv6 address.")
+            dst_addr = socket.inet_ntop(socket.AF_INET6, data[4:20])
+            dst_port = int.from_bytes(data[20:22], "big")
+
+        return cls(atyp=atyp, dst_addr=dst_addr, dst_port=dst_port, frag=frag)
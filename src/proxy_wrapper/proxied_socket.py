@@ -1,73 +1,357 @@
+import errno
+import ipaddress
+import os
+import select
 import socket
-from typing import Callable
+import ssl
+import time
+from functools import partial
+from typing import Tuple
 
-from proxy_wrapper.enums import ProxyProtocol
-from proxy_wrapper.nonblocking import _NonBlockingProxiedSocket
+from proxy_wrapper.aio import AsyncMethods
+from proxy_wrapper.base import BaseProxiedSocket
+from proxy_wrapper.enums import ConnectPhase, DNSPolicy, ProxyProtocol
+from proxy_wrapper.exceptions import ProxyConnectionClosed, WantReadError, WantWriteError
+from proxy_wrapper.protocols import AbstractProxyMachine, ImplementsProxyProtocolsMixin, ProxyState
+from proxy_wrapper.protocols.socks5.exceptions import PipeliningRejected
+from proxy_wrapper.protocols.socks5.helper import request_udp_associate
 from proxy_wrapper.proxy import Proxy
+from proxy_wrapper.resolver import is_ip_address, resolve_address
+from proxy_wrapper.tls import TLS_READ_SIZE, TLSChannel, default_session_cache, default_tls_context
 
+_CONNECT_IN_PROGRESS = (errno.EINPROGRESS, errno.EALREADY, errno.EWOULDBLOCK)
+_HANDSHAKE_STATES = (ProxyState.GREETING, ProxyState.AUTHENTICATING)
+_REQUEST_PHASES = {ProxyProtocol.SOCKS5: ConnectPhase.SOCKS5_CONNECT, ProxyProtocol.SOCKS4: ConnectPhase.SOCKS4_CONNECT,
+                   ProxyProtocol.SOCKS4A: ConnectPhase.SOCKS4_CONNECT}
 
-def call_super_for_nonblocking(meth: Callable):
-    def inner(self: socket.socket, *args, **kwargs):
-        if self.getblocking():
-            return meth(self, *args, **kwargs)
-        return getattr(super(self.__class__, self), meth.__name__)(*args, **kwargs)
 
-    return inner
+def _wait_ready(sock: socket.socket, reading: bool, timeout: float) -> bool:
+    """Waits at most timeout seconds until sock is readable or writeable."""
+    if hasattr(select, "poll"):  # select() is limited by FD_SETSIZE
+        poller = select.poll()
+        poller.register(sock, select.POLLIN if reading else select.POLLOUT)
+        return bool(poller.poll(max(0.0, timeout) * 1000))
+    readable, writeable, _ = select.select([sock] if reading else [], [] if reading else [sock], [], max(0.0, timeout))
+    return bool(readable or writeable)
 
 
-class ProxiedSocket(_NonBlockingProxiedSocket):
-    @call_super_for_nonblocking
+class ProxiedSocket(AsyncMethods, BaseProxiedSocket, ImplementsProxyProtocolsMixin):
+    """
+    Socket which connects through a chain of proxies.
+
+    Every hop is handled by a sans-IO state machine (see proxy_wrapper.protocols), blocking and
+    non-blocking sockets run the very same steps. In non-blocking mode perform_connection() and
+    connect() raise WantReadError or WantWriteError when I/O is not ready. Call them again (or call
+    the exception's callback) when the socket is readable or writeable.
+
+    TLS with HTTPS proxies and with the target (start_tls()) runs on memory BIOs, so it nests for
+    HTTPS proxies in the middle of a chain and follows the same WantRead/WantWrite model.
+    send() and recv() go through it.
+    Like with ssl.SSLSocket, decrypted bytes may wait in the socket, recv() them before waiting
+    for the socket to be readable again. Unlike a plain socket it must not send() in one thread
+    while it recv()s in another.
+    """
+
+    __slots__ = ()
+
     def connect(self, address, /):
-        if self.in_command_mode:
-            if self.does_user_called_connect():
-                return self._connect_to_target_according_protocol(address)
-            else:
-                return self._connect_according_to_protocol(address)
-        return super().connect(address)
-
-    @call_super_for_nonblocking
+        if not self._proxies:
+            return super().connect(address)
+        try:
+            self._connect_to_target_according_protocol(address)
+        except (WantReadError, WantWriteError) as e:
+            e.callback = partial(self.connect, address)
+            e.deadline = self._phase_deadline()
+            raise
+        except Exception as e:
+            self._phase_finished(e)
+            raise
+
+    def start_tls(self, context: ssl.SSLContext | None = None, server_hostname: str | None = None):
+        """
+        Runs a TLS handshake with the target through the tunnel, afterwards send() and recv() carry
+        the target's plaintext. context defaults to default_tls_context(), server_hostname to the host
+        passed to connect(). In non-blocking mode WantReadError and WantWriteError are raised like
+        in connect(), call start_tls() again (or the callback) when the socket is ready.
+        """
+        try:
+            self._start_tls_to_target(context, server_hostname)
+        except (WantReadError, WantWriteError) as e:
+            e.callback = partial(self.start_tls, context, server_hostname)
+            e.deadline = self._phase_deadline()
+            raise
+        except Exception as e:
+            self._phase_finished(e)
+            raise
+
+    def udp_associate(self, address: Tuple[str, int] = ("0.0.0.0", 0)) -> Tuple[str, int]:
+        """
+        Asks the last proxy, which must be SOCKS5, to relay UDP datagrams sent from address
+        and returns the relay address to send them to (see ProxiedDatagramSocket). It may be a host name.
+        The socket becomes the control connection, the association ends when it is closed.
+        """
+        try:
+            return self._udp_associate(address)
+        except (WantReadError, WantWriteError) as e:
+            e.callback = partial(self.udp_associate, address)
+            e.deadline = self._phase_deadline()
+            raise
+        except Exception as e:
+            self._phase_finished(e)
+            raise
+
     def connect_to_proxy(self, proxy: Proxy):
+        if not self.has_pending_proxies():
+            self._proxies += (proxy,)
         self.connecting_to_proxy = True
-        self.proxy_to_connect = proxy
+        try:
+            self._connect_to_proxy(proxy)
+        except (WantReadError, WantWriteError) as e:
+            e.deadline = self._phase_deadline()
+            raise
+        except Exception as e:
+            self._phase_finished(e)
+            raise
 
-        # Be sure that this function is calling in 'blocking' mode
-        self.connect(proxy.address)
+    def _connect_to_proxy(self, proxy: Proxy):
+        if self._next_machine is None:
+            hop = self._compiled_hop(self._hops)
+            if self._tls is None or not self._tls.handshaking:
+                if self._hops:
+                    previous_hop = self._compiled_hop(self._hops - 1)
+                    self._phase_started(self._request_phase(self._hops - 1), self._hops - 1, proxy.address)
+                    request = previous_hop and previous_hop.connect_request
+                    self._connect_according_to_protocol(
+                        self._socks4_address(self._hops - 1, proxy.address, request), request)
+                else:
+                    self._connect_directly(proxy.address)
+                self._phase_finished()
+                if proxy.protocol is ProxyProtocol.HTTPS:
+                    # A host name is checked against the certificate and sent as SNI, an IP address is only checked
+                    self._start_tls(self.tls_context or default_tls_context(), proxy.address, proxy.address[0],
+                                    ConnectPhase.TLS_HANDSHAKE, self._hops)
+            if self._tls is not None and self._tls.handshaking:
+                self._tls_handshake()
+                self._phase_finished()
+            self._next_machine = self.machine_for(proxy, hop)
+            if self._next_machine.state is ProxyState.GREETING:
+                self._phase_started(ConnectPhase.SOCKS5_HELLO, self._hops)
+            if getattr(self._next_machine, "pipelining", False) and self._hops + 1 < len(self._proxies):
+                self._next_machine.connect(self._proxies[self._hops + 1].address, hop and hop.connect_request)
+
+        try:
+            self.drive_machine(self._next_machine, ProxyState.READY)
+        except ConnectionError as e:
+            if getattr(self._next_machine, "pipelining", False) \
+                    and self._next_machine.state in _HANDSHAKE_STATES:
+                self.pipelining_rejected.add(proxy.address)
+                raise PipeliningRejected(f"Proxy {proxy.address} closed connection after pipelined handshake") from e
+            raise
+        self._phase_finished()
         self._on_connected_to_proxy(proxy)
 
-    @call_super_for_nonblocking
     def perform_connection(self):
-        while not self.proxy_queue.empty():
-            self._connect_to_next_proxy()
+        """
+        Connects to every pending proxy. A proxy which drops a pipelined SOCKS5 handshake is
+        remembered in pipelining_rejected and the chain is connected once again from the first hop,
+        without pipelining to it. The socket keeps its file descriptor, but selectors must register
+        it again for the new connection: reconnects is incremented when this happens.
+        """
+        try:
+            while self.has_pending_proxies():
+                try:
+                    self.connect_to_proxy(self._proxies[self._hops])
+                except PipeliningRejected:
+                    if self.reconnects >= len(self._proxies):
+                        raise
+                    self._reconnect()
+        except (WantReadError, WantWriteError) as e:
+            e.callback = self.perform_connection
+            raise
+
+    def _reconnect(self):
+        """Replaces the connection with a new one on the same file descriptor, no proxy is connected."""
+        fresh = socket.socket(self.family, self.type, self.proto)
+        try:
+            os.dup2(fresh.fileno(), self.fileno(), inheritable=False)
+        finally:
+            fresh.close()
+        self.settimeout(self.gettimeout())  # O_NONBLOCK belonged to the old file description
+        self._hops = 0
+        self.in_command_mode = False
+        self.connecting_to_proxy = False
+        self._pushback = b''
+        self._machine = self._next_machine = None
+        self._tcp_connecting_to = None
+        self._tls = None
+        self.reconnects += 1
+
+    def _connect_directly(self, address):
+        if self._tcp_connecting_to is None:
+            address = resolve_address(address, self.family, self.resolver)
+            self._phase_started(ConnectPhase.TCP_CONNECT, 0, address)
+            deadline = self._check_deadline()
+            if deadline is not None and self.getblocking():
+                return self._connect_before(address, deadline)
+            try:
+                return super().connect(address)
+            except BlockingIOError:
+                self._tcp_connecting_to = address
+                raise WantWriteError("Connecting to proxy. Socket must be writeable")
+
+        self._check_deadline()
+        error = self.connect_ex(self._tcp_connecting_to)
+        if error in _CONNECT_IN_PROGRESS:
+            raise WantWriteError("Connecting to proxy. Socket must be writeable")
+        self._tcp_connecting_to = None
+        if error not in (0, errno.EISCONN):
+            raise OSError(error, os.strerror(error))
+
+    def _connect_before(self, address, deadline: float):
+        """Blocking connect() which gives up at deadline, the socket timeout is left as it was."""
+        previous = self.gettimeout()
+        remaining = deadline - time.monotonic()
+        self.settimeout(remaining if previous is None else min(previous, remaining))
+        try:
+            super().connect(address)
+        except TimeoutError:
+            if time.monotonic() >= deadline:
+                raise self._timeout_error() from None
+            raise
+        finally:
+            self.settimeout(previous)
 
-    @call_super_for_nonblocking
-    def _connect_to_next_proxy(self):
-        proxy = self.proxy_queue.get_nowait()
-        self.connect_to_proxy(proxy)
+    def _before_io(self, reading: bool):
+        if self._timing is None or self._timeouts is None:
+            return
+        deadline = self._check_deadline()
+        if deadline is None or not self.getblocking() or (reading and (self._pushback or self._tls_pending())):
+            return
+        if not _wait_ready(self, reading, deadline - time.monotonic()):
+            raise self._timeout_error()
+
+    def _tls_pending(self) -> bool:
+        return self._tls is not None and self._tls.pending() > 0
+
+    def _start_tls(self, context: ssl.SSLContext, address, server_hostname: str, phase: ConnectPhase, hop: int):
+        if self._tls is None:
+            self._tls = TLSChannel()
+        # What came after the previous reply is the start of the peer's handshake
+        early = bytes(self._pushback) + self._tls.read(self._tls.pending())
+        self._pushback = b''
+        self._tls.add_layer(context, address, server_hostname, default_session_cache.get(context, address))
+        if early:
+            self._tls.feed_last_layer(early)
+        self._phase_started(phase, hop)
+
+    def _start_tls_to_target(self, context: ssl.SSLContext | None, server_hostname: str | None):
+        if not self.tls_to_target:
+            if not self.connected_to_target:
+                raise RuntimeError("Socket must be connected to target first, call connect()")
+            self._start_tls(context or default_tls_context(), self.target_address,
+                            server_hostname or self.target_address[0], ConnectPhase.TARGET_TLS, self._hops - 1)
+            self._deadline = None  # ConnectTimeouts.total ends with connect()
+            self.tls_to_target = True
+        elif not self._tls.handshaking:
+            raise RuntimeError("TLS with target is already established")
+        self._tls_handshake()
+        self._phase_finished()
+
+    def _tls_handshake(self):
+        channel = self._tls
+        while True:
+            done = channel.handshake()
+            self._before_io(reading=False)
+            if not self._tls_flush():
+                raise WantWriteError("Sending TLS handshake. Socket must be writeable")
+            if done:
+                return
+            self._before_io(reading=True)
+            try:
+                wire = socket.socket.recv(self, TLS_READ_SIZE)
+            except BlockingIOError:
+                raise WantReadError("Waiting for TLS handshake of the peer")
+            if not wire:
+                raise ProxyConnectionClosed("Connection closed during TLS handshake")
+            channel.feed(wire)
+
+    def _request_phase(self, hop: int) -> ConnectPhase:
+        return _REQUEST_PHASES.get(self._proxies[hop].protocol, ConnectPhase.HTTP_CONNECT)
+
+    def _socks4_address(self, hop: int, address, request: bytes | None = None):
+        """SOCKS4 carries IPv4 addresses only, so host names the hop-th proxy is asked for are resolved here."""
+        if request is None and self._proxies[hop].protocol is ProxyProtocol.SOCKS4 \
+                and self._machine.state is ProxyState.READY:
+            return resolve_address(address, socket.AF_INET, self.resolver)
+        return address
+
+    def _on_machine_state(self, machine: AbstractProxyMachine, previous: ProxyState):
+        if self._timing is None or previous not in _HANDSHAKE_STATES:
+            return
+        # Replies to pipelined frames may move a machine through several states at once
+        hop = self._timing[1]
+        self._phase_finished()
+        if machine.state is ProxyState.AUTHENTICATING:
+            self._phase_started(ConnectPhase.SOCKS5_AUTH, hop)
 
-    @call_super_for_nonblocking
     def _on_connected_to_proxy(self, proxy: Proxy):
+        if self._tls is not None:
+            self._remember_tls_sessions()
         self.in_command_mode = True
         self.connecting_to_proxy = False
-        self.proxy_to_connect = None
-        self.proxy_chain.append(proxy)
+        self._hops += 1
+        self._machine = self._next_machine
+        self._next_machine = None
 
-    @call_super_for_nonblocking
-    def _connect_according_to_protocol(self, address):
-        last_proxy = self.proxy_chain[-1]
-        last_protocol_in_chain = last_proxy.protocol
-        credentials = last_proxy.credentials
+    def _connect_according_to_protocol(self, address, request: bytes | None = None, exact: bool = False):
+        """
+        Asks the last proxy in chain to connect to address. request is the precompiled request if any.
+        exact is for the target, whose first bytes must not be read together with the reply.
+        """
+        if self._machine.state is ProxyState.READY:
+            self._machine.connect(address, request)
+        self.drive_machine(self._machine, ProxyState.CONNECTED, exact)
 
-        if last_protocol_in_chain in (ProxyProtocol.HTTP, ProxyProtocol.HTTPS):
-            success = self.http_connect(address, credentials)
-            if not success:
-                raise ConnectionError("HTTP proxy connection failed")
+        leftover = self._machine.unused_data()
+        if leftover:
+            self.unread(leftover)
 
-    @call_super_for_nonblocking
     def _connect_to_target_according_protocol(self, address):
         if self.connected_to_target:
             raise RuntimeError("Already connected to target")
-        if not self.proxy_queue.empty():
+        if self.has_pending_proxies():
             raise RuntimeError("Can't connect to target while proxy queue is not empty")
-        self._connect_according_to_protocol(address)
+        original = address
+        address = self._socks4_address(self._hops - 1, address)
+        if self.dns_policy is DNSPolicy.LOCAL and self._machine.state is ProxyState.READY:
+            address = resolve_address(address, resolver=self.resolver)
+        self._phase_started(ConnectPhase.TARGET_CONNECT, self._hops - 1, address)
+        self._connect_according_to_protocol(address, exact=True)
+        self._phase_finished()
+        if self._tls is not None:
+            self._remember_tls_sessions()
+        self._deadline = None
+        self.target_address = original
         self.connected_to_target = True
         self.in_command_mode = False
+
+    def _udp_associate(self, address):
+        if self.connected_to_target:
+            raise RuntimeError("Already connected to target")
+        if not self._hops or self.has_pending_proxies():
+            raise RuntimeError("Proxies must be connected first, call perform_connection()")
+        proxy = self._proxies[-1]
+        if proxy.protocol is not ProxyProtocol.SOCKS5:
+            raise ValueError(f"UDP ASSOCIATE requires a SOCKS5 proxy, the last one is {proxy.protocol.value}")
+        self._phase_started(ConnectPhase.SOCKS5_UDP_ASSOCIATE, self._hops - 1, address)
+        self._connect_according_to_protocol(address, request_udp_associate(address).to_bytes())
+        self._phase_finished()
+        self._deadline = None
+        self.connected_to_target = True
+        self.in_command_mode = False
+
+        host, port = self._machine.reply.bind_addr, self._machine.reply.bind_port
+        if is_ip_address(host) and ipaddress.ip_address(host).is_unspecified:
+            # The relay listens on every interface of the proxy, so use the address it was reached at
+            host = self.getpeername()[0] if self._hops == 1 else proxy.address[0]
+        return host, port
@@ -3,23 +3,32 @@ from typing import Literal, Tuple
 
 from proxy_wrapper.enums import ProxyProtocol
 
-_ProtocolLike = ProxyProtocol | Literal["socks5", "socks4", "http", "https"]
+_ProtocolLike = ProxyProtocol | Literal["socks5", "socks4", "socks4a", "http", "https"]
 _ProxyTuple = Tuple[_ProtocolLike, Tuple[str, int], Tuple[str, str] | Tuple[None, None] | None]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Proxy:
     protocol: _ProtocolLike
     address: Tuple[str, int]
     credentials: Tuple[str, str] | Tuple[None, None] | None = None
+    pipelining: bool = False  # Send SOCKS5 handshake frames without waiting for replies
 
     def __post_init__(self):
+        # Frozen, so normalized fields are set through object.__setattr__
         if isinstance(self.protocol, str):
-            self.protocol = ProxyProtocol(self.protocol)
+            object.__setattr__(self, "protocol", ProxyProtocol(self.protocol))
+        if not isinstance(self.address, tuple):
+            object.__setattr__(self, "address", tuple(self.address))
 
         if isinstance(self.credentials, Tuple):
             if self.credentials[0] is None and self.credentials[1] is None:
-                self.credentials = None
+                object.__setattr__(self, "credentials", None)
+
+    @property
+    def key(self) -> tuple:
+        """Identity of the proxy, equal for proxies which connect the same way."""
+        return self.protocol, self.address, self.credentials, self.pipelining
 
     @classmethod
     def from_tuple(cls, proxy: _ProxyTuple):
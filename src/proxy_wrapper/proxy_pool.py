@@ -0,0 +1,285 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Dict, Iterable, List, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.proxied_socket import ProxiedSocket
+from proxy_wrapper.proxy import Proxy
+from proxy_wrapper.tunnel_pool import create_tunnel
+from proxy_wrapper.utils import parse_proxy_string
+
+
+class Selection(str, Enum):
+    POWER_OF_TWO = "p2c"  # Best of two random proxies, O(1)
+    WEIGHTED = "weighted"  # Random proxy with probability proportional to its score, O(log n)
+
+
+class ProxyStats:
+    """Health of a proxy. Latencies are in seconds."""
+
+    __slots__ = ("latency", "success_rate", "successes", "failures", "consecutive_failures", "last_failure")
+
+    def __init__(self, initial_latency: float):
+        self.latency = initial_latency  # EWMA of handshake latency
+        self.success_rate = 1.0  # EWMA of outcomes, 1 is success
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure: float | None = None  # time.time() of the last failure
+
+    def score(self) -> float:
+        """The higher the better. Slow, failing and recently failed proxies get lower scores."""
+        return self.success_rate / (max(self.latency, 1e-4) * (1 << min(self.consecutive_failures, 16)))
+
+    def __repr__(self) -> str:
+        return (f"ProxyStats(latency={self.latency:.4f}, success_rate={self.success_rate:.3f}, "
+                f"successes={self.successes}, failures={self.failures}, last_failure={self.last_failure})")
+
+
+class _FenwickTree:
+    """Prefix sums of weights with O(log n) update and weighted sampling."""
+
+    __slots__ = ("_tree", "_weights")
+
+    def __init__(self):
+        self._tree: List[float] = [0.0]
+        self._weights: List[float] = []
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    def total(self) -> float:
+        index, total = len(self._weights), 0.0
+        while index:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def append(self, weight: float):
+        self._weights.append(0.0)
+        self._tree.append(0.0)
+        index = len(self._weights)
+        # A new node covers (index - lowbit, index], collect children sums
+        child = index - 1
+        stop = index - (index & -index)
+        while child > stop:
+            self._tree[index] += self._tree[child]
+            child -= child & -child
+        self.set(index - 1, weight)
+
+    def pop(self) -> float:
+        weight = self._weights[-1]
+        self.set(len(self._weights) - 1, 0.0)
+        self._weights.pop()
+        self._tree.pop()
+        return weight
+
+    def get(self, position: int) -> float:
+        return self._weights[position]
+
+    def set(self, position: int, weight: float):
+        delta = weight - self._weights[position]
+        self._weights[position] = weight
+        index = position + 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def find(self, value: float) -> int:
+        """Returns the first position where prefix sum of weights exceeds value."""
+        position, mask = 0, 1 << (len(self._weights).bit_length())
+        while mask:
+            nxt = position + mask
+            if nxt < len(self._tree) and self._tree[nxt] <= value:
+                position = nxt
+                value -= self._tree[nxt]
+            mask >>= 1
+        return min(position, len(self._weights) - 1)
+
+
+class ProxyPool:
+    """
+    Fleet of proxies with health tracking.
+
+    Every handshake outcome is recorded with record_success() and record_failure(). They keep an
+    EWMA of latency and success rate per proxy. get() picks a proxy using the selection strategy
+    in O(1) (power of two choices) or O(log n) (weighted), so it stays cheap with 100k proxies.
+
+    start_health_checks() probes probe_batch proxies every probe_interval seconds by connecting
+    to probe_target through them, in background threads.
+    """
+
+    def __init__(self, proxies: Iterable[Proxy | str] = (), *, selection: Selection = Selection.POWER_OF_TWO,
+                 alpha: float = 0.2, initial_latency: float = 1.0, probe_target: Tuple[str, int] | None = None,
+                 probe_interval: float = 30.0, probe_batch: int = 64, probe_timeout: float = 5.0):
+        self.selection = Selection(selection)
+        self.alpha = alpha
+        self.initial_latency = initial_latency
+        self.probe_target = probe_target
+        self.probe_interval = probe_interval
+        self.probe_batch = probe_batch
+        self.probe_timeout = probe_timeout
+
+        self._proxies: List[Proxy] = []
+        self._stats: List[ProxyStats] = []
+        self._positions: Dict[tuple, int] = {}
+        self._weights = _FenwickTree()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._probe_cursor = 0
+        self._stopped = threading.Event()
+        self._checker: threading.Thread | None = None
+
+        for proxy in proxies:
+            self.add(proxy)
+
+    def __len__(self) -> int:
+        return len(self._proxies)
+
+    def __contains__(self, proxy: Proxy) -> bool:
+        return proxy.key in self._positions
+
+    def add(self, proxy: Proxy | str) -> Proxy:
+        if isinstance(proxy, str):
+            proxy = parse_proxy_string(proxy)
+        with self._lock:
+            if proxy.key in self._positions:
+                return self._proxies[self._positions[proxy.key]]
+            stats = ProxyStats(self.initial_latency)
+            self._positions[proxy.key] = len(self._proxies)
+            self._proxies.append(proxy)
+            self._stats.append(stats)
+            self._weights.append(stats.score())
+        return proxy
+
+    def remove(self, proxy: Proxy):
+        with self._lock:
+            position = self._positions.pop(proxy.key)
+            last = len(self._proxies) - 1
+            if position != last:
+                # Move the last proxy to the freed position
+                self._proxies[position] = self._proxies[last]
+                self._stats[position] = self._stats[last]
+                self._positions[self._proxies[position].key] = position
+                self._weights.set(position, self._weights.get(last))
+            self._proxies.pop()
+            self._stats.pop()
+            self._weights.pop()
+
+    def stats(self, proxy: Proxy) -> ProxyStats:
+        with self._lock:
+            return self._stats[self._positions[proxy.key]]
+
+    def get(self) -> Proxy:
+        with self._lock:
+            if not self._proxies:
+                raise LookupError("Proxy pool is empty")
+            if self.selection is Selection.WEIGHTED:
+                total = self._weights.total()
+                if total > 0:
+                    return self._proxies[self._weights.find(self._random.random() * total)]
+                return self._proxies[self._random.randrange(len(self._proxies))]
+
+            first = self._random.randrange(len(self._proxies))
+            second = self._random.randrange(len(self._proxies))
+            if self._stats[second].score() > self._stats[first].score():
+                first = second
+            return self._proxies[first]
+
+    def record_success(self, proxy: Proxy, latency: float):
+        with self._lock:
+            position = self._positions.get(proxy.key)
+            if position is None:
+                return
+            stats = self._stats[position]
+            stats.latency += self.alpha * (latency - stats.latency)
+            stats.success_rate += self.alpha * (1.0 - stats.success_rate)
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            self._weights.set(position, stats.score())
+
+    def record_failure(self, proxy: Proxy):
+        with self._lock:
+            position = self._positions.get(proxy.key)
+            if position is None:
+                return
+            stats = self._stats[position]
+            stats.success_rate -= self.alpha * stats.success_rate
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            stats.last_failure = time.time()
+            self._weights.set(position, stats.score())
+
+    def connect(self, target: Tuple[str, int], timeout: float | None = None) -> ProxiedSocket:
+        """Connects to target through a proxy from get() and records the outcome."""
+        proxy = self.get()
+        try:
+            sock, latency = _connect_via(proxy, target, timeout)
+        except Exception:
+            self.record_failure(proxy)
+            raise
+        self.record_success(proxy, latency)
+        return sock
+
+    def start_health_checks(self, workers: int = 16):
+        if self.probe_target is None:
+            raise ValueError("probe_target is required for health checks")
+        if self._checker is not None:
+            return
+        self._stopped.clear()
+        self._checker = threading.Thread(target=self._check_health, args=(workers,),
+                                         name="proxy-pool-health", daemon=True)
+        self._checker.start()
+
+    def stop_health_checks(self):
+        self._stopped.set()
+        if self._checker is not None:
+            self._checker.join()
+            self._checker = None
+
+    def probe(self, proxy: Proxy) -> bool:
+        """Connects to probe_target through proxy and records the outcome."""
+        try:
+            sock, latency = _connect_via(proxy, self.probe_target, self.probe_timeout)
+        except Exception:
+            self.record_failure(proxy)
+            return False
+        sock.close()
+        self.record_success(proxy, latency)
+        return True
+
+    def _next_probe_batch(self) -> List[Proxy]:
+        with self._lock:
+            count = min(self.probe_batch, len(self._proxies))
+            if not count:
+                return []
+            start = self._probe_cursor % len(self._proxies)
+            self._probe_cursor = start + count
+            batch = self._proxies[start:start + count]
+            return batch + self._proxies[:count - len(batch)]
+
+    def _check_health(self, workers: int):
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="proxy-pool-probe") as executor:
+            while True:
+                list(executor.map(self.probe, self._next_probe_batch()))
+                if self._stopped.wait(self.probe_interval):
+                    return
+
+
+def _connect_via(proxy: Proxy, target: Tuple[str, int], timeout: float | None) -> Tuple[ProxiedSocket, float]:
+    started = time.perf_counter()
+    sock = create_tunnel(ProxyChain((proxy,)), timeout)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(target)
+        sock.settimeout(None)
+    except BaseException:
+        sock.close()
+        raise
+    return sock, time.perf_counter() - started
+
+
+__all__ = ("ProxyPool", "ProxyStats", "Selection")
@@ -0,0 +1,177 @@
+import selectors
+import socket
+import time
+from typing import Iterable, List, Sequence, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.exceptions import WantReadError, WantWriteError, AllChainsFailed
+from proxy_wrapper.proxied_socket import ProxiedSocket
+from proxy_wrapper.resolver import BackgroundLookups, Resolver, default_resolver, ip_family
+
+
+class _Attempt:
+    __slots__ = ("chain", "sock", "target", "deadline", "reconnects")
+
+    def __init__(self, chain: ProxyChain, target: Tuple[str, int]):
+        self.chain = chain
+        self.target = target
+        self.sock: ProxiedSocket | None = None  # Created once the family of the first hop is known
+        self.deadline: float | None = None  # Of the connection step waiting for I/O, see ConnectTimeouts
+        self.reconnects = 0  # sock.reconnects when it was registered
+
+    def open(self, family: int, resolver: Resolver):
+        self.sock = ProxiedSocket(family, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.sock.resolver = resolver
+        self.sock.add_chain(self.chain)
+
+    def step(self):
+        """Moves the connection forward. Raises WantReadError or WantWriteError if I/O is not ready."""
+        self.sock.perform_connection()
+        self.sock.connect(self.target)
+
+
+def _as_chain(chain: ProxyChain | Iterable[str]) -> ProxyChain:
+    return chain if isinstance(chain, ProxyChain) else ProxyChain(chain)
+
+
+def connect_fastest(target: Tuple[str, int], chains: Sequence[ProxyChain | Iterable[str]], *,
+                    stagger: float = 0.25, timeout: float | None = None, blocking: bool = True,
+                    resolver: Resolver | None = None) -> ProxiedSocket:
+    """
+    Connects to target through every chain and returns the socket which connected first.
+    The other connections are closed.
+
+    Chains are started one by one, stagger seconds apart, in the given order. When an attempt fails
+    the next chain is started at once. Use stagger=0 to start all of them together.
+    Host names of first hops are looked up with resolver (default_resolver) on threads.
+    ConnectTimeouts of the chains apply, an attempt which exceeds them fails with ProxyTimeoutError.
+    Raises AllChainsFailed if no chain connected and TimeoutError if timeout seconds passed.
+    """
+    if not chains:
+        raise ValueError("At least one chain is required")
+
+    pending: List[ProxyChain] = [_as_chain(chain) for chain in reversed(chains)]
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    next_start = time.monotonic()
+    errors: List[Tuple[ProxyChain, BaseException]] = []
+    attempts: List[_Attempt] = []
+    winner: _Attempt | None = None
+    resolver = resolver or default_resolver
+    lookups: BackgroundLookups | None = None
+
+    selector = selectors.DefaultSelector()
+
+    def fail(attempt: _Attempt, error: BaseException):
+        nonlocal next_start
+        errors.append((attempt.chain, error))
+        if attempt.sock is not None:
+            _unregister(selector, attempt)
+            attempt.sock.close()
+        attempts.remove(attempt)
+        next_start = time.monotonic()
+
+    def advance(attempt: _Attempt) -> bool:
+        try:
+            attempt.step()
+            return True
+        except WantReadError as e:
+            attempt.deadline = e.deadline
+            _register(selector, attempt, selectors.EVENT_READ)
+        except WantWriteError as e:
+            attempt.deadline = e.deadline
+            _register(selector, attempt, selectors.EVENT_WRITE)
+        except Exception as e:
+            fail(attempt, e)
+        return False
+
+    def opened(attempt: _Attempt, family: int) -> bool:
+        try:
+            attempt.open(family, resolver)
+        except Exception as e:
+            fail(attempt, e)
+            return False
+        return advance(attempt)
+
+    try:
+        while winner is None:
+            now = time.monotonic()
+            if pending and now >= next_start:
+                attempt = _Attempt(pending.pop(), target)
+                attempts.append(attempt)
+                next_start = now + stagger
+                host, port = attempt.chain[0].address
+                family = ip_family(host)
+                if family is None:
+                    if lookups is None:
+                        lookups = BackgroundLookups(resolver)
+                        selector.register(lookups, selectors.EVENT_READ, lookups)
+                    lookups.submit(attempt, host, port)
+                elif opened(attempt, family):
+                    winner = attempt
+                    break
+
+            if not attempts and not pending:
+                raise AllChainsFailed("All proxy chains failed to connect", errors)
+
+            wait = max(0.0, next_start - now) if pending else None
+            if deadline is not None:
+                if now >= deadline:
+                    raise TimeoutError(f"No proxy chain connected to {target} within {timeout} seconds")
+                wait = deadline - now if wait is None else min(wait, deadline - now)
+            step_deadline = min((attempt.deadline for attempt in attempts if attempt.deadline is not None),
+                                default=None)
+            if step_deadline is not None:
+                step_wait = max(0.0, step_deadline - now)
+                wait = step_wait if wait is None else min(wait, step_wait)
+
+            for key, _ in selector.select(wait):
+                if key.data is lookups:
+                    for attempt, family in lookups.finished():
+                        if family.exception() is not None:
+                            fail(attempt, family.exception())
+                        elif opened(attempt, family.result()):
+                            winner = attempt
+                            break
+                elif advance(key.data):
+                    winner = key.data
+                if winner is not None:
+                    break
+            if winner is None and step_deadline is not None:
+                # Steps past their deadline are run again, the socket raises ProxyTimeoutError for them
+                now = time.monotonic()
+                for attempt in [attempt for attempt in attempts if attempt.deadline is not None
+                                and attempt.deadline <= now]:
+                    if advance(attempt):
+                        winner = attempt
+                        break
+    finally:
+        selector.close()
+        if lookups is not None:
+            lookups.close()
+        for attempt in attempts:
+            if attempt is not winner and attempt.sock is not None:
+                attempt.sock.close()
+
+    winner.sock.setblocking(blocking)
+    return winner.sock
+
+
+def _register(selector: selectors.BaseSelector, attempt: _Attempt, events: int):
+    if attempt.reconnects != attempt.sock.reconnects:  # A new connection behind the same descriptor
+        attempt.reconnects = attempt.sock.reconnects
+        _unregister(selector, attempt)
+    try:
+        selector.modify(attempt.sock, events, attempt)
+    except KeyError:
+        selector.register(attempt.sock, events, attempt)
+
+
+def _unregister(selector: selectors.BaseSelector, attempt: _Attempt):
+    try:
+        selector.unregister(attempt.sock)
+    except KeyError:
+        pass
+
+
+__all__ = ("connect_fastest",)
@@ -0,0 +1,353 @@
+import asyncio
+import os
+import selectors
+import socket
+import ssl
+import threading
+from typing import Callable, Dict, Set
+
+from proxy_wrapper.aio import _wait_io
+
+BUFFER_SIZE = 65536
+_SPLICE_FLAGS = getattr(os, "SPLICE_F_MOVE", 0)
+_SPLICE_NONBLOCK = getattr(os, "SPLICE_F_NONBLOCK", 0)
+
+_WAIT_READ = 1  # Source must be readable
+_WAIT_WRITE = 2  # Destination must be writeable
+_DONE = 0
+
+
+def _has_tls_channel(sock: socket.socket) -> bool:
+    """ProxiedSocket with TLS to a proxy, its send() and recv() go through a TLSChannel."""
+    return getattr(sock, "_tls", None) is not None
+
+
+def can_splice(sock: socket.socket) -> bool:
+    """os.splice() moves bytes between plain sockets in the kernel (Linux only)."""
+    return hasattr(os, "splice") and not isinstance(sock, ssl.SSLSocket) and sock.type == socket.SOCK_STREAM \
+        and not _has_tls_channel(sock)
+
+
+class _Direction:
+    """
+    Moves bytes from src to dst until src reaches EOF, then shuts dst down for writing
+    (see _shutdown_dst() for ProxiedSockets with TLS).
+
+    pump() does as much as it can and returns what it waits for, so the same code runs on
+    blocking sockets (it returns once src is exhausted) and non-blocking ones. Bytes go through
+    a preallocated buffer with recv_into(), or through a pipe with os.splice() without ever
+    being copied to Python.
+    """
+
+    __slots__ = ("src", "dst", "count", "_buffer", "_view", "_start", "_end", "_pipe", "_in_pipe", "_eof",
+                 "_nonblocking", "_tls_dst", "_flushing", "done")
+
+    def __init__(self, src: socket.socket, dst: socket.socket, buffer_size: int, splice: bool):
+        self.src = src
+        self.dst = dst
+        self.count = 0
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = self._end = 0  # Buffered bytes not sent yet
+        self._pipe = os.pipe() if splice else None
+        self._in_pipe = 0  # Bytes in the pipe not spliced to dst yet
+        self._eof = False
+        self._nonblocking = not src.getblocking()
+        self._tls_dst = _has_tls_channel(dst)  # Its send() may keep a part of the records
+        self._flushing = False
+        self.done = False
+
+        # Bytes a ProxiedSocket read past a proxy reply are not in the kernel, send them from the buffer
+        if getattr(src, "_pushback", None):
+            self._end = src.recv_into(self._buffer)
+
+    def pump(self) -> int:
+        while True:
+            if self._start < self._end:
+                sent = self.dst.send(self._view[self._start:self._end])
+                self._start += sent
+                self.count += sent
+                continue
+            if self._in_pipe:
+                moved = os.splice(self._pipe[0], self.dst.fileno(), self._in_pipe, flags=_SPLICE_FLAGS)
+                self._in_pipe -= moved
+                self.count += moved
+                continue
+            if self._eof:
+                self._shutdown_dst()
+                self.close()
+                return _DONE
+
+            if self._tls_dst:
+                self._flushing = True
+                self.dst.send(b'')  # Records dst kept go out before src is waited for
+                self._flushing = False
+
+            self._start = self._end = 0
+            if self._pipe is not None:
+                flags = _SPLICE_FLAGS | (_SPLICE_NONBLOCK if self._nonblocking else 0)
+                received = os.splice(self.src.fileno(), self._pipe[1], len(self._buffer), flags=flags)
+                self._in_pipe = received
+            else:
+                received = self.src.recv_into(self._buffer)
+                self._end = received
+            if not received:
+                self._eof = True
+
+    def wait(self) -> int:
+        """Runs pump() on non-blocking sockets, I/O which is not ready is waited for."""
+        try:
+            return self.pump()
+        except BlockingIOError:
+            return _WAIT_WRITE if self._start < self._end or self._in_pipe or self._flushing or self._eof \
+                else _WAIT_READ
+
+    def _shutdown_dst(self):
+        if self._tls_dst:
+            # TLS has no half-close: proxies and servers end the session on close_notify or EOF, and the
+            # other direction with it. dst stays open until its peer closes, only the kept records go out.
+            self.dst.send(b'')
+            return
+        try:
+            self.dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass  # Already closed by the peer
+
+    def close(self):
+        self.done = True
+        if self._pipe is not None:
+            os.close(self._pipe[0])
+            os.close(self._pipe[1])
+            self._pipe = None
+        self._view.release()
+
+
+class RelayStats:
+    """Bytes relayed so far in each direction. error is set if the relay stopped because of it."""
+
+    __slots__ = ("_a_to_b", "_b_to_a", "error")
+
+    def __init__(self, a_to_b: _Direction, b_to_a: _Direction):
+        self._a_to_b = a_to_b
+        self._b_to_a = b_to_a
+        self.error: BaseException | None = None
+
+    @property
+    def a_to_b(self) -> int:
+        return self._a_to_b.count
+
+    @property
+    def b_to_a(self) -> int:
+        return self._b_to_a.count
+
+    @property
+    def done(self) -> bool:
+        return self._a_to_b.done and self._b_to_a.done
+
+    def __repr__(self) -> str:
+        return f"RelayStats(a_to_b={self.a_to_b}, b_to_a={self.b_to_a}, error={self.error!r})"
+
+
+def _directions(a: socket.socket, b: socket.socket, buffer_size: int, splice: bool | None):
+    if splice is None:
+        splice = can_splice(a) and can_splice(b)
+    return _Direction(a, b, buffer_size, splice), _Direction(b, a, buffer_size, splice)
+
+
+def _abort(stats: RelayStats, a: socket.socket, b: socket.socket, error: BaseException):
+    if stats.error is None:
+        stats.error = error
+    for sock in (a, b):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _finish(stats: RelayStats, a: socket.socket, b: socket.socket, close: bool):
+    for direction in (stats._a_to_b, stats._b_to_a):
+        if not direction.done:
+            direction.close()
+    if close:
+        a.close()
+        b.close()
+
+
+def relay(a: socket.socket, b: socket.socket, *, buffer_size: int = BUFFER_SIZE, splice: bool | None = None,
+          close: bool = True) -> RelayStats:
+    """
+    Relays bytes between blocking sockets a and b until both directions reach EOF.
+    A direction which reaches EOF shuts its destination down for writing, the other one goes on.
+    A ProxiedSocket with TLS is not shut down, the relay goes on until its peer closes.
+
+    b to a is relayed in a helper thread, or in this one with a RelayHub when a socket carries TLS with
+    a proxy (ProxiedSocket). splice=None uses os.splice() when both sockets allow it.
+    Sockets are closed at the end unless close is False.
+    """
+    if not a.getblocking() or not b.getblocking() or a.gettimeout() is not None or b.gettimeout() is not None:
+        raise ValueError("relay() requires blocking sockets without timeout, use relay_async() or RelayHub")
+    if _has_tls_channel(a) or _has_tls_channel(b):
+        # A TLS channel must not be sent to and received from by two threads, both directions run in this one
+        hub = RelayHub(buffer_size=buffer_size, splice=False)
+        try:
+            stats = hub.add(a, b, close=close)
+            hub.run()
+        finally:
+            hub.close()
+            if not close:
+                a.setblocking(True)
+                b.setblocking(True)
+        return stats
+
+    a_to_b, b_to_a = _directions(a, b, buffer_size, splice)
+    stats = RelayStats(a_to_b, b_to_a)
+
+    def run(direction: _Direction):
+        try:
+            direction.pump()
+        except OSError as e:
+            _abort(stats, a, b, e)
+
+    helper = threading.Thread(target=run, args=(b_to_a,), name="relay", daemon=True)
+    helper.start()
+    try:
+        run(a_to_b)
+    finally:
+        helper.join()
+        _finish(stats, a, b, close)
+    return stats
+
+
+async def relay_async(a: socket.socket, b: socket.socket, *, buffer_size: int = BUFFER_SIZE,
+                      splice: bool | None = None, close: bool = True) -> RelayStats:
+    """relay() on the running event loop. Sockets are switched to non-blocking mode."""
+    loop = asyncio.get_running_loop()
+    a.setblocking(False)
+    b.setblocking(False)
+    a_to_b, b_to_a = _directions(a, b, buffer_size, splice)
+    stats = RelayStats(a_to_b, b_to_a)
+
+    async def run(direction: _Direction):
+        try:
+            while True:
+                waiting = direction.wait()
+                if waiting == _DONE:
+                    return
+                if waiting == _WAIT_READ:
+                    await _wait_io(direction.src.fileno(), loop.add_reader, loop.remove_reader)
+                else:
+                    await _wait_io(direction.dst.fileno(), loop.add_writer, loop.remove_writer)
+        except OSError as e:
+            _abort(stats, a, b, e)
+
+    try:
+        await asyncio.gather(run(a_to_b), run(b_to_a))
+    finally:
+        _finish(stats, a, b, close)
+    return stats
+
+
+class _Pair:
+    __slots__ = ("a", "b", "stats", "close", "on_done", "events")
+
+    def __init__(self, a: socket.socket, b: socket.socket, stats: RelayStats, close: bool,
+                 on_done: Callable[[RelayStats], None] | None):
+        self.a = a
+        self.b = b
+        self.stats = stats
+        self.close = close
+        self.on_done = on_done
+        self.events: Dict[socket.socket, int] = {a: 0, b: 0}
+
+
+class RelayHub:
+    """
+    Relays any number of socket pairs from one thread with selectors (epoll, kqueue...).
+
+    Usage:
+        hub = RelayHub()
+        hub.add(client, proxied)
+        hub.run()  # Returns when every relay is finished
+    """
+
+    def __init__(self, *, buffer_size: int = BUFFER_SIZE, splice: bool | None = None):
+        self.buffer_size = buffer_size
+        self.splice = splice
+        self._selector = selectors.DefaultSelector()
+        self._pairs: Set[_Pair] = set()
+
+    def add(self, a: socket.socket, b: socket.socket, *, close: bool = True,
+            on_done: Callable[[RelayStats], None] | None = None) -> RelayStats:
+        """Starts relaying between a and b. on_done is called with the stats when the relay is finished."""
+        a.setblocking(False)
+        b.setblocking(False)
+        a_to_b, b_to_a = _directions(a, b, self.buffer_size, self.splice)
+        pair = _Pair(a, b, RelayStats(a_to_b, b_to_a), close, on_done)
+        self._pairs.add(pair)
+        self._advance(pair)
+        return pair.stats
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def run(self, timeout: float | None = None):
+        """Relays until every pair is finished, or for at most timeout seconds per wait."""
+        while self._pairs:
+            ready = self._selector.select(timeout)
+            if not ready and timeout is not None:
+                return
+            for key, _ in ready:
+                pair = key.data
+                if pair in self._pairs:
+                    self._advance(pair)
+
+    def close(self):
+        for pair in list(self._pairs):
+            self._end(pair)
+        self._selector.close()
+
+    def _advance(self, pair: _Pair):
+        stats = pair.stats
+        wanted = {pair.a: 0, pair.b: 0}
+        for direction in (stats._a_to_b, stats._b_to_a):
+            if direction.done:
+                continue
+            try:
+                waiting = direction.wait()
+            except OSError as e:
+                _abort(stats, pair.a, pair.b, e)
+                self._end(pair)
+                return
+            if waiting == _WAIT_READ:
+                wanted[direction.src] |= selectors.EVENT_READ
+            elif waiting == _WAIT_WRITE:
+                wanted[direction.dst] |= selectors.EVENT_WRITE
+
+        if stats.done:
+            self._end(pair)
+            return
+        for sock, events in wanted.items():
+            self._listen(pair, sock, events)
+
+    def _listen(self, pair: _Pair, sock: socket.socket, events: int):
+        registered = pair.events[sock]
+        if registered == events:
+            return
+        if not events:
+            self._selector.unregister(sock)
+        elif registered:
+            self._selector.modify(sock, events, pair)
+        else:
+            self._selector.register(sock, events, pair)
+        pair.events[sock] = events
+
+    def _end(self, pair: _Pair):
+        for sock in (pair.a, pair.b):
+            self._listen(pair, sock, 0)
+        self._pairs.discard(pair)
+        _finish(pair.stats, pair.a, pair.b, pair.close)
+        if pair.on_done is not None:
+            pair.on_done(pair.stats)
+
+
+__all__ = ("relay", "relay_async", "RelayHub", "RelayStats", "can_splice", "BUFFER_SIZE")
@@ -0,0 +1,178 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Hashable, List, Tuple
+
+_Address = Tuple[int, tuple]  # (family, sockaddr)
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def ip_family(host: str) -> int | None:
+    """AF_INET or AF_INET6 for IP addresses, None for host names which need a lookup."""
+    try:
+        return socket.AF_INET6 if ipaddress.ip_address(host).version == 6 else socket.AF_INET
+    except ValueError:
+        return None
+
+
+class Resolver(ABC):
+    """Resolves host names for proxy hops and, with DNSPolicy.LOCAL, for targets."""
+
+    @abstractmethod
+    def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]: ...
+
+    async def resolve_async(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.resolve, host, port, family)
+
+
+class SystemResolver(Resolver):
+    def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]:
+        return [(info[0], info[4]) for info in socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)]
+
+    async def resolve_async(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=family, type=socket.SOCK_STREAM)
+        return [(info[0], info[4]) for info in infos]
+
+
+class CachingResolver(Resolver):
+    """
+    Caches results of another resolver for ttl seconds. At most max_size names are kept,
+    least recently used are evicted first. Results are cached per (host, family), port is
+    substituted on every lookup. Thread safe.
+    """
+
+    def __init__(self, resolver: Resolver | None = None, *, ttl: float = 300.0, max_size: int = 1024):
+        self.resolver = resolver or SystemResolver()
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: OrderedDict[Tuple[str, int], Tuple[float, List[_Address]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]:
+        cached = self._get(host, port, family)
+        if cached is not None:
+            return cached
+        return self._put(host, port, family, self.resolver.resolve(host, port, family))
+
+    async def resolve_async(self, host: str, port: int, family: int = socket.AF_UNSPEC) -> List[_Address]:
+        cached = self._get(host, port, family)
+        if cached is not None:
+            return cached
+        return self._put(host, port, family, await self.resolver.resolve_async(host, port, family))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _get(self, host: str, port: int, family: int) -> List[_Address] | None:
+        key = (host, family)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+        return [(family_, (sockaddr[0], port) + sockaddr[2:]) for family_, sockaddr in entry[1]]
+
+    def _put(self, host: str, port: int, family: int, addresses: List[_Address]) -> List[_Address]:
+        with self._lock:
+            self._cache[(host, family)] = (time.monotonic() + self.ttl, addresses)
+            self._cache.move_to_end((host, family))
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return addresses
+
+
+default_resolver = CachingResolver()
+
+
+class BackgroundLookups:
+    """
+    Looks up families of first hops on threads for connectors driven by a selector, so a slow
+    lookup does not stall the other connections. Register the object for reading: it becomes
+    readable when lookups finish, take them with .finished().
+
+    The lookup the socket does for the same host name with the found family is made too,
+    so a CachingResolver answers it from its cache.
+    """
+
+    def __init__(self, resolver: Resolver, workers: int = 4):
+        self.resolver = resolver
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lookups")
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._finished: Deque[Tuple[Hashable, Future]] = deque()
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def submit(self, tag: Hashable, host: str, port: int):
+        """Starts looking up host, its (tag, future of the family) pair is returned by .finished() later."""
+        future = self._executor.submit(self._family, host, port)
+        future.add_done_callback(lambda done: self._done(tag, done))
+
+    def finished(self) -> List[Tuple[Hashable, Future]]:
+        try:
+            while self._reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        result = []
+        while self._finished:
+            result.append(self._finished.popleft())
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._reader.close()
+        self._writer.close()
+
+    def _family(self, host: str, port: int) -> int:
+        family, _ = self.resolver.resolve(host, port)[0]
+        self.resolver.resolve(host, port, family)
+        return family
+
+    def _done(self, tag: Hashable, future: Future):
+        self._finished.append((tag, future))
+        try:
+            self._writer.send(b"\0")
+        except OSError:
+            pass  # The wake up byte of an earlier lookup is still there, or the lookups are closed
+
+
+def resolve_address(address: Tuple[str, int], family: int = socket.AF_UNSPEC,
+                    resolver: Resolver | None = None) -> Tuple[str, int]:
+    """Returns (ip, port) of address. IP addresses are returned as is."""
+    host, port = address
+    if is_ip_address(host):
+        return address
+    _, sockaddr = (resolver or default_resolver).resolve(host, port, family)[0]
+    return sockaddr[0], port
+
+
+async def resolve_address_async(address: Tuple[str, int], family: int = socket.AF_UNSPEC,
+                                resolver: Resolver | None = None) -> Tuple[str, int]:
+    host, port = address
+    if is_ip_address(host):
+        return address
+    _, sockaddr = (await (resolver or default_resolver).resolve_async(host, port, family))[0]
+    return sockaddr[0], port
+
+
+__all__ = ("Resolver", "SystemResolver", "CachingResolver", "default_resolver", "resolve_address",
+           "resolve_address_async", "is_ip_address", "ip_family", "BackgroundLookups")
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import socket
+from typing import Dict, Set, Tuple
+
+from proxy_wrapper.aio import open_proxied_connection
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.protocols.socks5.enums import SocksVersion, Method, Command, ATYP, ReplyStatus
+from proxy_wrapper.protocols.socks5.exceptions import ProxyConnectionError
+
+logger = logging.getLogger(__name__)
+
+HEAD_TERMINATOR = b'\r\n\r\n'
+
+
+class _RequestError(Exception):
+    """Client request which can not be served. reply is sent to the client as is."""
+
+    def __init__(self, message: str, reply: bytes):
+        super().__init__(message)
+        self.reply = reply
+
+
+def socks5_reply(status: ReplyStatus) -> bytes:
+    return bytes([SocksVersion.SOCKS5, status, 0x00, ATYP.IPV4]) + bytes(6)
+
+
+def http_reply(status: str) -> bytes:
+    return f"HTTP/1.1 {status}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode()
+
+
+def _socks5_status(error: BaseException) -> ReplyStatus:
+    if isinstance(error, ProxyConnectionError) and error.status is not None:
+        return error.status  # The upstream SOCKS5 proxy's reason is passed on
+    if isinstance(error, ConnectionRefusedError):
+        return ReplyStatus.CONNECTION_REFUSED
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return ReplyStatus.TTL_EXPIRED
+    if isinstance(error, socket.gaierror):
+        return ReplyStatus.HOST_UNREACHABLE
+    return ReplyStatus.GENERAL_FAILURE
+
+
+def _http_status(error: BaseException) -> str:
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "504 Gateway Timeout"
+    return "502 Bad Gateway"
+
+
+def parse_host_port(value: str) -> Tuple[str, int]:
+    """Parses host:port, IPv6 hosts are written in brackets: [::1]:1080"""
+    host, separator, port = value.rpartition(":")
+    if not separator or not port.isdigit():
+        raise ValueError(f"Expected host:port, got {value!r}")
+    if not 0 < int(port) <= 65535:
+        raise ValueError(f"Port must be in 1..65535, got {value!r}")
+    if host.startswith("[") and host.endswith("]"):
+        host = host[1:-1]
+    return host, int(port)
+
+
+class ServerStats:
+    """Counters of a ProxyServer. Bytes are counted when they are written to the other side."""
+
+    __slots__ = ("connections", "active", "rejected", "upstream_errors", "bytes_up", "bytes_down")
+
+    def __init__(self):
+        self.connections = 0  # Accepted clients
+        self.active = 0  # Clients being served now
+        self.rejected = 0  # Invalid or unsupported requests
+        self.upstream_errors = 0  # Failed tunnels
+        self.bytes_up = 0  # Client to upstream
+        self.bytes_down = 0  # Upstream to client
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class ProxyServer:
+    """
+    Local SOCKS5 (no authentication) and HTTP CONNECT proxy which opens every upstream
+    tunnel through chain.
+
+    Both directions are relayed through streams with buffers of at most limit bytes: reading
+    from one side waits until the other side drained what was written, so a slow peer
+    slows its counterpart down instead of growing buffers.
+
+    Usage:
+        server = ProxyServer(ProxyChain.from_urls("socks5://10.0.0.1:1080", "http://10.0.0.2:3128"))
+        asyncio.run(server.serve_forever("127.0.0.1", 1080))
+    """
+
+    def __init__(self, chain: ProxyChain, *, limit: int = 2 ** 16, handshake_timeout: float = 10.0,
+                 connect_timeout: float = 30.0):
+        self.chain = chain
+        self.limit = limit
+        self.handshake_timeout = handshake_timeout
+        self.connect_timeout = connect_timeout
+        self.stats = ServerStats()
+        self._idle = asyncio.Event()  # Set when no client is being served
+        self._writers: Set[asyncio.StreamWriter] = set()  # Client and upstream connections being served
+
+    async def start(self, host: str, port: int, **kwargs) -> asyncio.AbstractServer:
+        """Starts listening. kwargs are passed to asyncio.start_server()."""
+        return await asyncio.start_server(self.handle, host, port, limit=self.limit, **kwargs)
+
+    async def serve_forever(self, host: str, port: int, **kwargs):
+        server = await self.start(host, port, **kwargs)
+        async with server:
+            await server.serve_forever()
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """
+        Waits until every client being served is finished, at most timeout seconds.
+        Close the listening server first. Returns False if clients are still served.
+        """
+        if not self.stats.active:
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def abort(self):
+        """Aborts the connections of every client being served, e.g. when drain() timed out."""
+        for writer in list(self._writers):
+            writer.transport.abort()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats.connections += 1
+        self.stats.active += 1
+        self._idle.clear()
+        self._writers.add(writer)
+        try:
+            first = await asyncio.wait_for(reader.readexactly(1), self.handshake_timeout)
+            if first[0] == SocksVersion.SOCKS5:
+                await self._handle_socks5(reader, writer)
+            else:
+                await self._handle_http(first, reader, writer)
+        except _RequestError as e:
+            logger.debug("Rejected request from %s: %s", writer.get_extra_info("peername"), e)
+            if isinstance(e.__cause__, Exception):
+                self.stats.upstream_errors += 1
+            else:
+                self.stats.rejected += 1
+            writer.write(e.reply)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            await _close(writer)
+            self.stats.active -= 1
+            if not self.stats.active:
+                self._idle.set()
+
+    async def _handle_socks5(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        host, port = await asyncio.wait_for(self._read_socks5_request(reader, writer), self.handshake_timeout)
+        try:
+            upstream = await self._open_upstream((host, port))
+        except Exception as e:
+            raise _RequestError(f"Upstream connection to {host}:{port} failed: {e!r}",
+                                socks5_reply(_socks5_status(e))) from e
+        writer.write(socks5_reply(ReplyStatus.SUCCESS))
+        await self._relay(reader, writer, *upstream)
+
+    async def _read_socks5_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+                                   ) -> Tuple[str, int]:
+        nmethods = (await reader.readexactly(1))[0]
+        methods = await reader.readexactly(nmethods)
+        if Method.NO_AUTHENTICATION_REQUIRED not in methods:
+            raise _RequestError("No acceptable methods",
+                                bytes([SocksVersion.SOCKS5, Method.NO_ACCEPTABLE_METHODS]))
+        writer.write(bytes([SocksVersion.SOCKS5, Method.NO_AUTHENTICATION_REQUIRED]))
+
+        version, command, _, atyp = await reader.readexactly(4)
+        if version != SocksVersion.SOCKS5:
+            raise _RequestError(f"Unsupported version {version}", socks5_reply(ReplyStatus.GENERAL_FAILURE))
+        if atyp == ATYP.IPV4:
+            host = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+        elif atyp == ATYP.IPV6:
+            host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+        elif atyp == ATYP.DOMAIN_NAME:
+            domain = await reader.readexactly((await reader.readexactly(1))[0])
+            try:
+                host = domain.decode()
+            except UnicodeDecodeError:
+                raise _RequestError(f"Domain name {domain!r} is not UTF-8",
+                                    socks5_reply(ReplyStatus.GENERAL_FAILURE)) from None
+        else:
+            raise _RequestError(f"Unsupported address type {atyp}",
+                                socks5_reply(ReplyStatus.ADDRESS_TYPE_NOT_SUPPORTED))
+        port = int.from_bytes(await reader.readexactly(2), "big")
+        if command != Command.CONNECT:
+            raise _RequestError(f"Unsupported command {command}", socks5_reply(ReplyStatus.COMMAND_NOT_SUPPORTED))
+        return host, port
+
+    async def _handle_http(self, first: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        address = await asyncio.wait_for(self._read_http_request(first, reader), self.handshake_timeout)
+        try:
+            upstream = await self._open_upstream(address)
+        except Exception as e:
+            raise _RequestError(f"Upstream connection to {address} failed: {e!r}", http_reply(_http_status(e))) from e
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await self._relay(reader, writer, *upstream)
+
+    async def _read_http_request(self, first: bytes, reader: asyncio.StreamReader) -> Tuple[str, int]:
+        try:
+            head = first + await reader.readuntil(HEAD_TERMINATOR)
+        except asyncio.LimitOverrunError:
+            raise _RequestError("Request head is too large", http_reply("431 Request Header Fields Too Large"))
+
+        method, _, rest = head.split(b"\r\n", 1)[0].decode("latin-1").partition(" ")
+        target, _, _ = rest.partition(" ")
+        if method.upper() != "CONNECT":
+            raise _RequestError(f"Unsupported method {method}", http_reply("501 Not Implemented"))
+        try:
+            return parse_host_port(target)
+        except ValueError as e:
+            raise _RequestError(str(e), http_reply("400 Bad Request"))
+
+    async def _open_upstream(self, address: Tuple[str, int]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.wait_for(open_proxied_connection(address, self.chain, limit=self.limit),
+                                      self.connect_timeout)
+
+    async def _relay(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter,
+                     upstream_reader: asyncio.StreamReader, upstream_writer: asyncio.StreamWriter):
+        self._writers.add(upstream_writer)
+        try:
+            await asyncio.gather(self._pipe(client_reader, upstream_writer, upstream=True),
+                                 self._pipe(upstream_reader, client_writer, upstream=False))
+        finally:
+            self._writers.discard(upstream_writer)
+            await _close(upstream_writer)
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, upstream: bool):
+        """Copies reader to writer, waits for writer to drain before reading more. EOF is passed on."""
+        try:
+            while True:
+                data = await reader.read(self.limit)
+                if not data:
+                    break
+                writer.write(data)
+                if upstream:
+                    self.stats.bytes_up += len(data)
+                else:
+                    self.stats.bytes_down += len(data)
+                await writer.drain()
+            if writer.can_write_eof() and not writer.is_closing():
+                writer.write_eof()
+        except ConnectionError:
+            writer.transport.abort()
+
+
+async def _close(writer: asyncio.StreamWriter):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
+
+
+__all__ = ("ProxyServer", "ServerStats", "parse_host_port", "socks5_reply", "http_reply")
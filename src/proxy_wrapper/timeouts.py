@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+
+from proxy_wrapper.enums import ConnectPhase
+
+_HANDSHAKE_PHASES = (ConnectPhase.SOCKS5_HELLO, ConnectPhase.SOCKS5_AUTH, ConnectPhase.TLS_HANDSHAKE,
+                     ConnectPhase.TARGET_TLS)
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectTimeouts:
+    """
+    Limits in seconds for building a tunnel, None means no limit.
+
+    tcp_connect - TCP connection to the first proxy
+    handshake - every SOCKS5 hello and authentication exchange, every TLS handshake with an HTTPS proxy
+                or the target (start_tls())
+    request - every request to connect to the next proxy or the target, until its reply
+    total - everything from the first step of perform_connection() until connect() to the target
+            is done. Do not use it for tunnels which wait in a pool before connect() is called.
+
+    Expired limits raise ProxyTimeoutError in blocking, non-blocking and asyncio modes.
+    """
+    tcp_connect: float | None = None
+    handshake: float | None = None
+    request: float | None = None
+    total: float | None = None
+
+    def __post_init__(self):
+        for name in ("tcp_connect", "handshake", "request", "total"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} timeout must be positive, got {value}")
+
+    def for_phase(self, phase: ConnectPhase) -> float | None:
+        if phase is ConnectPhase.TCP_CONNECT:
+            return self.tcp_connect
+        if phase in _HANDSHAKE_PHASES:
+            return self.handshake
+        return self.request
+
+
+__all__ = ("ConnectTimeouts",)
@@ -0,0 +1,295 @@
+import asyncio
+import ssl
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+
+TLS_READ_SIZE = 16384  # The largest TLS record
+TLS_RECORD_SIZE = 16384  # Plaintext of the largest TLS record
+
+_default_context: ssl.SSLContext | None = None
+
+
+def default_tls_context() -> ssl.SSLContext:
+    """Context for HTTPS proxies of sockets without tls_context. Certificates and host names are verified."""
+    global _default_context
+    if _default_context is None:
+        _default_context = ssl.create_default_context()
+    return _default_context
+
+
+class TLSSessionCache:
+    """
+    Last session of every HTTPS proxy, so the next connection resumes it (TLS 1.2 session id or
+    TLS 1.3 ticket) instead of running a full handshake. Sessions can be resumed only with the
+    SSLContext which created them, so they are kept per context. Thread safe.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size  # Proxies per context
+        self._sessions: "weakref.WeakKeyDictionary[ssl.SSLContext, OrderedDict]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self, context: ssl.SSLContext, address: Tuple[str, int]) -> ssl.SSLSession | None:
+        with self._lock:
+            sessions = self._sessions.get(context)
+            return sessions.get(address) if sessions is not None else None
+
+    def put(self, context: ssl.SSLContext, address: Tuple[str, int], session: ssl.SSLSession):
+        with self._lock:
+            sessions = self._sessions.get(context)
+            if sessions is None:
+                sessions = self._sessions[context] = OrderedDict()
+            sessions[address] = session
+            sessions.move_to_end(address)
+            if len(sessions) > self.max_size:
+                sessions.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+default_session_cache = TLSSessionCache()
+
+
+class _Layer:
+    __slots__ = ("obj", "incoming", "outgoing", "context", "address")
+
+    def __init__(self, context: ssl.SSLContext, address: Tuple[str, int], server_hostname: str,
+                 session: ssl.SSLSession | None):
+        self.incoming = ssl.MemoryBIO()
+        self.outgoing = ssl.MemoryBIO()
+        self.obj = context.wrap_bio(self.incoming, self.outgoing, server_hostname=server_hostname, session=session)
+        self.context = context
+        self.address = address  # Of the proxy, the session cache key
+
+
+class TLSChannel:
+    """
+    Sans-IO stack of TLS sessions over one connection, a layer per HTTPS proxy of the chain.
+    The first layer is the outermost one, records of the later layers are tunneled through it.
+
+    Bytes from the socket are passed to .feed() and the plaintext is taken with .read(),
+    plaintext is passed to .encrypt() and the bytes for the socket are taken from .data_to_send().
+    The layer added last runs its handshake with .handshake() before it carries any data.
+    """
+
+    __slots__ = ("_layers", "_plaintext", "handshaking", "eof", "outgoing")
+
+    def __init__(self):
+        self._layers: List[_Layer] = []
+        self._plaintext = bytearray()
+        self.handshaking = False  # The last layer has not finished its handshake yet
+        self.eof = False  # A proxy closed its TLS session, nothing more can be received
+        self.outgoing = bytearray()  # Bytes for the socket which it did not take yet
+
+    @property
+    def layers(self) -> Tuple[ssl.SSLObject, ...]:
+        return tuple(layer.obj for layer in self._layers)
+
+    def add_layer(self, context: ssl.SSLContext, address: Tuple[str, int], server_hostname: str,
+                  session: ssl.SSLSession | None = None):
+        if self.handshaking:
+            raise RuntimeError("TLS handshake of the previous layer is not done")
+        self._layers.append(_Layer(context, address, server_hostname, session))
+        self.handshaking = True
+
+    def handshake(self) -> bool:
+        """Advances the handshake of the last layer, returns True once it is done."""
+        layer = self._layers[-1]
+        try:
+            layer.obj.do_handshake()
+        except ssl.SSLWantReadError:
+            return False
+        self.handshaking = False
+        self._plaintext += self._read_layer(layer)  # Records which came with the end of the handshake
+        return True
+
+    def feed(self, data: bytes):
+        last = len(self._layers) - 1
+        for index, layer in enumerate(self._layers):
+            layer.incoming.write(data)
+            if index == last and self.handshaking:
+                return
+            data = self._read_layer(layer)
+            if not data:
+                return
+        self._plaintext += data
+
+    def feed_last_layer(self, data: bytes):
+        """Passes bytes which the outer layers decrypted before the last layer was added to it."""
+        layer = self._layers[-1]
+        layer.incoming.write(data)
+        if not self.handshaking:
+            self._plaintext += self._read_layer(layer)
+
+    def read(self, size: int) -> bytes:
+        data = bytes(self._plaintext[:size])
+        del self._plaintext[:size]
+        return data
+
+    def pending(self) -> int:
+        """Plaintext bytes received and decrypted, but not read yet."""
+        return len(self._plaintext)
+
+    def encrypt(self, data):
+        view = memoryview(data)
+        obj = self._layers[-1].obj
+        while view:
+            view = view[obj.write(view):]
+
+    def data_to_send(self) -> bytes:
+        data = b''
+        for layer in reversed(self._layers):
+            if data:
+                view = memoryview(data)
+                while view:
+                    view = view[layer.obj.write(view):]
+            data = layer.outgoing.read()
+        return data
+
+    def sessions(self) -> Iterator[Tuple[ssl.SSLContext, Tuple[str, int], ssl.SSLSession]]:
+        """Sessions worth resuming later: TLS 1.3 ones are resumable only after their ticket has arrived."""
+        for index, layer in enumerate(self._layers):
+            if self.handshaking and index == len(self._layers) - 1:
+                return
+            session = layer.obj.session
+            if session is not None and (session.has_ticket or layer.obj.version() != "TLSv1.3"):
+                yield layer.context, layer.address, session
+
+    def _read_layer(self, layer: _Layer) -> bytes:
+        chunks = []
+        while True:
+            try:
+                chunk = layer.obj.read(TLS_READ_SIZE)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                break
+            except ssl.SSLZeroReturnError:
+                self.eof = True
+                break
+            if not chunk:
+                self.eof = True
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+
+class _ChannelTransport(asyncio.Transport):
+    """
+    Transport which encrypts writes with a TLSChannel and passes them to the socket's transport.
+    loop.start_tls() (StreamWriter.start_tls()) can add TLS with the target on top of it.
+    """
+
+    _start_tls_compatible = True
+
+    def __init__(self, raw: asyncio.Transport, channel: TLSChannel, wrapper: "_ChannelProtocol"):
+        super().__init__()
+        self._raw = raw
+        self._channel = channel
+        self._wrapper = wrapper
+
+    def set_protocol(self, protocol: asyncio.BaseProtocol):
+        self._wrapper.app_protocol = protocol
+
+    def get_protocol(self) -> asyncio.BaseProtocol:
+        return self._wrapper.app_protocol
+
+    def write(self, data):
+        self._channel.encrypt(data)
+        self.flush()
+
+    def flush(self):
+        wire = self._channel.data_to_send()
+        if wire:
+            self._raw.write(wire)
+
+    def get_extra_info(self, name, default=None):
+        if name == "tls_layers":
+            return self._channel.layers
+        return self._raw.get_extra_info(name, default)
+
+    def is_closing(self) -> bool:
+        return self._raw.is_closing()
+
+    def close(self):
+        self._raw.close()
+
+    def abort(self):
+        self._raw.abort()
+
+    def can_write_eof(self) -> bool:
+        return False  # Half closing the socket would cut every TLS session
+
+    def pause_reading(self):
+        self._raw.pause_reading()
+
+    def resume_reading(self):
+        self._raw.resume_reading()
+
+    def is_reading(self) -> bool:
+        return self._raw.is_reading()
+
+    def get_write_buffer_size(self) -> int:
+        return self._raw.get_write_buffer_size()
+
+    def get_write_buffer_limits(self):
+        return self._raw.get_write_buffer_limits()
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        self._raw.set_write_buffer_limits(high, low)
+
+
+class _ChannelProtocol(asyncio.Protocol):
+    """Decrypts what the socket's transport receives for app_protocol, see aio.open_streams()."""
+
+    def __init__(self, channel: TLSChannel, app_protocol: asyncio.BaseProtocol):
+        self._channel = channel
+        self.app_protocol = app_protocol
+        self.transport: _ChannelTransport | None = None
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = _ChannelTransport(transport, self._channel, self)
+        if self._channel.outgoing:
+            transport.write(bytes(self._channel.outgoing))
+            self._channel.outgoing.clear()
+        self.app_protocol.connection_made(self.transport)
+
+    def data_received(self, data: bytes):
+        self._channel.feed(data)
+        self.transport.flush()  # Replies of the TLS layers themselves, e.g. key updates
+        plaintext = self._channel.read(self._channel.pending())
+        if plaintext and isinstance(self.app_protocol, asyncio.BufferedProtocol):
+            self._feed_buffered(plaintext)  # E.g. SSLProtocol of loop.start_tls()
+        elif plaintext:
+            self.app_protocol.data_received(plaintext)
+        if self._channel.eof:
+            self.transport.close()
+
+    def _feed_buffered(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            buffer = self.app_protocol.get_buffer(len(view))
+            size = min(len(buffer), len(view))
+            if not size:
+                raise RuntimeError("get_buffer() returned an empty buffer")
+            buffer[:size] = view[:size]
+            self.app_protocol.buffer_updated(size)
+            view = view[size:]
+
+    def eof_received(self):
+        self.app_protocol.eof_received()
+        return False
+
+    def connection_lost(self, exc):
+        self.app_protocol.connection_lost(exc)
+
+    def pause_writing(self):
+        self.app_protocol.pause_writing()
+
+    def resume_writing(self):
+        self.app_protocol.resume_writing()
+
+
+__all__ = ("TLSChannel", "TLSSessionCache", "default_session_cache", "default_tls_context", "TLS_READ_SIZE")
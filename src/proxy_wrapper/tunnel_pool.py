@@ -0,0 +1,209 @@
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Deque, Tuple
+
+from proxy_wrapper.chain import ProxyChain
+from proxy_wrapper.proxied_socket import ProxiedSocket
+from proxy_wrapper.resolver import default_resolver
+
+
+class _IdleTunnel:
+    __slots__ = ("sock", "idle_since")
+
+    def __init__(self, sock: ProxiedSocket):
+        self.sock = sock
+        self.idle_since = time.monotonic()
+
+
+def create_tunnel(chain: ProxyChain, timeout: float | None = None) -> ProxiedSocket:
+    """
+    Connects a blocking ProxiedSocket through every hop of chain, the last one is left
+    ready for connect(target).
+    """
+    host, port = chain[0].address
+    family, _ = default_resolver.resolve(host, port)[0]
+    sock = ProxiedSocket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.add_chain(chain)
+        sock.perform_connection()
+        sock.settimeout(None)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def is_alive(sock: ProxiedSocket) -> bool:
+    """
+    Checks that an idle tunnel was not closed by a proxy.
+    An idle tunnel must not receive anything, so any data means it is broken too.
+    """
+    if sock.fileno() == -1:
+        return False
+
+    blocking = sock.getblocking()
+    timeout = sock.gettimeout()
+    try:
+        sock.setblocking(False)
+        sock.recv(1, socket.MSG_PEEK)
+        return False
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        if sock.fileno() != -1 and blocking:
+            sock.settimeout(timeout)
+
+
+class TunnelPool:
+    """
+    Keeps tunnels connected up to the last hop of their chains, so getting a connection
+    to a target costs only the final CONNECT.
+
+    Chains passed to warm() are refilled in background up to size tunnels each. Tunnels idle
+    for more than max_idle seconds or closed by a proxy are dropped every probe_interval seconds.
+    At most max_total idle tunnels are kept for all chains.
+
+    Usage:
+        with TunnelPool(size=8) as pool:
+            pool.warm(chain)
+            sock = pool.connect(chain, ("example.com", 443))
+    """
+
+    def __init__(self, size: int = 4, *, max_total: int | None = None, max_idle: float = 60.0,
+                 probe_interval: float = 5.0, timeout: float | None = 10.0, workers: int = 4):
+        if size < 1:
+            raise ValueError("size must be positive")
+        self.size = size
+        self.max_total = max_total
+        self.max_idle = max_idle
+        self.probe_interval = probe_interval
+        self.timeout = timeout
+
+        self._idle: Dict[ProxyChain, Deque[_IdleTunnel]] = {}
+        self._building: Dict[ProxyChain, int] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tunnel-pool")
+        self._maintainer = threading.Thread(target=self._maintain, name="tunnel-pool-maintainer", daemon=True)
+        self._maintainer.start()
+
+    def warm(self, chain: ProxyChain):
+        """Starts keeping size tunnels ready for chain."""
+        with self._lock:
+            self._idle.setdefault(chain, deque())
+            self._building.setdefault(chain, 0)
+        self._refill(chain)
+
+    def get(self, chain: ProxyChain, timeout: float | None = None) -> ProxiedSocket:
+        """
+        Returns a blocking socket connected to the last hop of chain.
+        A warm tunnel is used if there is a live one, else a new tunnel is built in the calling thread.
+        timeout overrides the pool timeout for building it.
+        """
+        if self._closed.is_set():
+            raise RuntimeError("Tunnel pool is closed")
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(chain)
+                tunnel = idle.pop() if idle else None
+            if tunnel is None:
+                break
+            if is_alive(tunnel.sock):
+                self._refill(chain)
+                return tunnel.sock
+            tunnel.sock.close()
+
+        self._refill(chain)
+        return create_tunnel(chain, self.timeout if timeout is None else timeout)
+
+    def connect(self, chain: ProxyChain, target: Tuple[str, int], timeout: float | None = None) -> ProxiedSocket:
+        """Connects a tunnel from get() to target. timeout overrides the pool timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        sock = self.get(chain, timeout)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(target)
+            sock.settimeout(None)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def idle_count(self, chain: ProxyChain | None = None) -> int:
+        with self._lock:
+            if chain is not None:
+                return len(self._idle.get(chain, ()))
+            return sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        self._closed.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            tunnels = [tunnel for idle in self._idle.values() for tunnel in idle]
+            self._idle.clear()
+        for tunnel in tunnels:
+            tunnel.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _refill(self, chain: ProxyChain):
+        with self._lock:
+            if chain not in self._building or self._closed.is_set():
+                return
+            total = sum(len(idle) for idle in self._idle.values()) + sum(self._building.values())
+            missing = self.size - len(self._idle[chain]) - self._building[chain]
+            if self.max_total is not None:
+                missing = min(missing, self.max_total - total)
+            if missing <= 0:
+                return
+            self._building[chain] += missing
+
+        for _ in range(missing):
+            self._executor.submit(self._build, chain)
+
+    def _build(self, chain: ProxyChain):
+        sock = None
+        try:
+            sock = create_tunnel(chain, self.timeout)
+        except Exception:
+            pass  # Will be retried on the next refill
+        finally:
+            with self._lock:
+                self._building[chain] -= 1
+                if sock is not None and not self._closed.is_set():
+                    self._idle[chain].append(_IdleTunnel(sock))
+                    sock = None
+        if sock is not None:
+            sock.close()
+
+    def _maintain(self):
+        while not self._closed.wait(self.probe_interval):
+            now = time.monotonic()
+            dropped = []
+            with self._lock:
+                # Probing is a single non-blocking recv, so it is done under the lock to not race with get()
+                for idle in self._idle.values():
+                    for tunnel in list(idle):
+                        if now - tunnel.idle_since > self.max_idle or not is_alive(tunnel.sock):
+                            idle.remove(tunnel)
+                            dropped.append(tunnel)
+                chains = list(self._idle)
+
+            for tunnel in dropped:
+                tunnel.sock.close()
+            for chain in chains:
+                self._refill(chain)
+
+
+__all__ = ("TunnelPool", "create_tunnel", "is_alive")
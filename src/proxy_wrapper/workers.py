@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import time
+from typing import Callable, Dict, List
+
+from proxy_wrapper.server import ProxyServer
+
+logger = logging.getLogger(__name__)
+
+_RESPAWN_DELAY = 1.0  # Seconds between respawns of a worker which keeps crashing
+_ABORT_DRAIN = 1.0  # Seconds for handlers of aborted connections to finish after grace
+_STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+class _Worker:
+    __slots__ = ("pid", "fd", "generation", "ready", "stats", "buffer", "started", "stopping")
+
+    def __init__(self, pid: int, fd: int, generation: int):
+        self.pid = pid
+        self.fd = fd  # Read end of the stats pipe
+        self.generation = generation
+        self.ready = False  # Listening, set by the first stats report
+        self.stats: Dict[str, int] = {}
+        self.buffer = b''
+        self.started = time.monotonic()
+        self.stopping = False
+
+
+class WorkerPool:
+    """
+    Runs a ProxyServer in workers forked processes. Every worker binds host:port with
+    SO_REUSEPORT, so the kernel spreads clients over workers, and runs its own event loop.
+
+    Workers report their ServerStats to the parent every stats_interval seconds, stats()
+    aggregates them. Counters of exited workers are kept in the totals.
+
+    Signals of the parent process:
+        SIGHUP - graceful restart: new workers are started, old ones stop accepting once the new
+                 ones listen and exit when their clients are finished (at most grace seconds)
+        SIGTERM, SIGINT - graceful stop
+    Crashed workers are replaced.
+
+    Linux only (fork and SO_REUSEPORT load balancing).
+    """
+
+    def __init__(self, server_factory: Callable[[], ProxyServer], host: str, port: int, *,
+                 workers: int | None = None, grace: float = 30.0, stats_interval: float = 1.0,
+                 on_stats: Callable[[dict], None] | None = None):
+        if not hasattr(socket, "SO_REUSEPORT"):
+            raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+        self.server_factory = server_factory
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.grace = grace
+        self.stats_interval = stats_interval
+        self.on_stats = on_stats  # Called with stats() every stats_interval seconds
+
+        self._workers: Dict[int, _Worker] = {}
+        self._retired: Dict[str, int] = {}  # Counters of exited workers
+        self._generation = 0
+        self._stopping = False
+        self._restart_requested = False
+        self._respawn_at: List[float] = []
+        self._selector = selectors.DefaultSelector()
+        self._wakeup: tuple = ()  # socketpair of signal.set_wakeup_fd() while run() runs
+
+    def stats(self) -> dict:
+        total = dict(self._retired)
+        workers = {}
+        for worker in self._workers.values():
+            workers[worker.pid] = dict(worker.stats)
+            for name, value in worker.stats.items():
+                total[name] = total.get(name, 0) + value
+        return {"total": total, "workers": workers}
+
+    def restart(self):
+        self._restart_requested = True
+
+    def stop(self):
+        self._stopping = True
+
+    def run(self):
+        """Starts workers and supervises them until stop() or SIGTERM/SIGINT."""
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        self._wakeup = (wakeup_r, wakeup_w)
+        previous_wakeup = signal.set_wakeup_fd(wakeup_w.fileno())
+        previous_handlers = {signum: signal.signal(signum, handler) for signum, handler in (
+            (signal.SIGHUP, lambda *_: self.restart()),
+            (signal.SIGTERM, lambda *_: self.stop()),
+            (signal.SIGINT, lambda *_: self.stop()),
+            (signal.SIGCHLD, lambda *_: None),
+        )}
+        self._selector.register(wakeup_r, selectors.EVENT_READ, None)
+
+        try:
+            self._spawn_generation()
+            next_report = time.monotonic() + self.stats_interval
+            while not self._stopping or self._workers:
+                for key, _ in self._selector.select(self._wait_time(next_report)):
+                    if key.data is None:
+                        _drain(wakeup_r)
+                    else:
+                        self._read_stats(key.data)
+                self._reap()
+
+                if self._stopping:
+                    self._stop_workers(list(self._workers.values()))
+                    continue
+                if self._restart_requested:
+                    self._restart_requested = False
+                    self._spawn_generation()
+                self._retire_old_generations()
+                self._respawn()
+                if self.on_stats is not None and time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.stats_interval
+                    self.on_stats(self.stats())
+            if self.on_stats is not None:
+                self.on_stats(self.stats())  # With the final reports of the stopped workers
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            signal.set_wakeup_fd(previous_wakeup)
+            self._selector.close()
+            wakeup_r.close()
+            wakeup_w.close()
+            self._wakeup = ()
+
+    def _wait_time(self, next_report: float) -> float:
+        deadlines = [next_report] + self._respawn_at
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _spawn_generation(self):
+        self._generation += 1
+        logger.info("Starting %d workers, generation %d", self.workers, self._generation)
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self):
+        read_fd, write_fd = os.pipe()
+        # Until the worker's loop handles them, stop signals would run the parent's handlers in it
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, _STOP_SIGNALS)
+        try:
+            pid = os.fork()
+        except BaseException:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            os.close(read_fd)
+            os.close(write_fd)
+            raise
+        if pid == 0:
+            code = 1
+            try:
+                signal.set_wakeup_fd(-1)
+                self._selector.close()
+                for sock in self._wakeup:
+                    sock.close()
+                os.close(read_fd)
+                for worker in self._workers.values():
+                    os.close(worker.fd)
+                code = _run_worker(self.server_factory(), self.host, self.port, write_fd,
+                                   self.grace, self.stats_interval)
+            finally:
+                os._exit(code)
+
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        worker = _Worker(pid, read_fd, self._generation)
+        self._workers[pid] = worker
+        self._selector.register(read_fd, selectors.EVENT_READ, worker)
+
+    def _read_stats(self, worker: _Worker):
+        try:
+            data = os.read(worker.fd, 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            self._unregister(worker)
+            return
+        *lines, worker.buffer = (worker.buffer + data).split(b"\n")
+        if lines:
+            worker.stats = json.loads(lines[-1])
+            worker.ready = True
+
+    def _unregister(self, worker: _Worker):
+        try:
+            self._selector.unregister(worker.fd)
+        except KeyError:
+            pass
+
+    def _retire_old_generations(self):
+        current = [w for w in self._workers.values() if w.generation == self._generation]
+        if not all(worker.ready for worker in current):
+            return
+        self._stop_workers([w for w in self._workers.values() if w.generation != self._generation])
+
+    def _stop_workers(self, workers: List[_Worker]):
+        for worker in workers:
+            if not worker.stopping:
+                worker.stopping = True
+                _kill(worker.pid, signal.SIGTERM)
+
+    def _reap(self):
+        while self._workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            self._read_stats(worker)
+            for name, value in worker.stats.items():
+                if name != "active":
+                    self._retired[name] = self._retired.get(name, 0) + value
+            self._unregister(worker)
+            os.close(worker.fd)
+
+            if not worker.stopping and not self._stopping and worker.generation == self._generation:
+                logger.warning("Worker %d exited with status %d, replacing it", pid, os.waitstatus_to_exitcode(status))
+                crashed_early = time.monotonic() - worker.started < _RESPAWN_DELAY
+                self._respawn_at.append(time.monotonic() + (_RESPAWN_DELAY if crashed_early else 0))
+
+    def _respawn(self):
+        now = time.monotonic()
+        due = [at for at in self._respawn_at if at <= now]
+        self._respawn_at = [at for at in self._respawn_at if at > now]
+        for _ in due:
+            self._spawn()
+
+
+def _run_worker(server: ProxyServer, host: str, port: int, stats_fd: int, grace: float, interval: float) -> int:
+    """Runs in the forked process with SIGTERM and SIGINT blocked, they stay pending until the loop handles them."""
+    for signum in (signal.SIGHUP, signal.SIGCHLD, signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    os.set_blocking(stats_fd, False)
+
+    def report():
+        try:
+            os.write(stats_fd, json.dumps(server.stats.as_dict()).encode() + b"\n")
+        except BlockingIOError:
+            pass  # Parent is busy, the next report will do
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        # Ctrl-C reaches the whole process group, workers stop gracefully like on SIGTERM
+        for signum in _STOP_SIGNALS:
+            loop.add_signal_handler(signum, stop.set)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, _STOP_SIGNALS)
+        listener = await server.start(host, port, reuse_port=True)
+        report()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            report()
+
+        # Not listener.wait_closed(), it waits for every client since Python 3.12 and grace would not apply
+        listener.close()
+        if not await server.drain(grace):
+            # Handlers would be cancelled by asyncio.run(), connections closed under them end them cleanly
+            server.abort()
+            await server.drain(_ABORT_DRAIN)
+        report()
+
+    asyncio.run(main())
+    return 0
+
+
+def _kill(pid: int, signum: int):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def _drain(sock: socket.socket):
+    try:
+        while sock.recv(4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+__all__ = ("WorkerPool",)
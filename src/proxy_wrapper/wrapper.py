@@ -4,11 +4,16 @@ from typing import Sequence
 
 from proxy_wrapper.exceptions import CannotWrapSocket
 from proxy_wrapper.base import BaseProxiedSocket
+from proxy_wrapper.chain import ProxyChain
 from proxy_wrapper.proxied_socket import ProxiedSocket
 from proxy_wrapper.utils import parse_proxy_string
 
 
-def wrap_socket(sock: socket.socket, *proxy_strings: str, perform_connection: bool | None = None):
+def wrap_socket(sock: socket.socket, *proxy_strings: str | ProxyChain, perform_connection: bool | None = None):
+    """
+    Wraps not connected sock to ProxiedSocket with proxies from proxy_strings.
+    Pass a ProxyChain instead of strings to skip parsing and handshake encoding on every call.
+    """
     if not isinstance(sock, BaseProxiedSocket) and isinstance(sock, socket.socket):
         try:
             sock.getpeername()
@@ -18,7 +23,10 @@ def wrap_socket(sock: socket.socket, *proxy_strings: str, perform_connection: bo
                 raise e
     proxied = sock if isinstance(sock, ProxiedSocket) else ProxiedSocket.from_socket(sock)
     for proxy_string in proxy_strings:
-        proxied.add_proxy(parse_proxy_string(proxy_string))
+        if isinstance(proxy_string, ProxyChain):
+            proxied.add_chain(proxy_string)
+        else:
+            proxied.add_proxy(parse_proxy_string(proxy_string))
 
     if proxied.getblocking() and perform_connection is True:
         proxied.perform_connection()